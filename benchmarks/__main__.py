@@ -0,0 +1,244 @@
+"""
+Benchmark runner.
+
+    python -m benchmarks run --backends flat_file mongodb --messages 10 1000 --output results.json
+    python -m benchmarks run --mongomock --baseline baseline.json
+    python -m benchmarks compare baseline.json results.json
+    python -m benchmarks run --scenarios append --backends flat_file --profile profiles/
+    python -m benchmarks load --backend mongodb --runner asyncio --users 200 --duration 30
+    python -m benchmarks scale --backends flat_file mongodb mongodb_bucketed --time-budget 120
+
+run exits with status 1 if --baseline is given and a scenario regressed;
+compare does the same for two saved result files, and load if any
+acknowledged write went missing. --mongomock runs the
+MongoDB backends in-process and needs the mongomock package; the timings then
+measure the managers' own overhead, not a server's, and mongodb_bucketed is
+skipped (see MONGOMOCK_UNSUPPORTED). --profile writes a
+cProfile file (for snakeviz or pstats) and folded stacks (for flamegraph.pl or
+speedscope) per scenario and reports allocations and time per phase; profiled
+latencies are inflated and can't be compared with a baseline.
+"""
+import sys
+import argparse
+from typing import Dict, List
+from benchmarks.backends import BACKENDS, DEFAULT_MONGO_URI, MONGOMOCK_URI, mongomock_unsupported
+from benchmarks.harness import compare, load_results, run_all, scenario_key, write_results
+from benchmarks.load import DEFAULT_MIX, OPERATIONS, RUNNERS, run_load
+from benchmarks.profiling import Profiler, format_profile
+from benchmarks.scaling import MAX_DOCUMENT_BYTES, run_scaling
+from benchmarks.scenarios import SCENARIOS, build_matrix
+
+
+def print_result(result: Dict) -> None:
+    key = scenario_key(result["name"], result["params"])
+    if "error" in result:
+        print(f"{key:<66} ERROR {result['error']}")
+        return
+    latency = result["latency_ms"]
+    print(f"{key:<66} p50 {latency['p50']:9.3f}ms  p95 {latency['p95']:9.3f}ms  "
+          f"p99 {latency['p99']:9.3f}ms  {result['throughput']:10.1f} ops/s")
+    if "profile" in result:
+        print("\n".join(format_profile(result["profile"])))
+
+
+def supported_backends(backends: List[str], mongo_uri: str) -> List[str]:
+    """
+    Drops the backends that cannot run against mongo_uri, saying why.
+    """
+    unsupported = mongomock_unsupported(backends, mongo_uri)
+    for backend, reason in unsupported.items():
+        print(f"Skipping {backend} with --mongomock: {reason}")
+    return [backend for backend in backends if backend not in unsupported]
+
+
+def print_comparison(comparisons: List[Dict]) -> int:
+    """
+    Prints the comparison and returns the number of regressions.
+    """
+    for comparison in comparisons:
+        print(f"{comparison['key']:<66} {comparison['baseline_p50_ms']:9.3f}ms -> "
+              f"{comparison['current_p50_ms']:9.3f}ms  {comparison['change']:+7.1%}  {comparison['status']}")
+    regressions = sum(comparison["status"] == "regression" for comparison in comparisons)
+    print(f"\n{regressions} regression(s) in {len(comparisons)} compared scenario(s)")
+    return regressions
+
+
+def print_load_report(report: Dict) -> None:
+    for window in report["timeline"]:
+        p50 = f"{window['p50_ms']:9.3f}ms" if window["p50_ms"] is not None else f"{'-':>11}"
+        p99 = f"{window['p99_ms']:9.3f}ms" if window["p99_ms"] is not None else f"{'-':>11}"
+        print(f"t={window['start']:7.1f}s  {window['throughput']:10.1f} ops/s  p50 {p50}  p99 {p99}  "
+              f"errors {window['errors']}")
+    print()
+    for operation, stats in report["by_operation"].items():
+        latency = stats["latency_ms"]
+        percentiles = (f"p50 {latency['p50']:9.3f}ms  p95 {latency['p95']:9.3f}ms  p99 {latency['p99']:9.3f}ms"
+                       if latency else "no successful operations")
+        print(f"{operation:<8} {stats['count']:8d} ops  {stats['throughput']:10.1f} ops/s  {percentiles}  "
+              f"errors {stats['errors']}")
+    print(f"\nSustained throughput: {report['throughput']:.1f} ops/s over {report['duration']:.1f}s")
+    if report["errors"]:
+        print(f"Errors: {report['errors']}")
+    print(f"Lost writes: {report['lost_writes']} of {report['appends_acknowledged']} acknowledged appends")
+
+
+def print_scaling_report(report: Dict) -> None:
+    print(f"\n{report['backend']}")
+    print(f"{'messages':>10} {'append':>11} {'append p95':>11} {'read':>11} {'recent':>11} "
+          f"{'storage':>11} {'largest':>11} {'B/msg':>7} {'RSS':>9}")
+    for step in report["steps"]:
+        rss = f"{step['rss_bytes'] / 2 ** 20:7.1f}MB" if step["rss_bytes"] is not None else f"{'-':>9}"
+        print(f"{step['messages']:10d} {step['append_ms']:9.3f}ms {step['append_p95_ms']:9.3f}ms "
+              f"{step['read_ms']:9.3f}ms {step['read_recent_ms']:9.3f}ms "
+              f"{step['storage_bytes'] / 2 ** 20:9.2f}MB {(step['largest_document_bytes'] or 0) / 2 ** 20:9.2f}MB "
+              f"{step['bytes_per_message']:7.0f} {rss}")
+    print(f"Stopped: {report['stopped']}")
+    for operation, fit in report["fits"].items():
+        if fit is None:
+            print(f"  {operation:<12} too few steps to fit")
+        else:
+            print(f"  {operation:<12} {fit['complexity']:<10} (latency ~ n^{fit['exponent']:.2f}, "
+                  f"R^2 {fit['r_squared']:.2f})")
+
+
+def parse_mix(entries: List[str]) -> Dict[str, float]:
+    """
+    Parses ["read=6", "append=3", ...] into operation weights.
+    """
+    mix = {}
+    for entry in entries:
+        operation, _, weight = entry.partition("=")
+        if operation not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation in --mix: {operation}")
+        mix[operation] = float(weight)
+    return mix
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the storage managers")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run scenarios and optionally compare with a baseline")
+    run.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    run.add_argument("--backends", nargs="+", choices=BACKENDS, default=["flat_file", "mongodb"])
+    run.add_argument("--messages", nargs="+", type=int, default=[10, 1000],
+                     help="Messages per thread (default: 10 1000)")
+    run.add_argument("--payloads", nargs="+", type=int, default=[200],
+                     help="Characters of content per message (default: 200)")
+    run.add_argument("--operations", type=int, default=50, help="Timed operations per trial (default: 50)")
+    run.add_argument("--warmup", type=int, default=2, help="Discarded trials per scenario (default: 2)")
+    run.add_argument("--trials", type=int, default=10, help="Timed trials per scenario (default: 10)")
+    run.add_argument("--mongo-uri", default=DEFAULT_MONGO_URI)
+    run.add_argument("--mongomock", action="store_true",
+                     help="Run the MongoDB backends against an in-process mongomock stand-in")
+    run.add_argument("--output", help="Write the results as JSON to this file")
+    run.add_argument("--baseline", help="Compare with the results in this file")
+    run.add_argument("--threshold", type=float, default=0.10,
+                     help="Relative median slowdown that counts as a regression (default: 0.10)")
+    run.add_argument("--profile", metavar="DIR", help="Profile every scenario and write the profiles to DIR")
+    run.add_argument("--profile-top", type=int, default=10,
+                     help="Functions and allocation sites kept per profile (default: 10)")
+
+    check = commands.add_parser("compare", help="Compare two saved result files")
+    check.add_argument("baseline")
+    check.add_argument("current")
+    check.add_argument("--threshold", type=float, default=0.10)
+
+    load = commands.add_parser("load", help="Simulate concurrent users on shared threads")
+    load.add_argument("--backend", choices=BACKENDS, default="mongodb")
+    load.add_argument("--runner", choices=RUNNERS, default="threads")
+    load.add_argument("--users", type=int, default=10, help="Concurrent users (default: 10)")
+    load.add_argument("--threads", type=int, default=100, help="Conversation threads they share (default: 100)")
+    load.add_argument("--duration", type=float, default=10.0, help="Seconds to run (default: 10)")
+    load.add_argument("--mix", nargs="+", default=[f"{operation}={weight}" for operation, weight in DEFAULT_MIX.items()],
+                      help="Operation weights, e.g. read=6 append=3 list=1")
+    load.add_argument("--think-time", type=float, default=0.0, help="Mean seconds between a user's operations")
+    load.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of thread popularity (0 is uniform)")
+    load.add_argument("--payload", type=int, default=200, help="Characters per appended message")
+    load.add_argument("--interval", type=float, default=1.0, help="Seconds per timeline window")
+    load.add_argument("--seed", type=int, default=0)
+    load.add_argument("--pool-size", type=int, default=100, help="Connection pool size of the asyncio runner")
+    load.add_argument("--mongo-uri", default=DEFAULT_MONGO_URI,
+                      help="Add maxPoolSize=N to study pool saturation with the threads and processes runners")
+    load.add_argument("--mongomock", action="store_true",
+                      help="Run the MongoDB backends against an in-process mongomock stand-in (threads runner only)")
+    load.add_argument("--output", help="Write the report as JSON to this file")
+
+    scale = commands.add_parser("scale", help="Grow a conversation geometrically and fit complexity curves")
+    scale.add_argument("--backends", nargs="+", choices=BACKENDS, default=["flat_file", "mongodb"])
+    scale.add_argument("--start", type=int, default=100, help="Messages in the first step (default: 100)")
+    scale.add_argument("--factor", type=float, default=2.0, help="Growth factor between steps (default: 2)")
+    scale.add_argument("--max-messages", type=int, default=1_000_000)
+    scale.add_argument("--time-budget", type=float, default=60.0, help="Seconds per backend (default: 60)")
+    scale.add_argument("--size-budget-mb", type=float, default=MAX_DOCUMENT_BYTES / 2 ** 20,
+                       help="Stop once a document or file exceeds this size (default: 16)")
+    scale.add_argument("--payload", type=int, default=200, help="Characters of content per message")
+    scale.add_argument("--samples", type=int, default=20, help="Operations timed per step (default: 20)")
+    scale.add_argument("--mongo-uri", default=DEFAULT_MONGO_URI)
+    scale.add_argument("--mongomock", action="store_true",
+                       help="Run the MongoDB backends against an in-process mongomock stand-in")
+    scale.add_argument("--output", help="Write the reports as JSON to this file")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        try:
+            comparisons = compare(load_results(args.baseline), load_results(args.current), args.threshold)
+        except ValueError as e:
+            parser.error(str(e))
+        return 1 if print_comparison(comparisons) else 0
+
+    mongo_uri = MONGOMOCK_URI if args.mongomock else args.mongo_uri
+
+    if args.command == "scale":
+        reports = []
+        for backend in supported_backends(args.backends, mongo_uri):
+            try:
+                report = run_scaling(backend, args.start, args.factor, args.max_messages, args.time_budget,
+                                     int(args.size_budget_mb * 2 ** 20), args.payload, args.samples,
+                                     mongo_uri=mongo_uri)
+            except ValueError as e:
+                parser.error(str(e))
+            print_scaling_report(report)
+            reports.append(report)
+        if args.output:
+            write_results({"reports": reports}, args.output)
+            print(f"\nReports written to {args.output}")
+        return 0
+
+    if args.command == "load":
+        for backend, reason in mongomock_unsupported([args.backend], mongo_uri).items():
+            parser.error(f"{backend} cannot run with --mongomock: {reason}")
+        try:
+            mix = parse_mix(args.mix)
+            report = run_load(args.backend, args.runner, args.users, args.threads, args.duration, mix,
+                              args.think_time, args.skew, args.payload, interval=args.interval, seed=args.seed,
+                              mongo_uri=mongo_uri,
+                              pool_size=args.pool_size)
+        except (ValueError, argparse.ArgumentTypeError) as e:
+            parser.error(str(e))
+        print_load_report(report)
+        if args.output:
+            write_results(report, args.output)
+            print(f"\nReport written to {args.output}")
+        return 1 if report["lost_writes"] else 0
+
+    if args.trials < 1 or args.operations < 1 or args.warmup < 0:
+        parser.error("--trials and --operations must be at least 1 and --warmup at least 0")
+    if args.profile and args.baseline:
+        parser.error("--profile slows every operation down and can't be combined with --baseline")
+    profiler = Profiler(args.profile, args.profile_top) if args.profile else None
+    scenarios = build_matrix(args.scenarios, supported_backends(args.backends, mongo_uri), args.messages, args.payloads, args.operations, mongo_uri)
+    results = run_all(scenarios, args.warmup, args.trials, progress=print_result, profiler=profiler)
+    results["meta"]["mongo"] = "mongomock" if args.mongomock else args.mongo_uri
+    if args.output:
+        write_results(results, args.output)
+        print(f"\nResults written to {args.output}")
+    if args.baseline:
+        print()
+        return 1 if print_comparison(compare(load_results(args.baseline), results, args.threshold)) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import os
+import abc
+import shutil
+import tempfile
+from typing import Dict, List, Optional
+from db_wrappers.flat_file_manager import FlatFileManager
+from db_wrappers.mongodb_manager import MongoDBManager
+from db_wrappers.segment_store import parse_locators
+
+# A short server selection timeout, so a missing mongod fails a scenario quickly
+DEFAULT_MONGO_URI = "mongodb://localhost:27017/?serverSelectionTimeoutMS=2000"
+# Connection string recorded for the in-process stand-in (also keeps its index
+# verification separate from a real server's)
+MONGOMOCK_URI = "mongomock://"
+BENCHMARK_DATABASE = "chai_benchmark"
+BENCHMARK_USER = "bench_user"
+# Threads per page returned by Backend.list(), as in the CLI's thread picker
+LIST_LIMIT = 10
+
+BACKENDS = ("flat_file", "flat_file_segments", "mongodb", "mongodb_bucketed")
+
+# Backends the mongomock stand-in cannot run, with the reason. Bucketed appends
+# (like write-behind flushes) go through bulk_write, and mongomock's bulk_write
+# rejects the sort argument recent pymongo versions pass for every UpdateOne.
+MONGOMOCK_UNSUPPORTED = {
+    "mongodb_bucketed": "mongomock's bulk_write rejects UpdateOne(sort=...), which bucketed appends send",
+}
+
+
+class Backend(abc.ABC):
+    """
+    Gives the benchmarks one interface over both managers: conversations are
+    addressed by thread name and belong to BENCHMARK_USER. location names the
+    storage (a directory or a database) for other processes to attach to.
+    """
+
+    location: str
+
+    @abc.abstractmethod
+    def save(self, thread_name: str, messages: List[Dict]) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def append(self, thread_name: str, message: Dict) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def read(self, thread_name: str, limit: Optional[int] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def list(self) -> List[str]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def storage_size(self, thread_name: str) -> Dict[str, Optional[int]]:
+        """
+        Returns storage_bytes (everything the backend stores for the thread, or
+        the whole store if threads share files) and largest_document_bytes (the
+        largest single file, record or document the thread occupies).
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        raise NotImplementedError
+
+
+class FlatFileBackend(Backend):
+    """
+    A FlatFileManager in a new temporary directory that is removed on
+    close(), or attached to an existing one that is left in place.
+    """
+
+    def __init__(self, storage_dir: Optional[str] = None, **options):
+        self.owns_storage = storage_dir is None
+        self.location = tempfile.mkdtemp(prefix="chai_benchmark_") if self.owns_storage else storage_dir
+        self.manager = FlatFileManager(storage_dir=self.location, **options)
+
+    def _conversation_id(self, thread_name: str) -> str:
+        return f"{BENCHMARK_USER}_{thread_name}"
+
+    def save(self, thread_name: str, messages: List[Dict]) -> None:
+        conversation_id = self._conversation_id(thread_name)
+        self.manager.save_conversation(conversation_id, f"{conversation_id}.jsonl", messages)
+
+    def append(self, thread_name: str, message: Dict) -> None:
+        self.manager.append_message(self._conversation_id(thread_name), message)
+
+    def read(self, thread_name: str, limit: Optional[int] = None) -> List[Dict]:
+        return self.manager.get_conversation(self._conversation_id(thread_name), limit=limit)
+
+    def list(self) -> List[str]:
+        # FlatFileManager has no listing API; scan its index the way a listing would
+        prefix = self._conversation_id("")
+        with self.manager._lock:
+            self.manager._refresh_index()
+            threads = [conversation_id[len(prefix):] for conversation_id in self.manager.conversations_index
+                       if conversation_id.startswith(prefix)]
+        return threads[:LIST_LIMIT]
+
+    def storage_size(self, thread_name: str) -> Dict[str, Optional[int]]:
+        with self.manager._lock:
+            self.manager._refresh_index()
+            relative_filepath = self.manager.conversations_index.get(self._conversation_id(thread_name))
+        if relative_filepath is None:
+            return {"storage_bytes": 0, "largest_document_bytes": 0}
+        locations = parse_locators(relative_filepath)
+        if locations is None:
+            size = os.path.getsize(os.path.join(self.location, relative_filepath))
+            return {"storage_bytes": size, "largest_document_bytes": size}
+        # Segment files are shared by every conversation (and hold superseded records until compaction)
+        segments = sum(os.path.getsize(os.path.join(root, name))
+                       for root, _, names in os.walk(self.location) for name in names)
+        return {"storage_bytes": segments, "largest_document_bytes": sum(length for _, _, length in locations)}
+
+    def close(self) -> None:
+        self.manager.close()
+        if self.owns_storage:
+            shutil.rmtree(self.location, ignore_errors=True)
+
+
+class MongoDBBackend(Backend):
+    """
+    A MongoDBManager on the benchmark database, wiped on open and close, or
+    attached to an existing database that is left as it is.
+    """
+
+    def __init__(self, mongo_uri: str, database_name: Optional[str] = None, **options):
+        self.wipe = database_name is None
+        self.location = database_name or BENCHMARK_DATABASE
+        self.manager = MongoDBManager(connection_string=mongo_uri, database_name=self.location, **options)
+        if mongo_uri == MONGOMOCK_URI:
+            # The manager connects lazily, so the stand-in client can be swapped in before first use
+            self.manager._client = mongomock_client()
+        if self.wipe:
+            self.manager._wipe_database()
+
+    def save(self, thread_name: str, messages: List[Dict]) -> None:
+        self.manager.save_conversation(BENCHMARK_USER, thread_name, messages)
+
+    def append(self, thread_name: str, message: Dict) -> None:
+        self.manager.append_message(BENCHMARK_USER, thread_name, message)
+
+    def read(self, thread_name: str, limit: Optional[int] = None) -> List[Dict]:
+        return self.manager.get_conversation(BENCHMARK_USER, thread_name, limit=limit)
+
+    def list(self) -> List[str]:
+        threads, _ = self.manager.list_threads(BENCHMARK_USER, limit=LIST_LIMIT)
+        return [thread["thread_name"] for thread in threads]
+
+    def storage_size(self, thread_name: str) -> Dict[str, Optional[int]]:
+        conversation_id = f"{BENCHMARK_USER}_{thread_name}"
+        sources = [(self.manager.conversations, {"_id": conversation_id})]
+        if self.manager.storage_layout == "bucketed":
+            sources.append((self.manager.message_buckets, {"conversation_id": conversation_id}))
+        sizes = []
+        for collection, query in sources:
+            try:
+                # $bsonSize (MongoDB 4.4+) measures documents without transferring them
+                sizes += [document["size"] for document in collection.aggregate(
+                    [{"$match": query}, {"$project": {"size": {"$bsonSize": "$$ROOT"}}}])]
+            except Exception:
+                # Older servers and the in-process stand-in lack $bsonSize; measure on the client
+                import bson
+                sizes += [len(bson.encode(document)) for document in collection.find(query)]
+        return {"storage_bytes": sum(sizes), "largest_document_bytes": max(sizes, default=0)}
+
+    def close(self) -> None:
+        if self.wipe:
+            self.manager._wipe_database()
+        self.manager.close()
+
+
+_mongomock_client = None
+
+
+def mongomock_client():
+    """
+    Returns the process-wide mongomock client used as an in-process stand-in
+    for mongod. mongomock is optional and only imported here.
+    """
+    global _mongomock_client
+    if _mongomock_client is None:
+        try:
+            import mongomock
+        except ImportError:
+            raise RuntimeError("The in-process MongoDB stand-in needs mongomock (pip install mongomock)")
+        _mongomock_client = mongomock.MongoClient()
+    return _mongomock_client
+
+
+def mongomock_unsupported(backends: List[str], mongo_uri: str) -> Dict[str, str]:
+    """
+    Returns the backends among backends that cannot run against mongo_uri,
+    mapped to the reason: those in MONGOMOCK_UNSUPPORTED when mongo_uri is
+    MONGOMOCK_URI, and none otherwise.
+    """
+    if mongo_uri != MONGOMOCK_URI:
+        return {}
+    return {backend: MONGOMOCK_UNSUPPORTED[backend] for backend in backends if backend in MONGOMOCK_UNSUPPORTED}
+
+
+def open_backend(name: str, mongo_uri: str = DEFAULT_MONGO_URI, multiprocess: bool = False,
+                 attach_to: Optional[str] = None) -> Backend:
+    """
+    Opens a fresh, empty backend, or attaches to one another process opened.
+
+    Args:
+        name (str): One of BACKENDS
+        mongo_uri (str): Connection string for the MongoDB backends, or
+            MONGOMOCK_URI for the in-process stand-in
+        multiprocess (bool): If True, open the flat file backends in
+            multiprocess mode so other processes can attach to them
+        attach_to (Optional[str]): The location of a backend opened elsewhere,
+            to share its storage instead of starting empty
+
+    Returns:
+        Backend: The opened backend; close() it when done
+    """
+    multiprocess = multiprocess or attach_to is not None
+    if name == "flat_file":
+        return FlatFileBackend(attach_to, multiprocess=multiprocess)
+    if name == "flat_file_segments":
+        return FlatFileBackend(attach_to, multiprocess=multiprocess, storage_mode="segments")
+    if name == "mongodb":
+        return MongoDBBackend(mongo_uri, attach_to)
+    if name == "mongodb_bucketed":
+        return MongoDBBackend(mongo_uri, attach_to, storage_layout="bucketed")
+    raise ValueError(f"Unknown backend: {name}")
@@ -0,0 +1,242 @@
+import gc
+import json
+import math
+import time
+import platform
+from datetime import datetime, UTC
+from typing import Callable, Dict, List, Optional
+
+# Percentiles reported for every scenario
+PERCENTILES = (50, 95, 99)
+
+
+class Scenario:
+    """
+    One benchmarked operation with fixed parameters.
+
+    Every trial calls setup() for fresh state, times operations calls of
+    operation(state, i) one by one, then calls teardown(state). Only the
+    operation calls are timed.
+    """
+
+    def __init__(self, name: str, params: Dict, setup: Callable[[], any], operation: Callable[[any, int], None],
+                 teardown: Optional[Callable[[any], None]] = None, operations: int = 100):
+        """
+        Args:
+            name (str): Scenario name, e.g. "append"
+            params (Dict): Parameters identifying this variant, e.g. backend and
+                message count; stored with the results and used to match baselines
+            setup (Callable[[], any]): Builds the state for one trial
+            operation (Callable[[any, int], None]): The timed operation, called
+                with the trial state and the operation number
+            teardown (Optional[Callable[[any], None]]): Releases the trial state
+            operations (int): Timed operations per trial
+        """
+        self.name = name
+        self.params = params
+        self.setup = setup
+        self.operation = operation
+        self.teardown = teardown
+        self.operations = operations
+
+    @property
+    def key(self) -> str:
+        return scenario_key(self.name, self.params)
+
+
+def scenario_key(name: str, params: Dict) -> str:
+    """
+    Returns a stable identifier for a scenario variant, e.g. "append[backend=mongodb,messages=100]".
+    """
+    return f"{name}[{','.join(f'{key}={params[key]}' for key in sorted(params))}]"
+
+
+def percentile(sorted_samples: List[float], percent: float) -> float:
+    """
+    Returns the percent-th percentile of sorted_samples, interpolating linearly
+    between the closest ranks.
+    """
+    if not sorted_samples:
+        return math.nan
+    rank = (len(sorted_samples) - 1) * percent / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(sorted_samples) - 1)
+    return sorted_samples[low] + (sorted_samples[high] - sorted_samples[low]) * (rank - low)
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """
+    Summarizes latencies in seconds as milliseconds: mean, stdev, min, max and PERCENTILES.
+    """
+    ordered = sorted(latencies)
+    mean = sum(ordered) / len(ordered)
+    variance = sum((latency - mean) ** 2 for latency in ordered) / max(1, len(ordered) - 1)
+    summary = {"mean": mean * 1000, "stdev": math.sqrt(variance) * 1000,
+               "min": ordered[0] * 1000, "max": ordered[-1] * 1000}
+    for percent in PERCENTILES:
+        summary[f"p{percent}"] = percentile(ordered, percent) * 1000
+    return summary
+
+
+def run_scenario(scenario: Scenario, warmup: int = 2, trials: int = 10, profiler=None) -> Dict:
+    """
+    Runs warmup untimed trials, then trials timed ones. The garbage collector
+    is paused while operations are timed, as timeit does, so collections
+    triggered by earlier allocations don't land on random samples.
+
+    Args:
+        scenario (Scenario): What to run
+        warmup (int): Trials run first and discarded (imports, caches, connection pools)
+        trials (int): Trials whose samples are kept
+        profiler (Optional[benchmarks.profiling.Profiler]): If set, profile the
+            timed operations of the kept trials
+
+    Returns:
+        Dict: name, params, latency_ms (summary of every timed operation),
+        trial_p50_ms (each trial's median, to judge run-to-run noise),
+        throughput (median operations per second across trials) and, when
+        profiled, profile; or name, params and error if the scenario raised
+    """
+    latencies = []
+    trial_medians = []
+    throughputs = []
+    session = profiler.session(scenario.key) if profiler is not None else None
+    try:
+        for trial in range(warmup + trials):
+            state = scenario.setup()
+            trial_latencies = []
+            profiled = session is not None and trial >= warmup
+            gc.collect()
+            gc_was_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                if profiled:
+                    session.start()
+                started = time.perf_counter()
+                for i in range(scenario.operations):
+                    start = time.perf_counter()
+                    scenario.operation(state, i)
+                    trial_latencies.append(time.perf_counter() - start)
+                elapsed = time.perf_counter() - started
+            finally:
+                if profiled:
+                    session.stop()
+                if gc_was_enabled:
+                    gc.enable()
+                if scenario.teardown is not None:
+                    scenario.teardown(state)
+            if trial >= warmup:
+                latencies += trial_latencies
+                trial_medians.append(percentile(sorted(trial_latencies), 50) * 1000)
+                throughputs.append(scenario.operations / elapsed)
+    except Exception as e:
+        return {"name": scenario.name, "params": scenario.params, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        if session is not None:
+            session.close()
+
+    result = {
+        "name": scenario.name,
+        "params": scenario.params,
+        "operations": scenario.operations,
+        "trials": trials,
+        "latency_ms": summarize(latencies),
+        "trial_p50_ms": trial_medians,
+        "throughput": percentile(sorted(throughputs), 50),
+    }
+    if session is not None:
+        result["profile"] = session.finish(len(latencies), result["latency_ms"]["mean"])
+    return result
+
+
+def run_all(scenarios: List[Scenario], warmup: int = 2, trials: int = 10,
+            progress: Optional[Callable[[Dict], None]] = None, profiler=None) -> Dict:
+    """
+    Runs every scenario and returns a results document for write_results().
+
+    Args:
+        scenarios (List[Scenario]): Scenarios to run, in order
+        warmup (int): Warmup trials per scenario
+        trials (int): Timed trials per scenario
+        progress (Optional[Callable[[Dict], None]]): Called with each result as it completes
+        profiler (Optional[benchmarks.profiling.Profiler]): If set, profile every scenario
+
+    Returns:
+        Dict: {"meta": {...}, "results": [...]}
+    """
+    results = []
+    for scenario in scenarios:
+        result = run_scenario(scenario, warmup, trials, profiler)
+        results.append(result)
+        if progress is not None:
+            progress(result)
+    return {
+        "meta": {
+            "created_at": datetime.now(UTC).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "warmup": warmup,
+            "trials": trials,
+            "profiled": profiler is not None,
+        },
+        "results": results,
+    }
+
+
+def write_results(results: Dict, path: str) -> None:
+    """
+    Writes a results document as JSON.
+    """
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(path: str) -> Dict:
+    """
+    Reads a results document written by write_results().
+    """
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.10) -> List[Dict]:
+    """
+    Compares the median latency of every scenario present in both results.
+
+    A scenario regressed when its median is more than threshold slower than
+    the baseline's and the runs don't overlap: even the fastest current trial
+    median is slower than the slowest baseline trial median. Requiring both
+    keeps ordinary run-to-run noise from being flagged. Improvements are
+    detected the same way in the other direction.
+
+    Args:
+        baseline (Dict): Results document to compare against
+        current (Dict): Results document being checked
+        threshold (float): Relative change in median latency that counts, e.g. 0.10 for 10%
+
+    Returns:
+        List[Dict]: One entry per common scenario with key, baseline_p50_ms,
+        current_p50_ms, change (relative) and status ("regression",
+        "improvement" or "unchanged"), worst change first
+    """
+    if baseline["meta"].get("profiled") or current["meta"].get("profiled"):
+        raise ValueError("Profiled runs are slowed down by the profilers and can't be compared")
+    previous = {scenario_key(result["name"], result["params"]): result
+                for result in baseline["results"] if "error" not in result}
+    comparisons = []
+    for result in current["results"]:
+        key = scenario_key(result["name"], result["params"])
+        if "error" in result or key not in previous:
+            continue
+        before, after = previous[key], result
+        before_p50, after_p50 = before["latency_ms"]["p50"], after["latency_ms"]["p50"]
+        change = after_p50 / before_p50 - 1 if before_p50 else 0.0
+        status = "unchanged"
+        if change > threshold and min(after["trial_p50_ms"]) > max(before["trial_p50_ms"]):
+            status = "regression"
+        elif change < -threshold and max(after["trial_p50_ms"]) < min(before["trial_p50_ms"]):
+            status = "improvement"
+        comparisons.append({"key": key, "baseline_p50_ms": before_p50, "current_p50_ms": after_p50,
+                            "change": change, "status": status})
+    comparisons.sort(key=lambda comparison: comparison["change"], reverse=True)
+    return comparisons
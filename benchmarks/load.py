@@ -0,0 +1,351 @@
+import time
+import random
+import asyncio
+import threading
+import multiprocessing
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+from benchmarks.backends import BENCHMARK_DATABASE, BENCHMARK_USER, DEFAULT_MONGO_URI, MONGOMOCK_URI, open_backend
+from benchmarks.harness import percentile, summarize
+from benchmarks.scenarios import RECENT_LIMIT, make_messages
+
+RUNNERS = ("threads", "processes", "asyncio")
+OPERATIONS = ("read", "append", "list")
+DEFAULT_MIX = {"read": 0.6, "append": 0.3, "list": 0.1}
+
+
+def zipf_cumulative_weights(count: int, skew: float) -> List[float]:
+    """
+    Returns cumulative weights for ranks 1..count with P(rank) proportional to
+    1 / rank ** skew. A skew of 0 is uniform; around 1 a few threads take most of the traffic.
+    """
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+class UserSimulator:
+    """
+    Decides what one simulated user does next: which operation (drawn from
+    the mix), on which thread (drawn from a Zipf distribution over the shared
+    threads, so low-numbered threads are hot) and how long to think afterwards
+    (exponentially distributed around think_time).
+
+    Every appended message starts with a marker unique to the user and the
+    append, so lost writes can be found afterwards.
+    """
+
+    def __init__(self, user_number: int, config: Dict):
+        self.user_number = user_number
+        self.rng = random.Random(config["seed"] * 1_000_003 + user_number)
+        self.operations = list(config["mix"])
+        self.operation_weights = list(accumulate(config["mix"].values()))
+        self.thread_weights = zipf_cumulative_weights(config["threads"], config["skew"])
+        self.think_time = config["think_time"]
+        self.padding = "x" * max(0, config["payload"] - 16)
+        self.appends = 0
+
+    def next_operation(self) -> Tuple[str, str, Optional[Dict]]:
+        """
+        Returns (operation, thread name, message to append or None).
+        """
+        operation = self.rng.choices(self.operations, cum_weights=self.operation_weights)[0]
+        thread_name = f"thread_{self.rng.choices(range(len(self.thread_weights)), cum_weights=self.thread_weights)[0]}"
+        message = None
+        if operation == "append":
+            self.appends += 1
+            message = {"role": "user", "content": f"u{self.user_number}:{self.appends} {self.padding}"}
+        return operation, thread_name, message
+
+    def pause(self) -> float:
+        """
+        Returns the think time before the user's next operation.
+        """
+        return self.rng.expovariate(1 / self.think_time) if self.think_time > 0 else 0.0
+
+
+def message_marker(message: Dict) -> str:
+    """
+    Returns the marker UserSimulator put at the start of an appended message.
+    """
+    content = message.get("content")
+    return content.split(" ", 1)[0] if isinstance(content, str) else ""
+
+
+class UserLog:
+    """
+    What one simulated user did: (offset from the start of the run, operation,
+    latency, succeeded) per operation, the (thread, marker) of every
+    acknowledged append, and error counts by exception type.
+    """
+
+    def __init__(self):
+        self.records: List[Tuple[float, str, float, bool]] = []
+        self.acknowledged: List[Tuple[str, str]] = []
+        self.errors: Dict[str, int] = {}
+
+    def record(self, offset: float, operation: str, latency: float, thread_name: str,
+               message: Optional[Dict], error: Optional[Exception]) -> None:
+        self.records.append((offset, operation, latency, error is None))
+        if error is not None:
+            name = type(error).__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+        elif message is not None:
+            self.acknowledged.append((thread_name, message_marker(message)))
+
+
+def simulate_user(backend, user_number: int, config: Dict, started: float) -> UserLog:
+    """
+    Runs one user against a backend until config["duration"] seconds after started.
+    """
+    user = UserSimulator(user_number, config)
+    log = UserLog()
+    deadline = started + config["duration"]
+    while (now := time.time()) < deadline:
+        operation, thread_name, message = user.next_operation()
+        error = None
+        start = time.perf_counter()
+        try:
+            if operation == "append":
+                backend.append(thread_name, message)
+            elif operation == "read":
+                backend.read(thread_name, limit=RECENT_LIMIT)
+            else:
+                backend.list()
+        except Exception as e:
+            error = e
+        log.record(now - started, operation, time.perf_counter() - start, thread_name, message, error)
+        pause = user.pause()
+        if pause:
+            time.sleep(min(pause, max(0.0, deadline - time.time())))
+    return log
+
+
+async def simulate_async_user(manager, user_number: int, config: Dict, started: float) -> UserLog:
+    """
+    The asyncio counterpart of simulate_user(), driving an AsyncMongoDBManager.
+    """
+    user = UserSimulator(user_number, config)
+    log = UserLog()
+    deadline = started + config["duration"]
+    while (now := time.time()) < deadline:
+        operation, thread_name, message = user.next_operation()
+        error = None
+        start = time.perf_counter()
+        try:
+            if operation == "append":
+                await manager.append_message(BENCHMARK_USER, thread_name, message)
+            elif operation == "read":
+                await manager.get_conversation(BENCHMARK_USER, thread_name, limit=RECENT_LIMIT)
+            else:
+                await manager.list_user_threads(BENCHMARK_USER)
+        except Exception as e:
+            error = e
+        log.record(now - started, operation, time.perf_counter() - start, thread_name, message, error)
+        pause = user.pause()
+        if pause:
+            await asyncio.sleep(min(pause, max(0.0, deadline - time.time())))
+    return log
+
+
+def _run_threads(backend, config: Dict) -> List[UserLog]:
+    """
+    One thread per user, all sharing one backend (one manager, one connection pool).
+    """
+    logs = [None] * config["users"]
+    started = time.time()
+
+    def run(user_number):
+        logs[user_number] = simulate_user(backend, user_number, config, started)
+
+    threads = [threading.Thread(target=run, args=(user_number,)) for user_number in range(config["users"])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return logs
+
+
+def _process_user(user_number: int, config: Dict, location: str, barrier, results) -> None:
+    """
+    Body of one user's process: attach to the shared backend, wait for every
+    other process to be ready, then run. A failure is reported as an error in
+    the user's log, and breaks the barrier so the other processes don't wait forever.
+    """
+    log = UserLog()
+    backend = None
+    try:
+        backend = open_backend(config["backend"], config["mongo_uri"], attach_to=location)
+        barrier.wait()
+        log = simulate_user(backend, user_number, config, time.time())
+    except Exception as e:
+        barrier.abort()
+        log.errors[type(e).__name__] = log.errors.get(type(e).__name__, 0) + 1
+    finally:
+        if backend is not None:
+            backend.close()
+        results.put((user_number, log))
+
+
+def _run_processes(backend, config: Dict) -> List[UserLog]:
+    """
+    One process per user, each with its own manager on the shared storage.
+    """
+    barrier = multiprocessing.Barrier(config["users"])
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_process_user,
+                                         args=(user_number, config, backend.location, barrier, results))
+                 for user_number in range(config["users"])]
+    for process in processes:
+        process.start()
+    logs = [UserLog() for _ in processes]
+    for _ in processes:
+        user_number, log = results.get()
+        logs[user_number] = log
+    for process in processes:
+        process.join()
+    return logs
+
+
+def _run_asyncio(config: Dict) -> List[UserLog]:
+    """
+    One task per user in a single event loop, all sharing one AsyncMongoDBManager.
+    """
+    from db_wrappers.async_mongodb_manager import AsyncMongoDBManager
+
+    async def run():
+        manager = AsyncMongoDBManager(config["mongo_uri"], BENCHMARK_DATABASE, max_pool_size=config["pool_size"])
+        started = time.time()
+        try:
+            return await asyncio.gather(*(simulate_async_user(manager, user_number, config, started)
+                                          for user_number in range(config["users"])))
+        finally:
+            await manager.close()
+
+    return list(asyncio.run(run()))
+
+
+def run_load(backend: str, runner: str = "threads", users: int = 10, threads: int = 100, duration: float = 10.0,
+             mix: Optional[Dict[str, float]] = None, think_time: float = 0.0, skew: float = 1.0,
+             payload: int = 200, history: int = 20, interval: float = 1.0, seed: int = 0,
+             mongo_uri: str = DEFAULT_MONGO_URI, pool_size: int = 100) -> Dict:
+    """
+    Simulates users concurrent users working on a shared set of threads for
+    duration seconds, then reads every thread back to count lost writes.
+
+    Args:
+        backend (str): One of benchmarks.backends.BACKENDS
+        runner (str): "threads" (one shared manager), "processes" (a manager per
+            user process; flat files run in multiprocess mode) or "asyncio" (one
+            AsyncMongoDBManager, mongodb backend only)
+        users (int): Concurrent simulated users
+        threads (int): Conversation threads the users share
+        duration (float): Seconds to run for
+        mix (Optional[Dict[str, float]]): Relative weights of "read" (last
+            RECENT_LIMIT messages), "append" and "list" (a page of threads)
+        think_time (float): Mean seconds a user waits between operations
+        skew (float): Zipf exponent of thread popularity
+        payload (int): Characters per appended message
+        history (int): Messages each thread starts with
+        interval (float): Width in seconds of each timeline window
+        seed (int): Seed for the users' random choices
+        mongo_uri (str): Connection string for the MongoDB backends
+        pool_size (int): Connection pool size of the asyncio runner
+
+    Returns:
+        Dict: config, duration, operations, throughput, by_operation (count,
+        errors, throughput and latency_ms per operation), errors (by exception
+        type), appends_acknowledged, lost_writes and timeline (throughput,
+        p50_ms, p99_ms and errors per interval)
+    """
+    mix = dict(DEFAULT_MIX if mix is None else mix)
+    if runner not in RUNNERS:
+        raise ValueError(f"Unknown runner: {runner}")
+    if set(mix) - set(OPERATIONS) or not any(weight > 0 for weight in mix.values()) \
+            or any(weight < 0 for weight in mix.values()):
+        raise ValueError(f"mix must give non-negative weights to some of {OPERATIONS}")
+    if users < 1 or threads < 1 or duration <= 0 or interval <= 0:
+        raise ValueError("users and threads must be at least 1, duration and interval positive")
+    if mongo_uri == MONGOMOCK_URI and backend.startswith("mongodb") and runner != "threads":
+        raise ValueError("The in-process MongoDB stand-in only supports the threads runner")
+    if runner == "asyncio" and backend != "mongodb":
+        raise ValueError("The asyncio runner drives AsyncMongoDBManager and only supports the mongodb backend")
+
+    config = {"backend": backend, "runner": runner, "users": users, "threads": threads, "duration": duration,
+              "mix": mix, "think_time": think_time, "skew": skew, "payload": payload, "history": history,
+              "seed": seed, "mongo_uri": mongo_uri, "pool_size": pool_size}
+    store = open_backend(backend, mongo_uri, multiprocess=runner == "processes")
+    try:
+        seed_messages = make_messages(history, payload)
+        for thread_number in range(threads):
+            store.save(f"thread_{thread_number}", seed_messages)
+
+        started = time.perf_counter()
+        if runner == "threads":
+            logs = _run_threads(store, config)
+        elif runner == "processes":
+            logs = _run_processes(store, config)
+        else:
+            logs = _run_asyncio(config)
+        elapsed = time.perf_counter() - started
+
+        stored = {}
+        for thread_number in range(threads):
+            thread_name = f"thread_{thread_number}"
+            stored[thread_name] = {message_marker(message) for message in store.read(thread_name)}
+    finally:
+        store.close()
+
+    acknowledged = [entry for log in logs for entry in log.acknowledged]
+    lost = sum(marker not in stored[thread_name] for thread_name, marker in acknowledged)
+    return report(config, logs, elapsed, interval, len(acknowledged), lost)
+
+
+def report(config: Dict, logs: List[UserLog], elapsed: float, interval: float,
+           acknowledged: int, lost: int) -> Dict:
+    """
+    Aggregates the users' logs into the result of run_load().
+    """
+    records = sorted(record for log in logs for record in log.records)
+    errors = {}
+    for log in logs:
+        for name, count in log.errors.items():
+            errors[name] = errors.get(name, 0) + count
+
+    by_operation = {}
+    for operation in config["mix"]:
+        done = [record for record in records if record[1] == operation]
+        latencies = [latency for _, _, latency, ok in done if ok]
+        by_operation[operation] = {
+            "count": len(done),
+            "errors": sum(not ok for *_, ok in done),
+            "throughput": len(latencies) / elapsed,
+            "latency_ms": summarize(latencies) if latencies else None,
+        }
+
+    timeline = []
+    offsets = [record[0] for record in records]
+    window = 0
+    while window * interval < config["duration"]:
+        low = bisect_left(offsets, window * interval)
+        high = bisect_left(offsets, (window + 1) * interval)
+        latencies = sorted(latency for _, _, latency, ok in records[low:high] if ok)
+        timeline.append({
+            "start": window * interval,
+            "throughput": len(latencies) / interval,
+            "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+            "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+            "errors": sum(not ok for *_, ok in records[low:high]),
+        })
+        window += 1
+
+    return {
+        "config": config,
+        "duration": elapsed,
+        "operations": len(records),
+        "throughput": sum(ok for *_, ok in records) / elapsed,
+        "by_operation": by_operation,
+        "errors": errors,
+        "appends_acknowledged": acknowledged,
+        "lost_writes": lost,
+        "timeline": timeline,
+    }
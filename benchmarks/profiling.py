@@ -0,0 +1,177 @@
+import os
+import re
+import sys
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from typing import Dict, List
+from db_wrappers.profiling import PhaseRecorder
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack at a fixed interval and counts each
+    distinct stack, for flame graphs. Unlike cProfile's caller/callee pairs,
+    the samples keep whole stacks.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self._active = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _frame_name(code) -> str:
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if not self._active.wait(0.1):
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(self._frame_name(frame.f_code))
+                frame = frame.f_back
+            if names:
+                stack = ";".join(reversed(names))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            time.sleep(self.interval)
+
+    def resume(self) -> None:
+        self._active.set()
+
+    def pause(self) -> None:
+        self._active.clear()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._active.set()
+        self._thread.join()
+
+    def write_folded(self, path: str) -> None:
+        """
+        Writes the samples in the folded-stack format ("frame;frame;frame count"
+        per line) read by flamegraph.pl, inferno and speedscope.
+        """
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+
+class ProfileSession:
+    """
+    Profiles the timed part of one scenario across all of its trials: a
+    cProfile profile, stack samples, tracemalloc allocation tracking and the
+    managers' phase timings. Call start() and stop() around each timed loop
+    and finish() once at the end. Profiling slows the operations down, so
+    profiled latencies are only comparable with each other.
+    """
+
+    def __init__(self, key: str, output_dir: str, top: int = 10, sample_interval: float = 0.001):
+        self.key = key
+        self.output_dir = output_dir
+        self.top = top
+        self.profile = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), sample_interval)
+        # Installed for the whole scenario so MongoDB clients created during setup report round trips
+        self.phases = PhaseRecorder()
+        self.phases.install()
+        self.peak_bytes = 0
+        self.snapshot = None
+
+    def start(self) -> None:
+        tracemalloc.start()
+        self.phases.recording = True
+        self.sampler.resume()
+        self.profile.enable()
+
+    def stop(self) -> None:
+        self.profile.disable()
+        self.sampler.pause()
+        self.phases.recording = False
+        self.peak_bytes = max(self.peak_bytes, tracemalloc.get_traced_memory()[1])
+        self.snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+    def close(self) -> None:
+        self.phases.uninstall()
+        self.sampler.close()
+
+    def finish(self, operations: int, mean_latency_ms: float) -> Dict:
+        """
+        Writes the profile files and summarizes the profile.
+
+        Args:
+            operations (int): Number of profiled operations, to report phases per operation
+            mean_latency_ms (float): Mean operation latency, to work out the time outside any phase
+
+        Returns:
+            Dict: cprofile and folded (paths of the files written), top_functions
+            (by cumulative time), peak_allocated_bytes, top_allocations (the
+            largest allocations still alive at the end of the last trial, by
+            line), phases_ms (milliseconds per operation in each phase) and
+            other_ms (the rest of each operation)
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, re.sub(r"[^\w.=-]+", "_", self.key))
+        self.profile.dump_stats(f"{base}.prof")
+        self.sampler.write_folded(f"{base}.folded")
+
+        stats = pstats.Stats(self.profile)
+        functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        top_functions = [{"function": f"{os.path.basename(filename)}:{line}({name})", "calls": calls,
+                          "total_ms": total * 1000, "cumulative_ms": cumulative * 1000}
+                         for (filename, line, name), (_, calls, total, cumulative, _) in functions[:self.top]]
+
+        top_allocations = []
+        if self.snapshot is not None:
+            snapshot = self.snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            top_allocations = [{"location": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                                "bytes": stat.size, "blocks": stat.count}
+                               for stat in snapshot.statistics("lineno")[:self.top]]
+
+        phases_ms = {name: seconds * 1000 / operations for name, seconds in sorted(self.phases.seconds.items())}
+        return {
+            "cprofile": f"{base}.prof",
+            "folded": f"{base}.folded",
+            "top_functions": top_functions,
+            "peak_allocated_bytes": self.peak_bytes,
+            "top_allocations": top_allocations,
+            "phases_ms": phases_ms,
+            "other_ms": max(0.0, mean_latency_ms - sum(phases_ms.values())),
+        }
+
+
+class Profiler:
+    """
+    Creates a ProfileSession per scenario, writing its files to output_dir.
+    """
+
+    def __init__(self, output_dir: str, top: int = 10, sample_interval: float = 0.001):
+        self.output_dir = output_dir
+        self.top = top
+        self.sample_interval = sample_interval
+
+    def session(self, key: str) -> ProfileSession:
+        return ProfileSession(key, self.output_dir, self.top, self.sample_interval)
+
+
+def format_profile(profile: Dict) -> List[str]:
+    """
+    Formats a ProfileSession.finish() summary as indented report lines.
+    """
+    phases = "  ".join(f"{name} {ms:.3f}ms" for name, ms in profile["phases_ms"].items())
+    lines = [f"    phases per op: {phases + '  ' if phases else ''}other {profile['other_ms']:.3f}ms",
+             f"    peak allocated: {profile['peak_allocated_bytes'] / 1024:.1f} KB",
+             f"    profile: {profile['cprofile']} (snakeviz), {profile['folded']} (flamegraph.pl, speedscope)"]
+    for function in profile["top_functions"][:5]:
+        lines.append(f"    {function['cumulative_ms']:10.3f}ms cumulative  {function['calls']:8d} calls  "
+                     f"{function['function']}")
+    return lines
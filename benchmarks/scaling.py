@@ -0,0 +1,171 @@
+import os
+import math
+import time
+from typing import Dict, List, Optional
+from benchmarks.backends import DEFAULT_MONGO_URI, open_backend
+from benchmarks.harness import percentile
+from benchmarks.scenarios import RECENT_LIMIT, make_messages
+
+# MongoDB's maximum BSON document size
+MAX_DOCUMENT_BYTES = 16 * 1024 * 1024
+# Distinct messages generated per run; larger conversations repeat them
+FILLER_MESSAGES = 1000
+THREAD_NAME = "scaling"
+
+
+def current_rss() -> Optional[int]:
+    """
+    Returns the resident set size of this process in bytes: current RSS on
+    Linux, peak RSS where only resource is available, None elsewhere.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def fit_complexity(sizes: List[int], latencies: List[float]) -> Optional[Dict]:
+    """
+    Fits latency = c * n ** exponent by least squares on a log-log scale.
+
+    Args:
+        sizes (List[int]): Conversation sizes n
+        latencies (List[float]): Latency measured at each size
+
+    Returns:
+        Optional[Dict]: exponent, r_squared and complexity (the nearest of O(1),
+        O(log n), O(n) and O(n^2), or O(n^x) when none is close), or None with
+        fewer than 3 usable points
+    """
+    points = [(math.log(n), math.log(latency)) for n, latency in zip(sizes, latencies) if n > 0 and latency > 0]
+    if len(points) < 3:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    sxx = sum((x - mean_x) ** 2 for x, _ in points)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    syy = sum((y - mean_y) ** 2 for _, y in points)
+    exponent = sxy / sxx if sxx else 0.0
+    r_squared = sxy * sxy / (sxx * syy) if sxx and syy else 1.0
+    if exponent < 0.15:
+        complexity = "O(1)"
+    elif exponent < 0.35:
+        complexity = "O(log n)"
+    elif 0.8 <= exponent < 1.2:
+        complexity = "O(n)"
+    elif 1.8 <= exponent < 2.2:
+        complexity = "O(n^2)"
+    else:
+        complexity = f"O(n^{exponent:.1f})"
+    return {"exponent": exponent, "r_squared": r_squared, "complexity": complexity}
+
+
+def _median_latency(operation, repeats: int) -> float:
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - start)
+    return percentile(sorted(latencies), 50)
+
+
+def run_scaling(backend: str, start: int = 100, factor: float = 2.0, max_messages: int = 1_000_000,
+                time_budget: float = 60.0, size_budget: int = MAX_DOCUMENT_BYTES, payload: int = 200,
+                samples: int = 20, mongo_uri: str = DEFAULT_MONGO_URI) -> Dict:
+    """
+    Grows one conversation geometrically (start, start * factor, ...) and
+    measures each backend operation at every size. It stops when the next
+    step would exceed max_messages or, extrapolating from the last step,
+    overrun time_budget; when the largest document or file exceeds
+    size_budget; or when a write fails (e.g. MongoDB refusing a document
+    over 16 MB).
+
+    Each step first brings the conversation to its size less samples
+    messages with one save_conversation(), then times samples
+    single-message appends, full reads and reads of the last RECENT_LIMIT
+    messages. The first step is therefore at least samples + 1 messages, so
+    every step saves something and the step sizes never repeat.
+
+    Args:
+        backend (str): One of benchmarks.backends.BACKENDS
+        start (int): Messages in the first step (raised to samples + 1 if smaller)
+        factor (float): Growth factor between steps
+        max_messages (int): Largest conversation to try
+        time_budget (float): Seconds the whole run should fit in
+        size_budget (int): Largest document or file size, in bytes, after
+            which no new step is started
+        payload (int): Characters of content per message
+        samples (int): Appends and recent reads timed per step (full reads use a third of them)
+        mongo_uri (str): Connection string for the MongoDB backends
+
+    Returns:
+        Dict: backend, steps (messages, append_ms, append_p95_ms,
+        read_ms, read_recent_ms, storage_bytes, largest_document_bytes,
+        bytes_per_message and rss_bytes per step), stopped (why it ended) and
+        fits (fit_complexity() of each operation's latency over the larger half of the steps)
+    """
+    if start < 1 or factor <= 1 or samples < 1:
+        raise ValueError("start and samples must be at least 1 and factor greater than 1")
+    if max_messages <= samples:
+        raise ValueError("max_messages must be greater than samples")
+    filler = make_messages(min(FILLER_MESSAGES, max_messages), payload)
+    extra = make_messages(samples, payload, seed=1)
+    steps = []
+    stopped = "max messages"
+    began = time.perf_counter()
+    store = open_backend(backend, mongo_uri)
+    try:
+        size = max(start, samples + 1)
+        while size <= max_messages:
+            step_began = time.perf_counter()
+            base = size - samples
+            messages = (filler * (base // len(filler) + 1))[:base]
+            try:
+                store.save(THREAD_NAME, messages)
+                append_latencies = []
+                for message in extra:
+                    append_start = time.perf_counter()
+                    store.append(THREAD_NAME, message)
+                    append_latencies.append(time.perf_counter() - append_start)
+            except Exception as e:
+                stopped = f"error at {size} messages: {type(e).__name__}: {e}"
+                break
+            append_latencies.sort()
+            read = _median_latency(lambda: store.read(THREAD_NAME), max(1, samples // 3))
+            read_recent = _median_latency(lambda: store.read(THREAD_NAME, limit=RECENT_LIMIT), samples)
+            sizes = store.storage_size(THREAD_NAME)
+            steps.append({
+                "messages": size,
+                "append_ms": percentile(append_latencies, 50) * 1000,
+                "append_p95_ms": percentile(append_latencies, 95) * 1000,
+                "read_ms": read * 1000,
+                "read_recent_ms": read_recent * 1000,
+                **sizes,
+                "bytes_per_message": sizes["storage_bytes"] / size,
+                "rss_bytes": current_rss(),
+            })
+            # Saving and reading the whole conversation make each step about factor times longer than the last
+            now = time.perf_counter()
+            if now - began + (now - step_began) * factor > time_budget:
+                stopped = "time budget"
+                break
+            if (sizes["largest_document_bytes"] or 0) > size_budget:
+                stopped = "size budget"
+                break
+            size = max(size + 1, int(size * factor))
+    finally:
+        store.close()
+
+    # Fixed per-call overhead dominates small sizes, so fit on the larger half of the steps
+    tail = steps[len(steps) // 2:] if len(steps) >= 6 else steps
+    fits = {operation: fit_complexity([step["messages"] for step in tail], [step[f"{operation}_ms"] for step in tail])
+            for operation in ("append", "read", "read_recent")}
+    return {"backend": backend, "steps": steps, "stopped": stopped, "fits": fits}
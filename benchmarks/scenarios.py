@@ -0,0 +1,73 @@
+import random
+import string
+from itertools import product
+from typing import Dict, Iterable, List
+from benchmarks.backends import DEFAULT_MONGO_URI, open_backend
+from benchmarks.harness import Scenario
+
+SCENARIOS = ("append", "read", "read_recent", "save")
+
+# Messages returned by the read_recent scenario, as when a thread is opened in the CLI
+RECENT_LIMIT = 20
+
+
+def make_messages(count: int, payload: int, seed: int = 0) -> List[Dict]:
+    """
+    Builds count alternating user/assistant messages with payload characters of content each.
+    """
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + " "
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": "".join(rng.choices(alphabet, k=payload))}
+            for i in range(count)]
+
+
+def make_scenario(name: str, backend: str, messages: int, payload: int, operations: int,
+                  mongo_uri: str = DEFAULT_MONGO_URI) -> Scenario:
+    """
+    Builds one scenario variant.
+
+    Args:
+        name (str): One of SCENARIOS. append adds one message to a thread that
+            already holds messages; read loads a whole thread of messages;
+            read_recent loads its last RECENT_LIMIT; save writes a new thread of
+            messages in one call.
+        backend (str): One of benchmarks.backends.BACKENDS
+        messages (int): Messages in the thread being appended to, read or saved
+        payload (int): Characters of content per message
+        operations (int): Timed operations per trial
+        mongo_uri (str): Where the MongoDB backends connect
+
+    Returns:
+        Scenario: The scenario, with backend, messages and payload as its params
+    """
+    if name not in SCENARIOS:
+        raise ValueError(f"Unknown scenario: {name}")
+    history = make_messages(messages, payload)
+    extra = make_messages(operations, payload, seed=1)
+
+    def setup():
+        store = open_backend(backend, mongo_uri)
+        if name != "save":
+            store.save("thread", history)
+        return store
+
+    if name == "append":
+        operation = lambda store, i: store.append("thread", extra[i])
+    elif name == "read":
+        operation = lambda store, i: store.read("thread")
+    elif name == "read_recent":
+        operation = lambda store, i: store.read("thread", limit=RECENT_LIMIT)
+    else:
+        operation = lambda store, i: store.save(f"saved_{i}", history)
+
+    return Scenario(name, {"backend": backend, "messages": messages, "payload": payload},
+                    setup, operation, teardown=lambda store: store.close(), operations=operations)
+
+
+def build_matrix(names: Iterable[str], backends: Iterable[str], message_counts: Iterable[int],
+                 payloads: Iterable[int], operations: int, mongo_uri: str = DEFAULT_MONGO_URI) -> List[Scenario]:
+    """
+    Builds every combination of scenario, backend, message count and payload size.
+    """
+    return [make_scenario(name, backend, messages, payload, operations, mongo_uri)
+            for name, backend, messages, payload in product(names, backends, message_counts, payloads)]
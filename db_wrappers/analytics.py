@@ -0,0 +1,277 @@
+import os
+import sys
+from datetime import datetime, timedelta, UTC
+from typing import Dict, List, Optional
+if __package__ in (None, ""):
+    # Run as a script (python db_wrappers/analytics.py): make the db_wrappers package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_wrappers.mongodb_manager import META_COLLECTION, STATS_COLLECTION, MongoDBManager
+
+# chai_meta document recording when the stats collection was last refreshed
+STATS_REFRESH_ID = "analytics:thread_stats"
+
+# Characters in a message's content, or 0 if it has no string content
+_MESSAGE_LENGTH = {"$cond": [
+    {"$eq": [{"$type": "$messages.content"}, "string"]}, {"$strLenCP": "$messages.content"}, 0,
+]}
+
+
+class ConversationAnalytics:
+    """
+    Usage statistics over a MongoDBManager's conversations: threads per user,
+    messages per thread, the split of messages by role, average message length
+    and the most active threads.
+
+    Everything is computed by aggregation pipelines on the server, and only
+    per-thread counts or final totals are returned, never message bodies.
+    Per-thread counts can also be materialized into the thread_stats
+    collection with refresh(), which only recomputes the threads updated since
+    the previous refresh; pass materialized=True to read from it instead of
+    scanning the messages.
+    """
+
+    def __init__(self, manager: MongoDBManager, refresh_lag: float = 5.0):
+        """
+        Args:
+            manager (MongoDBManager): The manager whose database is analyzed
+            refresh_lag (float): Seconds before the previous refresh that an
+                incremental refresh looks back, to catch writes whose updated_at
+                was taken just before that refresh started
+        """
+        self.manager = manager
+        self.refresh_lag = refresh_lag
+        self._refresh_index_ready = False
+
+    @property
+    def stats(self):
+        return self.manager.db[STATS_COLLECTION]
+
+    def _thread_stats_stages(self) -> List[Dict]:
+        """
+        Builds the stages that turn conversation documents into one document per
+        thread: _id, user_id, thread_name, updated_at, message_count, characters
+        and roles ({role: message count}).
+        """
+        if self.manager.storage_layout == "bucketed":
+            stages = [
+                {"$project": {"user_id": True, "thread_name": True, "updated_at": True}},
+                {"$lookup": {
+                    "from": "message_buckets",
+                    "let": {"conversation_id": "$_id"},
+                    "pipeline": [
+                        {"$match": {"$expr": {"$eq": ["$conversation_id", "$$conversation_id"]}}},
+                        {"$project": {"messages.role": True, "messages.content": True}},
+                        {"$unwind": "$messages"},
+                        {"$group": {"_id": "$messages.role", "messages": {"$sum": 1},
+                                    "characters": {"$sum": _MESSAGE_LENGTH}}},
+                    ],
+                    "as": "roles",
+                }},
+            ]
+        else:
+            stages = [
+                {"$project": {"user_id": True, "thread_name": True, "updated_at": True,
+                              "messages.role": True, "messages.content": True}},
+                {"$unwind": {"path": "$messages", "preserveNullAndEmptyArrays": True}},
+                {"$group": {
+                    "_id": {"conversation_id": "$_id", "role": "$messages.role"},
+                    "user_id": {"$first": "$user_id"},
+                    "thread_name": {"$first": "$thread_name"},
+                    "updated_at": {"$first": "$updated_at"},
+                    # A thread without messages still yields one (empty) group
+                    "messages": {"$sum": {"$cond": [{"$ifNull": ["$messages", False]}, 1, 0]}},
+                    "characters": {"$sum": {"$cond": [{"$ifNull": ["$messages", False]}, _MESSAGE_LENGTH, 0]}},
+                }},
+                {"$group": {
+                    "_id": "$_id.conversation_id",
+                    "user_id": {"$first": "$user_id"},
+                    "thread_name": {"$first": "$thread_name"},
+                    "updated_at": {"$first": "$updated_at"},
+                    "roles": {"$push": {"_id": "$_id.role", "messages": "$messages", "characters": "$characters"}},
+                }},
+            ]
+        stages.append({"$project": {
+            "user_id": True,
+            "thread_name": True,
+            "updated_at": True,
+            "message_count": {"$sum": "$roles.messages"},
+            "characters": {"$sum": "$roles.characters"},
+            "roles": {"$arrayToObject": {"$map": {
+                "input": {"$filter": {"input": "$roles", "cond": {"$gt": ["$$this.messages", 0]}}},
+                "in": {"k": {"$ifNull": [{"$toString": "$$this._id"}, "unknown"]}, "v": "$$this.messages"},
+            }}},
+        }})
+        return stages
+
+    def _aggregate_threads(self, match: Dict, stages: List[Dict], materialized: bool) -> List[Dict]:
+        """
+        Runs stages over per-thread stats matching match, computed from the
+        conversations or read from the materialized collection.
+        """
+        if materialized:
+            return list(self.stats.aggregate([{"$match": match}] + stages))
+        self.manager.flush()
+        return list(self.manager.conversations.aggregate([{"$match": match}] + self._thread_stats_stages() + stages))
+
+    def thread_stats(self, user_id: Optional[str] = None, materialized: bool = False) -> List[Dict]:
+        """
+        Returns per-thread stats, most messages first.
+
+        Args:
+            user_id (Optional[str]): If set, only this user's threads
+            materialized (bool): If True, read from the thread_stats collection
+
+        Returns:
+            List[Dict]: One document per thread with user_id, thread_name,
+            updated_at, message_count, characters and roles ({role: messages})
+        """
+        match = {} if user_id is None else {"user_id": user_id}
+        return self._aggregate_threads(match, [{"$sort": {"message_count": -1, "_id": 1}}], materialized)
+
+    def user_stats(self, user_id: str, top_threads: int = 5, materialized: bool = False) -> Dict:
+        """
+        Summarizes one user's threads. See global_stats() for the fields.
+        """
+        summary = self._summarize({"user_id": user_id}, top_threads, materialized)
+        del summary["users"]
+        return summary
+
+    def global_stats(self, top_threads: int = 5, materialized: bool = False) -> Dict:
+        """
+        Summarizes every thread in the database.
+
+        Args:
+            top_threads (int): Number of most active threads to include
+            materialized (bool): If True, read from the thread_stats collection
+
+        Returns:
+            Dict: users, threads, messages, messages_per_thread,
+            average_message_length (in characters), roles ({role: messages})
+            and most_active_threads (user_id, thread_name and message_count)
+        """
+        return self._summarize({}, top_threads, materialized)
+
+    def _summarize(self, match: Dict, top_threads: int, materialized: bool) -> Dict:
+        """
+        Computes totals, the role split and the top threads in one aggregation;
+        $facet shares the per-thread stats between the three.
+        """
+        facets = {"$facet": {
+            "totals": [
+                {"$group": {"_id": "$user_id", "threads": {"$sum": 1}, "messages": {"$sum": "$message_count"},
+                            "characters": {"$sum": "$characters"}}},
+                {"$group": {"_id": None, "users": {"$sum": 1}, "threads": {"$sum": "$threads"},
+                            "messages": {"$sum": "$messages"}, "characters": {"$sum": "$characters"}}},
+            ],
+            "roles": [
+                {"$project": {"roles": {"$objectToArray": "$roles"}}},
+                {"$unwind": "$roles"},
+                {"$group": {"_id": "$roles.k", "messages": {"$sum": "$roles.v"}}},
+                {"$sort": {"messages": -1, "_id": 1}},
+            ],
+            "most_active_threads": [
+                {"$sort": {"message_count": -1, "_id": 1}},
+                {"$limit": max(1, top_threads)},
+                {"$project": {"_id": False, "user_id": True, "thread_name": True, "message_count": True}},
+            ],
+        }}
+        result = self._aggregate_threads(match, [facets], materialized)[0]
+        totals = result["totals"][0] if result["totals"] else {}
+        threads = totals.get("threads", 0)
+        messages = totals.get("messages", 0)
+        return {
+            "users": totals.get("users", 0),
+            "threads": threads,
+            "messages": messages,
+            "messages_per_thread": messages / threads if threads else 0.0,
+            "average_message_length": totals.get("characters", 0) / messages if messages else 0.0,
+            "roles": {role["_id"]: role["messages"] for role in result["roles"]},
+            "most_active_threads": result["most_active_threads"][:top_threads],
+        }
+
+    def refresh(self, full: bool = False) -> None:
+        """
+        Brings the materialized thread_stats collection up to date with a $merge.
+        An incremental refresh only recomputes threads whose updated_at is
+        after the previous refresh (less refresh_lag), found through an index
+        on updated_at. delete_conversation() drops a deleted thread's stats, so
+        only a full refresh also removes stale stats, with an anti-join on _id
+        against the conversations collection. That catches threads deleted
+        behind the manager's back, or while a refresh was merging them.
+
+        Args:
+            full (bool): If True, recompute every thread and drop stats of deleted threads
+        """
+        started = datetime.now(UTC)
+        if not self._refresh_index_ready:
+            self.manager.conversations.create_index([("updated_at", 1)], name="analytics_refresh")
+            self._refresh_index_ready = True
+
+        match = {}
+        marker = self.manager.db[META_COLLECTION].find_one({"_id": STATS_REFRESH_ID})
+        if not full and marker:
+            since = datetime.fromisoformat(marker["refreshed_at"]) - timedelta(seconds=self.refresh_lag)
+            match = {"updated_at": {"$gte": since.isoformat()}}
+
+        self.manager.flush()
+        self.manager.conversations.aggregate(
+            [{"$match": match}] + self._thread_stats_stages()
+            + [{"$merge": {"into": STATS_COLLECTION, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}])
+
+        if full:
+            deleted = self.stats.aggregate([
+                {"$lookup": {
+                    "from": "conversations",
+                    "let": {"conversation_id": "$_id"},
+                    "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", "$$conversation_id"]}}},
+                                 {"$project": {"_id": True}}],
+                    "as": "live",
+                }},
+                {"$match": {"live": {"$size": 0}}},
+                {"$project": {"_id": True}},
+            ])
+            deleted_ids = [document["_id"] for document in deleted]
+            if deleted_ids:
+                self.stats.delete_many({"_id": {"$in": deleted_ids}})
+
+        self.manager.db[META_COLLECTION].update_one(
+            {"_id": STATS_REFRESH_ID}, {"$set": {"refreshed_at": started.isoformat()}}, upsert=True)
+
+
+# Test code
+if __name__ == "__main__":
+    print("Testing ConversationAnalytics")
+    manager = MongoDBManager(connection_string="mongodb://localhost:27017/", database_name="chai_test_db")
+    manager._wipe_database()
+    analytics = ConversationAnalytics(manager)
+
+    manager.save_conversation("alice", "pets", [{"role": "user", "content": "My cat"},
+                                                {"role": "assistant", "content": "Nice!"}])
+    manager.append_message("alice", "pets", {"role": "user", "content": "Thanks"})
+    manager.save_conversation("alice", "empty", [])
+    manager.save_conversation("bob", "work", [{"role": "user", "content": "Hello"}])
+
+    print("Testing ConversationAnalytics.user_stats()")
+    stats = analytics.user_stats("alice", top_threads=1)
+    if stats["threads"] == 2 and stats["messages"] == 3 and stats["roles"] == {"user": 2, "assistant": 1} \
+            and stats["average_message_length"] == 17 / 3 and stats["most_active_threads"][0]["thread_name"] == "pets":
+        print(f"Successfully computed user stats: {stats}")
+    else:
+        print(f"Failed! Got {stats}")
+
+    print("Testing ConversationAnalytics.refresh()")
+    analytics.refresh(full=True)
+    manager.append_message("bob", "work", {"role": "assistant", "content": "Hi"})
+    manager.delete_conversation("alice", "empty")
+    analytics.refresh()
+    if analytics.global_stats(materialized=True) == analytics.global_stats():
+        print(f"Successfully materialized stats: {analytics.global_stats(materialized=True)}")
+    else:
+        print(f"Failed! Got {analytics.global_stats(materialized=True)}")
+
+    print("Cleaning up test data...")
+    manager._wipe_database()
+    analytics.stats.delete_many({})
+    manager.db[META_COLLECTION].delete_one({"_id": STATS_REFRESH_ID})
+    manager.close()
+    print("All tests passed!")
@@ -0,0 +1,270 @@
+import os
+import sys
+import asyncio
+from datetime import datetime, UTC
+from typing import Dict, List, Optional
+from pymongo import AsyncMongoClient
+if __package__ in (None, ""):
+    # Run as a script (python db_wrappers/async_mongodb_manager.py): make the db_wrappers package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_wrappers.mongodb_manager import (DROPPED_INDEXES, INDEX_VERSION, META_COLLECTION, STATS_COLLECTION,
+                                         THREAD_FIELDS_MISSING, MongoDBManager, _verified_indexes)
+
+
+class AsyncMongoDBManager:
+    """
+    An asyncio-native counterpart to MongoDBManager, built on PyMongo's async
+    client (PyMongo 4.9+). Every method is a coroutine, so one process can keep
+    many database round trips in flight at once.
+
+    Conversations use the same document layout as MongoDBManager's embedded
+    layout, so both managers can be pointed at the same database.
+    """
+
+    def __init__(self, connection_string: str = "mongodb://localhost:27017/", database_name: str = "chai_db",
+                 max_pool_size: int = 100, full_text_search: bool = False):
+        """
+        Initializes the AsyncMongoDBManager. No I/O happens until the first call.
+
+        Args:
+            connection_string (str): MongoDB connection string
+            database_name (str): Name of the database to use
+            max_pool_size (int): Maximum number of concurrent connections to the server
+            full_text_search (bool): If True, maintain the text index behind
+                MongoDBManager.search_messages(), with the same write cost
+        """
+        self.connection_string = connection_string
+        self.database_name = database_name
+        self.full_text_search = full_text_search
+        self.client = AsyncMongoClient(connection_string, maxPoolSize=max_pool_size)
+        self.db = self.client[database_name]
+        self.conversations = self.db["conversations"]
+        self._indexes_ready = False
+        self._indexes_lock = asyncio.Lock()
+
+    async def _ensure_indexes(self) -> None:
+        """
+        Makes sure the embedded layout's indexes exist before the first write,
+        exactly as MongoDBManager._verify_indexes() does: the same index
+        definitions, upgrade (dropped indexes and backfilled thread fields) and
+        chai_meta marker, so either manager can upgrade a database for both.
+        """
+        key = (self.connection_string, self.database_name, "embedded", self.full_text_search)
+        if self._indexes_ready or key in _verified_indexes:
+            return
+        async with self._indexes_lock:
+            if self._indexes_ready:
+                return
+            marker_id = MongoDBManager._index_marker_id("embedded", self.full_text_search)
+            marker = await self.db[META_COLLECTION].find_one({"_id": marker_id})
+            if not marker or marker.get("version") != INDEX_VERSION:
+                for collection, keys, options in MongoDBManager._index_definitions("embedded", self.full_text_search):
+                    await self.db[collection].create_index(keys, **options)
+                for collection, name in DROPPED_INDEXES:
+                    if name in await self.db[collection].index_information():
+                        await self.db[collection].drop_index(name)
+                await self.conversations.update_many(
+                    THREAD_FIELDS_MISSING, MongoDBManager._embedded_backfill_pipeline())
+                await self.db[META_COLLECTION].update_one(
+                    {"_id": marker_id}, {"$set": {"version": INDEX_VERSION}}, upsert=True)
+            _verified_indexes.add(key)
+            self._indexes_ready = True
+
+    async def get_conversation(self, user_id: str, thread_name: str,
+                               limit: Optional[int] = None, before: Optional[int] = None) -> List[Dict]:
+        """
+        Retrieves the messages for a specific conversation.
+
+        Args:
+            user_id (str): The user's ID
+            thread_name (str): The name of the conversation thread
+            limit (Optional[int]): If set, return at most this many messages, ending
+                at `before` (or at the end of the conversation)
+            before (Optional[int]): If set, only return messages at positions before this one
+
+        Returns:
+            List[Dict]: List of message dictionaries, or empty list if not found
+        """
+        projection = None
+        if limit is not None or before is not None:
+            message_slice = MongoDBManager._slice_spec(limit, before)
+            if message_slice is None:
+                return []
+            projection = {"messages": {"$slice": message_slice}}
+
+        document = await self.conversations.find_one({"_id": f"{user_id}_{thread_name}"}, projection=projection)
+        if not document or "messages" not in document:
+            return []
+        return document["messages"]
+
+    async def get_messages_since(self, user_id: str, thread_name: str, seq: int) -> List[Dict]:
+        """
+        Returns only the messages added to a conversation after sequence number
+        seq. See MongoDBManager.get_messages_since().
+
+        Args:
+            user_id (str): The user's ID
+            thread_name (str): The name of the conversation thread
+            seq (int): The highest sequence number the client already has
+
+        Returns:
+            List[Dict]: The newer messages in order, each with its number under "seq"
+        """
+        cursor = await self.conversations.aggregate(
+            MongoDBManager._since_pipeline(f"{user_id}_{thread_name}", seq))
+        documents = await cursor.to_list(None)
+        if not documents:
+            return []
+        return MongoDBManager._number_messages(documents[0]["messages"], documents[0]["first_seq"])
+
+    async def save_conversation(self, user_id: str, thread_name: str, messages: List[Dict]) -> None:
+        """
+        Saves the entire conversation, replacing the existing one if it exists.
+
+        Args:
+            user_id (str): The user's ID
+            thread_name (str): The name of the conversation thread
+            messages (List[Dict]): List of message dictionaries
+        """
+        await self._ensure_indexes()
+        conversation_id = f"{user_id}_{thread_name}"
+        timestamp = datetime.now(UTC).isoformat()
+        document = {
+            "_id": conversation_id,
+            "user_id": user_id,
+            "thread_name": thread_name,
+            "messages": messages,
+            "created_at": timestamp,
+            "updated_at": timestamp,
+            "message_count": len(messages),
+            **MongoDBManager._last_message_fields(messages),
+        }
+        await self.conversations.update_one(
+            {"_id": conversation_id}, {"$set": document, "$inc": {"last_seq": len(messages), "version": 1}}, upsert=True)
+
+    async def append_message(self, user_id: str, thread_name: str, message: Dict) -> None:
+        """
+        Appends a single message to a conversation, creating it if needed.
+
+        Args:
+            user_id (str): The user's ID
+            thread_name (str): The name of the conversation thread
+            message (Dict): A single message dictionary to append
+        """
+        await self.append_messages(user_id, thread_name, [message])
+
+    async def append_messages(self, user_id: str, thread_name: str, messages: List[Dict]) -> None:
+        """
+        Appends several messages to a conversation with a single $push/$each.
+
+        Args:
+            user_id (str): The user's ID
+            thread_name (str): The name of the conversation thread
+            messages (List[Dict]): Messages to append, in order
+        """
+        if not messages:
+            return
+        await self._ensure_indexes()
+        conversation_id = f"{user_id}_{thread_name}"
+        timestamp = datetime.now(UTC).isoformat()
+        await self.conversations.update_one(
+            {"_id": conversation_id},
+            {
+                "$push": {"messages": {"$each": messages}},
+                "$inc": {"message_count": len(messages), "last_seq": len(messages), "version": 1},
+                "$set": {"updated_at": timestamp, **MongoDBManager._last_message_fields(messages)},
+                "$setOnInsert": {
+                    "_id": conversation_id,
+                    "user_id": user_id,
+                    "thread_name": thread_name,
+                    "created_at": timestamp,
+                },
+            },
+            upsert=True,
+        )
+
+    async def list_user_threads(self, user_id: str) -> List[str]:
+        """
+        Lists all conversation thread names for a user, most recently updated first.
+
+        Args:
+            user_id (str): The user's ID
+
+        Returns:
+            List[str]: List of thread names for this user
+        """
+        await self._ensure_indexes()
+        cursor = self.conversations.find(
+            {"user_id": user_id}, {"thread_name": True, "_id": False}
+        ).sort([("updated_at", -1), ("thread_name", 1)])
+        return [record["thread_name"] async for record in cursor]
+
+    async def delete_conversation(self, user_id: str, thread_name: str) -> bool:
+        """
+        Deletes a conversation.
+
+        Args:
+            user_id (str): The user's ID
+            thread_name (str): The name of the conversation thread
+
+        Returns:
+            bool: True if a conversation was deleted, False otherwise
+        """
+        conversation_id = f"{user_id}_{thread_name}"
+        result = await self.conversations.delete_one({"_id": conversation_id})
+        await self.db[STATS_COLLECTION].delete_one({"_id": conversation_id})
+        return result.deleted_count > 0
+
+    async def close(self) -> None:
+        """
+        Closes the MongoDB connection.
+        """
+        await self.client.close()
+
+    async def _wipe_database(self) -> None:
+        """
+        **DANGEROUS**: Deletes all conversations. Only for testing!
+        """
+        await self.conversations.delete_many({})
+
+
+# Test code
+if __name__ == "__main__":
+    async def run_tests():
+        print("Testing AsyncMongoDBManager")
+        manager = AsyncMongoDBManager(database_name="chai_test_db")
+
+        print("Testing AsyncMongoDBManager.save_conversation()")
+        await manager.save_conversation("test_user", "test_thread", [{"role": "user", "content": "hello world"}])
+
+        print("Testing concurrent AsyncMongoDBManager.append_message()")
+        await asyncio.gather(*(
+            manager.append_message("test_user", "test_thread", {"role": "user", "content": f"message {i}"})
+            for i in range(50)
+        ))
+        retrieved = await manager.get_conversation("test_user", "test_thread")
+        if len(retrieved) == 51:
+            print("Successfully appended messages concurrently!")
+        else:
+            print(f"Failed! Expected 51 messages, got {len(retrieved)}")
+
+        print("Testing AsyncMongoDBManager.get_messages_since()")
+        newer = await manager.get_messages_since("test_user", "test_thread", 49)
+        if [message["seq"] for message in newer] == [50, 51]:
+            print("Successfully fetched only the newer messages!")
+        else:
+            print(f"Failed! Got {newer}")
+
+        print("Testing AsyncMongoDBManager.list_user_threads()")
+        threads = await manager.list_user_threads("test_user")
+        if threads == ["test_thread"]:
+            print(f"Successfully listed threads: {threads}")
+        else:
+            print(f"Failed! Got {threads}")
+
+        print("Cleaning up test data...")
+        await manager._wipe_database()
+        await manager.close()
+        print("All tests passed!")
+
+    asyncio.run(run_tests())
@@ -0,0 +1,113 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+
+
+class ConversationCache:
+    """
+    A least-recently-used cache of parsed conversations, bounded both by number
+    of entries and by approximate size in bytes.
+
+    Each entry is stored with a validator (for example a file's mtime and size).
+    A lookup only hits if the caller's current validator matches the stored one,
+    so conversations changed behind the cache's back are reloaded.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            max_entries (int): Maximum number of cached conversations
+            max_bytes (int): Maximum total approximate size of cached conversations
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # Key: conversation_id => Value: (validator, messages, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, validator: Hashable) -> Optional[List[any]]:
+        """
+        Returns the cached messages for key, or None if they are missing or stale.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != validator:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, validator: Hashable, messages: List[any], size: int) -> None:
+        """
+        Caches messages for key, evicting least recently used entries as needed.
+        Conversations larger than max_bytes are not cached.
+        """
+        with self._lock:
+            self._discard(key)
+            self._store(key, validator, messages, size)
+
+    def extend(self, key: str, expected: Hashable, validator: Hashable, messages: List[any], size: int) -> bool:
+        """
+        Appends messages to the entry for key if it is still cached under the
+        expected validator, and re-keys it under the new validator. Otherwise
+        the entry is dropped. The cached list is extended in place, so callers
+        must copy the lists returned by get() before handing them out.
+
+        Returns:
+            bool: True if the cached entry was extended
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            self._discard(key)
+            if entry is None or entry[0] != expected:
+                return False
+            entry[1].extend(messages)
+            self._store(key, validator, entry[1], entry[2] + size)
+            return True
+
+    def _store(self, key: str, validator: Hashable, messages: List[any], size: int) -> None:
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (validator, messages, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        """
+        Drops any cached entry for key.
+        """
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def clear(self) -> None:
+        """
+        Drops every cached entry. Counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns hit/miss/eviction counters and the current cache occupancy.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
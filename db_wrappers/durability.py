@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# Durability levels accepted by both managers, per manager and per write call.
+# MongoDB maps them to write concerns: w=0, w=1, and w=1 with j=True.
+# Flat files are always handed to the OS before a write returns, so the first
+# two levels behave the same; "durable" also fsyncs before returning.
+FIRE_AND_FORGET = "fire-and-forget"
+ACKNOWLEDGED = "acknowledged"
+DURABLE = "durable"
+DURABILITY_LEVELS = (FIRE_AND_FORGET, ACKNOWLEDGED, DURABLE)
+
+
+def check_durability(level: str) -> str:
+    """
+    Returns level if it is a known durability level, and raises ValueError otherwise.
+    """
+    if level not in DURABILITY_LEVELS:
+        raise ValueError(f"Unknown durability level: {level}")
+    return level
+
+
+def fsync_path(path: str) -> None:
+    """
+    Flushes a file, or a directory's entries, to stable storage.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _Batch:
+    """
+    The files touched by the writers of one group commit, and its outcome.
+    """
+
+    def __init__(self):
+        self.targets: Dict[str, Callable[[], None]] = {}
+        self.done = False
+        self.error: Optional[BaseException] = None
+
+
+class GroupCommitter:
+    """
+    Batches fsyncs across concurrent writers. The first writer to arrive
+    becomes the leader: it waits a short window for others to join, then
+    syncs every file the batch touched once and wakes them all. Writers that
+    arrive while a batch is syncing join the next one.
+    """
+
+    def __init__(self, window: float = 0.002):
+        """
+        Args:
+            window (float): Seconds a leader waits for more writers before syncing
+        """
+        self.window = window
+        self._cond = threading.Condition()
+        self._batch = _Batch()  # The batch new writers join
+        self._syncing = False
+        self.batches = 0
+        self.syncs = 0
+
+    def sync(self, targets: Dict[str, Callable[[], None]]) -> None:
+        """
+        Returns once every target has been synced by a batch that started after
+        this call. Raises the batch's error if one of its syncs failed.
+
+        Args:
+            targets (Dict[str, Callable[[], None]]): Sync functions keyed by what
+                they sync, so each file is only synced once per batch
+        """
+        with self._cond:
+            batch = self._batch
+            batch.targets.update(targets)
+            while not batch.done:
+                if self._syncing:
+                    self._cond.wait()
+                else:
+                    self._lead()
+        if batch.error is not None:
+            raise batch.error
+
+    def _lead(self) -> None:
+        """
+        Syncs the open batch. Called with the condition held, which is released
+        while waiting for more writers and while syncing.
+        """
+        self._syncing = True
+        try:
+            self._cond.release()
+            try:
+                time.sleep(self.window)
+            finally:
+                self._cond.acquire()
+            batch, self._batch = self._batch, _Batch()
+
+            self._cond.release()
+            try:
+                for sync in batch.targets.values():
+                    sync()
+            except BaseException as e:
+                batch.error = e
+            finally:
+                self._cond.acquire()
+            batch.done = True
+            self.batches += 1
+            self.syncs += len(batch.targets)
+        finally:
+            self._syncing = False
+            self._cond.notify_all()
@@ -0,0 +1,209 @@
+import os
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+
+class _KeyState:
+    """
+    Who in this process holds one key: an exclusive owner thread, or shared holder threads.
+    """
+    __slots__ = ("owner", "depth", "shared", "acquiring")
+
+    def __init__(self):
+        self.owner = None  # Thread holding the key exclusively
+        self.depth = 0  # Nested acquisitions by the owner
+        self.shared: Dict[int, int] = {}  # Key: thread => Value: nested shared acquisitions
+        self.acquiring = False  # True while the first shared holder waits for the record lock
+
+    def idle(self) -> bool:
+        return self.owner is None and not self.shared
+
+
+class _ProcessLocks:
+    """
+    The single open descriptor of a lock file in this process, and the
+    threads holding each of its keys. fcntl record locks belong to the
+    process and closing any descriptor of the file drops all of them, so
+    every LockFile on the same path shares one of these.
+    """
+
+    def __init__(self, path: str):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.handles = 0
+        self.keys: Dict[int, _KeyState] = {}
+        self.changed = threading.Condition()
+
+
+# Key: (process ID, real path of the lock file) => Value: its _ProcessLocks. The
+# process ID keeps a forked child, which inherits no record locks, from reusing its parent's.
+_process_locks: Dict[Tuple[int, str], _ProcessLocks] = {}
+_process_locks_lock = threading.Lock()
+
+
+class LockFile:
+    """
+    Advisory cross-process locks on keys (a conversation, or the index),
+    implemented as fcntl record locks on one byte per key of a single lock
+    file. Different keys map to different bytes, so holders of different
+    keys never wait for each other.
+
+    fcntl record locks belong to the process, not the thread, so the threads
+    of one process also take an in-process lock per key, and every LockFile
+    on the same path in a process shares a single descriptor. Two managers in
+    one process therefore exclude each other like two processes do, and
+    closing one does not release the other's locks. Nested acquisitions of a
+    key by the same thread are counted and only the outermost one takes and
+    releases the lock; a nested exclusive acquisition inside a shared one is
+    not supported.
+    """
+
+    def __init__(self, path: str):
+        """
+        Opens (creating if needed) the lock file. The file stays empty; record
+        locks can cover bytes past its end.
+
+        Args:
+            path (str): Path of the lock file
+        """
+        if fcntl is None:
+            raise RuntimeError("File locking needs fcntl, which is not available on this platform")
+        self.path = path
+        self._key = (os.getpid(), os.path.realpath(path))
+        with _process_locks_lock:
+            locks = _process_locks.get(self._key)
+            if locks is None:
+                locks = _process_locks[self._key] = _ProcessLocks(path)
+            locks.handles += 1
+        self._locks = locks
+        self._closed = False
+
+    @staticmethod
+    def offset(key: str) -> int:
+        """
+        Maps a key to the byte that represents it in the lock file.
+        """
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=7).digest(), "big")
+
+    @contextmanager
+    def lock(self, key: str, shared: bool = False) -> Iterator[None]:
+        """
+        Holds the lock for key for the duration of the with block, waiting for
+        other threads and processes that hold it.
+
+        Args:
+            key (str): What to lock
+            shared (bool): If True, other shared holders are allowed at the same time
+        """
+        offset = self.offset(key)
+        if shared:
+            self._acquire_shared(offset)
+        else:
+            self._acquire_exclusive(offset)
+        try:
+            yield
+        finally:
+            self._release(offset)
+
+    def _record_lock(self, offset: int, operation: int) -> None:
+        fcntl.lockf(self._locks.fd, operation, 1, offset, os.SEEK_SET)
+
+    def _acquire_exclusive(self, offset: int) -> None:
+        locks, me = self._locks, threading.get_ident()
+        with locks.changed:
+            state = locks.keys.setdefault(offset, _KeyState())
+            if state.owner == me:
+                state.depth += 1
+                return
+            if me in state.shared:
+                raise RuntimeError("Cannot take an exclusive lock on a key held shared by the same thread")
+            while not state.idle():
+                locks.changed.wait()
+                # The holder may have dropped the idle state; use the current one
+                state = locks.keys.setdefault(offset, _KeyState())
+            state.owner, state.depth = me, 1
+        # Other threads now wait on the in-process state while this one waits for other processes
+        try:
+            self._record_lock(offset, fcntl.LOCK_EX)
+        except BaseException:
+            with locks.changed:
+                state.owner, state.depth = None, 0
+                self._forget_if_idle(offset, state)
+                locks.changed.notify_all()
+            raise
+
+    def _acquire_shared(self, offset: int) -> None:
+        locks, me = self._locks, threading.get_ident()
+        with locks.changed:
+            state = locks.keys.setdefault(offset, _KeyState())
+            if state.owner == me:
+                # Covered by the exclusive lock this thread already holds
+                state.depth += 1
+                return
+            if me in state.shared:
+                state.shared[me] += 1
+                return
+            while state.owner is not None or state.acquiring:
+                locks.changed.wait()
+                state = locks.keys.setdefault(offset, _KeyState())
+            state.shared[me] = 1
+            if len(state.shared) > 1:
+                return
+            state.acquiring = True
+        try:
+            self._record_lock(offset, fcntl.LOCK_SH)
+        except BaseException:
+            with locks.changed:
+                del state.shared[me]
+                state.acquiring = False
+                self._forget_if_idle(offset, state)
+                locks.changed.notify_all()
+            raise
+        with locks.changed:
+            state.acquiring = False
+            locks.changed.notify_all()
+
+    def _release(self, offset: int) -> None:
+        locks, me = self._locks, threading.get_ident()
+        with locks.changed:
+            state = locks.keys[offset]
+            if state.owner == me:
+                state.depth -= 1
+                if state.depth:
+                    return
+                self._record_lock(offset, fcntl.LOCK_UN)
+                state.owner = None
+            else:
+                state.shared[me] -= 1
+                if state.shared[me]:
+                    return
+                del state.shared[me]
+                if state.shared:
+                    return
+                self._record_lock(offset, fcntl.LOCK_UN)
+            self._forget_if_idle(offset, state)
+            locks.changed.notify_all()
+
+    def _forget_if_idle(self, offset: int, state: _KeyState) -> None:
+        if state.idle() and not state.acquiring and self._locks.keys.get(offset) is state:
+            del self._locks.keys[offset]
+
+    def close(self) -> None:
+        """
+        Releases this handle. The lock file is closed, releasing any locks
+        still held, once every LockFile on it in this process is closed.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        with _process_locks_lock:
+            self._locks.handles -= 1
+            if self._locks.handles == 0:
+                del _process_locks[self._key]
+                os.close(self._locks.fd)
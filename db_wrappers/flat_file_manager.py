@@ -1,7 +1,42 @@
 import os
+import sys
 import json
+import bisect
+import mmap
 import shutil
-from typing import List
+import multiprocessing
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+if __package__ in (None, ""):
+    # Run as a script (python db_wrappers/flat_file_manager.py): make the db_wrappers package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_wrappers.conversation_cache import ConversationCache
+from db_wrappers.durability import ACKNOWLEDGED, DURABLE, GroupCommitter, check_durability, fsync_path
+from db_wrappers.file_lock import LockFile
+from db_wrappers.metrics import BYTES_READ, BYTES_WRITTEN, CACHE_HITS, CACHE_MISSES, MetricsRegistry, timed
+from db_wrappers.profiling import DESERIALIZE, IO, SERIALIZE, phase
+from db_wrappers.search_index import SEARCH_JOURNAL_FILENAME, SearchIndex
+from db_wrappers.sorted_index import SortedIndex
+from db_wrappers.segment_store import (MAX_RECORD_EXTENTS, SEGMENT_DIRNAME, SegmentStore, format_locator,
+                                        format_locators, parse_locators)
+
+JSONL_EXTENSION = ".jsonl"
+INDEX_FILENAME = "conversations.json"
+SORTED_INDEX_FILENAME = "conversations.idx"
+INDEX_JOURNAL_FILENAME = "conversations.journal"
+LOCK_FILENAME = "conversations.lock"
+
+# Lock key of the index; every other key is a conversation ID
+INDEX_LOCK_KEY = "\0index"
+
+# Field stored on each JSONL line holding the message's sequence number in its thread
+SEQ_FIELD = "_seq"
+# Key under which get_messages_since() returns each message's sequence number
+SEQUENCE_FIELD = "seq"
 
 
 class FlatFileManager:
@@ -9,18 +44,107 @@ class FlatFileManager:
     Manages storing and retrieving chat conversations in flat JSON files.
     """
 
-    def __init__(self, storage_dir="data"):
+    # Backend label of the metrics this manager reports
+    metrics_backend = "flat_file"
+
+    def __init__(self, storage_dir="data", checkpoint_interval: int = 1000, index_format: str = "json",
+                 storage_mode: str = "files", max_segment_size: int = 64 * 1024 * 1024,
+                 compaction_interval: Optional[float] = None, compaction_threshold: float = 0.5,
+                 cache_entries: int = 0, cache_bytes: int = 64 * 1024 * 1024, read_workers: int = 8,
+                 durability: str = ACKNOWLEDGED, group_commit: bool = False, group_commit_window: float = 0.002,
+                 multiprocess: bool = False, full_text_search: bool = False,
+                 metrics: Optional[MetricsRegistry] = None):
         """
         Initializes the FlatFileManager for a specific user.
 
         Args:
             storage_dir (str): The unique identifier for the user.
+            checkpoint_interval (int): Number of journaled index changes after which
+                the full index is checkpointed to conversations.json
+            index_format (str): "json" loads conversations.json into a dict at startup.
+                "sorted" memory-maps conversations.idx and binary-searches it on lookup,
+                so startup does not depend on the number of conversations. An index
+                saved in the other format is converted on open; processes sharing a
+                directory in multiprocess mode should all use the same format.
+            storage_mode (str): "files" stores each conversation in its own file.
+                "segments" packs conversations into large append-only segment files
+                and indexes them by (segment, offset, length).
+            max_segment_size (int): Size in bytes after which a new segment is started
+            compaction_interval (Optional[float]): If set, seconds between background
+                compaction passes in segment mode
+            compaction_threshold (float): Sealed segments whose live data falls below
+                this fraction of their size are compacted
+            cache_entries (int): If greater than zero, keep up to this many parsed
+                conversations in an LRU cache in front of get_conversation()
+            cache_bytes (int): Approximate on-disk size limit for the cache
+            read_workers (int): Number of threads get_conversations() reads with
+            durability (str): Default durability of writes, overridable per call.
+                "fire-and-forget" and "acknowledged" return once the data is handed
+                to the OS. "durable" also fsyncs the conversation (and the index
+                journal and directory when the index changed) before returning.
+            group_commit (bool): If True, durable writes from concurrent threads
+                share their fsyncs; see GroupCommitter
+            group_commit_window (float): Seconds a group commit waits for more writers
+            multiprocess (bool): If True, several processes may share storage_dir.
+                Writers lock the conversation they change and the index with fcntl
+                advisory locks, so processes writing different conversations never
+                wait for each other, and every process picks up the index changes
+                the others journal. Threads of one process still write one at a
+                time, but only once they hold their conversation's lock. Only
+                supported in "files" storage mode.
+            full_text_search (bool): If True, maintain an inverted index of message
+                contents next to the conversations index for search(). It is built
+                from the conversation files the first time it is enabled; writes
+                made by managers without it call for rebuild_search_index().
+            metrics (Optional[MetricsRegistry]): If set, report operation latencies and
+                errors, bytes read from and written to conversation files and
+                segments, and cache hits to this registry
         """
+        self.metrics = metrics
+        if index_format not in ("json", "sorted"):
+            raise ValueError(f"Unknown index format: {index_format}")
+        if storage_mode not in ("files", "segments"):
+            raise ValueError(f"Unknown storage mode: {storage_mode}")
+        if multiprocess and storage_mode != "files":
+            raise ValueError("Multiprocess mode is only supported in the files storage mode")
+        if multiprocess and full_text_search:
+            raise ValueError("Full-text search is not supported in multiprocess mode")
+        self.durability = check_durability(durability)
+        self._group_committer = GroupCommitter(group_commit_window) if group_commit else None
+        self._storage_dir_synced = False
         self.storage_dir = storage_dir
+        self.checkpoint_interval = checkpoint_interval
+        self.index_format = index_format
+        self.storage_mode = storage_mode
+        self.compaction_threshold = compaction_threshold
         self._ensure_storage_exists()
+        self._locks = LockFile(os.path.join(storage_dir, LOCK_FILENAME)) if multiprocess else None
         self.conversations_index = {}  # Key: conversation_id => Value: Filepath
+        self._journal_entries = 0  # Index changes not yet folded into a checkpoint
+        self._journal_inode = None  # Identifies the journal file the index was replayed from
+        self._journal_offset = 0  # Bytes of that journal already applied
         self._init_index()
 
+        self.cache = ConversationCache(cache_entries, cache_bytes) if cache_entries > 0 else None
+        self._lock = threading.RLock()
+        self.read_workers = read_workers
+        self._read_pool = None  # Created by the first get_conversations()
+        self.segments = None
+        self._compaction_thread = None
+        self._stop_compaction = threading.Event()
+        if storage_mode == "segments":
+            self.segments = SegmentStore(os.path.join(self.storage_dir, SEGMENT_DIRNAME), max_segment_size)
+            if compaction_interval is not None:
+                self._compaction_thread = threading.Thread(
+                    target=self._compaction_loop, args=(compaction_interval,), daemon=True)
+                self._compaction_thread.start()
+
+        self.search_index = None
+        if full_text_search:
+            self.search_index = SearchIndex(self.storage_dir, checkpoint_interval)
+            if not self.search_index.exists():
+                self.rebuild_search_index()
+
     def _ensure_storage_exists(self) -> None:
         """
         --- TODO 1: Create the storage directory ---
@@ -37,15 +161,172 @@ class FlatFileManager:
         2 - If DNE, the create and save to disk using self.save_index()
         3 - Load the contents of conversations.json into self.conversations_index dictionary
         """
-        index_file = os.path.join(self.storage_dir, "conversations.json")
+        with self._index_lock():
+            self._load_index_checkpoint()
+            self._replay_index_journal()
+
+    def _load_index_checkpoint(self) -> None:
+        """
+        Loads the last index checkpoint, creating an empty one if none exists.
+
+        Both index formats share the journal, so a storage directory holds a
+        single checkpoint and its filename records its format. A checkpoint in
+        the other format is converted, together with the journal that applies
+        to it, and then removed.
+        """
+        if isinstance(self.conversations_index, SortedIndex):
+            self.conversations_index.close()
+        self._journal_inode = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        index_file = os.path.join(self.storage_dir, INDEX_FILENAME)
+        sorted_index_file = os.path.join(self.storage_dir, SORTED_INDEX_FILENAME)
+        if self.index_format == "sorted":
+            checkpoint_file, other_file = sorted_index_file, index_file
+        else:
+            checkpoint_file, other_file = index_file, sorted_index_file
 
-        if not os.path.exists(index_file):
+        if not os.path.exists(checkpoint_file) and os.path.exists(other_file):
+            self._convert_index_checkpoint(other_file)
+            return
+        if os.path.exists(other_file):
+            # Left behind by a conversion interrupted after the new checkpoint was written
+            os.remove(other_file)
+
+        if self.index_format == "sorted":
+            self.conversations_index = SortedIndex(sorted_index_file)
+        elif not os.path.exists(index_file):
             self.conversations_index = {}
-            self.save_index()
+            self._write_index_checkpoint()
         else:
             with open(index_file, 'r') as f:
                 self.conversations_index = json.load(f)
 
+    def _convert_index_checkpoint(self, other_file: str) -> None:
+        """
+        Loads the checkpoint in the other index format and its journal, writes
+        them as a checkpoint in this manager's format, and removes the old one.
+        The old checkpoint is only removed once the new one and its empty
+        journal are in place, so an interrupted conversion starts over.
+        """
+        if other_file.endswith(SORTED_INDEX_FILENAME):
+            old_index = SortedIndex(other_file)
+            self.conversations_index = dict(old_index.items())
+            old_index.close()
+        else:
+            with open(other_file, 'r') as f:
+                self.conversations_index = json.load(f)
+        self._replay_index_journal()
+        if self.index_format == "sorted":
+            entries = self.conversations_index
+            self.conversations_index = SortedIndex(os.path.join(self.storage_dir, SORTED_INDEX_FILENAME))
+            self.conversations_index.update(entries)
+        self._write_index_checkpoint()
+        os.remove(other_file)
+
+    def _replay_index_journal(self) -> None:
+        """
+        Applies the index changes recorded in the journal since the last checkpoint
+        that have not been applied yet. Each journal line is
+        {"id": conversation_id, "path": relative_filepath}, where a null path
+        removes the entry. A torn final line is left for a later replay.
+        """
+        journal_file = os.path.join(self.storage_dir, INDEX_JOURNAL_FILENAME)
+        try:
+            f = open(journal_file, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            self._journal_inode = os.fstat(f.fileno()).st_ino
+            f.seek(self._journal_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                entry = json.loads(line)
+                if entry["path"] is None:
+                    self.conversations_index.pop(entry["id"], None)
+                else:
+                    self.conversations_index[entry["id"]] = entry["path"]
+                self._journal_offset += len(line)
+                self._journal_entries += 1
+
+    def _refresh_index(self) -> None:
+        """
+        In multiprocess mode, catches up with the index changes other processes
+        journaled since this one last looked. A journal with a new inode means
+        another process checkpointed the index, which is then reloaded. The
+        common case, where nothing changed, costs a single stat() call.
+        """
+        if self._locks is None:
+            return
+        journal_file = os.path.join(self.storage_dir, INDEX_JOURNAL_FILENAME)
+        try:
+            stat = os.stat(journal_file)
+        except FileNotFoundError:
+            return
+        if stat.st_ino == self._journal_inode and stat.st_size == self._journal_offset:
+            return
+        with self._index_lock(shared=True):
+            try:
+                stat = os.stat(journal_file)
+            except FileNotFoundError:
+                return
+            if stat.st_ino != self._journal_inode:
+                self._load_index_checkpoint()
+            self._replay_index_journal()
+
+    def _index_lock(self, shared: bool = False):
+        """
+        Returns a context manager holding the cross-process index lock in
+        multiprocess mode, and doing nothing otherwise. The caller holds self._lock.
+        """
+        if self._locks is None:
+            return nullcontext()
+        return self._locks.lock(INDEX_LOCK_KEY, shared=shared)
+
+    def _conversation_lock(self, conversation_id: str):
+        """
+        Returns a context manager holding the cross-process lock of one
+        conversation in multiprocess mode, and doing nothing otherwise. Taken
+        before self._lock and the index lock, so a thread waiting for another
+        process's writer does not hold up this process's other threads.
+        """
+        if self._locks is None:
+            return nullcontext()
+        return self._locks.lock(conversation_id)
+
+    def _update_index(self, conversation_id: str, relative_filepath: Optional[str]) -> None:
+        """
+        Records a single index change. Nothing is written if the entry is unchanged;
+        otherwise the change is appended to the index journal, and the index is
+        checkpointed once checkpoint_interval changes have accumulated.
+
+        Args:
+            conversation_id (str): The conversation whose entry changed
+            relative_filepath (Optional[str]): The new filepath, or None to remove the entry
+        """
+        with self._index_lock():
+            # Apply other processes' changes first, so ours lands after them in the journal
+            self._refresh_index()
+            if self.conversations_index.get(conversation_id) == relative_filepath:
+                return
+
+            if relative_filepath is None:
+                del self.conversations_index[conversation_id]
+            else:
+                self.conversations_index[conversation_id] = relative_filepath
+
+            journal_file = os.path.join(self.storage_dir, INDEX_JOURNAL_FILENAME)
+            line = (json.dumps({"id": conversation_id, "path": relative_filepath}) + "\n").encode("utf-8")
+            with phase(IO), open(journal_file, 'ab') as f:
+                f.write(line)
+                self._journal_inode = os.fstat(f.fileno()).st_ino
+            self._journal_offset += len(line)
+            self._journal_entries += 1
+
+            if self._journal_entries >= self.checkpoint_interval:
+                self.save_index()
+
     def save_index(self) -> None:
         """
         --- TODO 3: Save the conversations index to disk ---
@@ -53,12 +334,94 @@ class FlatFileManager:
         to the conversations.json file in the storage directory.
         Ensure the JSON is human-readable by using proper formatting.
         Hint: Use json.dump() with the 'indent' parameter for readable formatting.
+
+        The checkpoint is written to a temporary file and renamed over
+        conversations.json, so a crash never leaves a half-written index.
+        The journal is only replaced by an empty one after the rename; replaying
+        it over the new checkpoint is harmless. The new journal file has a new
+        inode, which tells other processes to reload the checkpoint.
         """
-        index_file = os.path.join(self.storage_dir, "conversations.json")
-        with open(index_file, 'w') as f:
-            json.dump(self.conversations_index, f, indent=2)
+        with self._index_lock():
+            self._refresh_index()
+            self._write_index_checkpoint()
 
-    def get_conversation(self, conversation_id: str) -> List[any]:
+    def _write_index_checkpoint(self) -> None:
+        """
+        Writes the index checkpoint and starts an empty journal. The caller
+        holds the index lock.
+        """
+        if self.index_format == "sorted":
+            self.conversations_index.checkpoint()
+        else:
+            index_file = os.path.join(self.storage_dir, INDEX_FILENAME)
+            tmp_file = index_file + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(self.conversations_index, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, index_file)
+
+        journal_file = os.path.join(self.storage_dir, INDEX_JOURNAL_FILENAME)
+        tmp_file = journal_file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            self._journal_inode = os.fstat(f.fileno()).st_ino
+        os.replace(tmp_file, journal_file)
+        self._journal_offset = 0
+        self._journal_entries = 0
+
+    @staticmethod
+    def _is_jsonl(relative_filepath: str) -> bool:
+        """
+        Returns True if the conversation file uses the append-only JSONL format
+        (one message per line) rather than a single pretty-printed JSON array.
+        """
+        return relative_filepath.endswith(JSONL_EXTENSION)
+
+    @staticmethod
+    def _read_jsonl(f) -> List[any]:
+        """
+        Parses an open JSONL conversation file into a list of messages.
+        A torn final line (a crash in the middle of an append) is ignored.
+        """
+        with phase(IO):
+            lines = f.readlines()
+        if lines and not lines[-1].endswith("\n"):
+            # Partial write at the tail of the file, never acknowledged
+            lines.pop()
+        with phase(DESERIALIZE):
+            return [FlatFileManager._decode_jsonl(line) for line in lines if line.strip()]
+
+    @staticmethod
+    def _encode_jsonl(message: any, seq: Optional[int] = None) -> str:
+        """
+        Encodes a single message as one compact JSONL record, stamped with its
+        sequence number if one is given.
+        """
+        if seq is not None:
+            message = {**message, SEQ_FIELD: seq}
+        return json.dumps(message, separators=(",", ":")) + "\n"
+
+    @staticmethod
+    def _decode_jsonl(line) -> any:
+        """
+        Parses one JSONL record back into the message that was saved.
+        """
+        message = json.loads(line)
+        if isinstance(message, dict):
+            message.pop(SEQ_FIELD, None)
+        return message
+
+    @staticmethod
+    def _parse_jsonl_bytes(data: bytes) -> List[any]:
+        """
+        Parses a JSONL record read from a segment into a list of messages.
+        """
+        with phase(DESERIALIZE):
+            return [FlatFileManager._decode_jsonl(line) for line in data.split(b"\n") if line]
+
+    @timed("get_conversation")
+    def get_conversation(self, conversation_id: str,
+                         limit: Optional[int] = None, before: Optional[int] = None) -> List[any]:
         """
         --- TODO 4: Retrieve a user's conversation ---
         1 - Find the filepath in the conversations index
@@ -67,20 +430,469 @@ class FlatFileManager:
             - If the file exists, load the JSON data and return it.
             - If the file does not exist it should return an empty list `[]` without raising an error.
             Hint: Use a try-except block to handle error case.
+
+        Args:
+            conversation_id (str): The conversation to read
+            limit (Optional[int]): If set, return at most this many messages, ending
+                at `before` (or at the end of the conversation)
+            before (Optional[int]): If set, only return messages at positions before this one
+
+        Paginated reads of JSONL and segment-backed conversations only parse the
+        requested lines; a tail read (limit without before) seeks backwards from
+        the end of the file instead of reading it all.
+        """
+        paginated = limit is not None or before is not None
+
+        with self._lock:
+            self._refresh_index()
+            relative_filepath = self.conversations_index.get(conversation_id)
+            if relative_filepath is None:
+                return []
+
+            locations = parse_locators(relative_filepath)
+            if locations is not None:
+                # Record contents never change for a given locator
+                cached = self._cache_get(conversation_id, relative_filepath)
+                if cached is not None:
+                    return self._slice_messages(cached, limit, before)
+                if paginated:
+                    read_at, length = self._record_reader(locations)
+                    return self._read_jsonl_page(read_at, 0, length, limit, before)
+                data = self.segments.read_extents(locations)
+                self._count(BYTES_READ, len(data))
+                messages = self._parse_jsonl_bytes(data)
+                self._cache_put(conversation_id, relative_filepath, messages, len(data))
+                return list(messages)
+
+        filepath = os.path.join(self.storage_dir, relative_filepath)
+        if self.cache is None:
+            if paginated and self._is_jsonl(filepath):
+                return self._read_jsonl_file_page(filepath, limit, before)
+            return self._slice_messages(self._read_conversation_file(filepath), limit, before)
+
+        # Stat before reading, so a concurrent change can only make the entry look stale
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            return []
+        validator = (relative_filepath, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = self._cache_get(conversation_id, validator)
+        if cached is None:
+            if paginated and self._is_jsonl(filepath):
+                return self._read_jsonl_file_page(filepath, limit, before)
+            cached = self._read_conversation_file(filepath)
+            self._cache_put(conversation_id, validator, cached, stat.st_size)
+        return self._slice_messages(cached, limit, before)
+
+    @timed("get_conversations")
+    def get_conversations(self, conversation_ids: List[str], limit: Optional[int] = None) -> Dict[str, List[any]]:
+        """
+        Retrieves several conversations at once, for example to fill a dashboard
+        of a user's recent threads. The files are opened and parsed in parallel
+        on a pool of read_workers threads instead of one after another. JSON
+        parsing holds the GIL, so the gain comes from overlapping file reads on
+        cold or networked storage; files already in the page cache load at about
+        the same speed as with get_conversation() calls.
+
+        Args:
+            conversation_ids (List[str]): The conversations to read
+            limit (Optional[int]): If set, only return the last `limit` messages of each
+
+        Returns:
+            Dict[str, List[any]]: Messages keyed by conversation ID, in the order
+            requested. Missing conversations map to an empty list.
+        """
+        conversation_ids = list(dict.fromkeys(conversation_ids))
+        if len(conversation_ids) <= 1:
+            return {conversation_id: self.get_conversation(conversation_id, limit=limit)
+                    for conversation_id in conversation_ids}
+        with self._lock:
+            if self._read_pool is None:
+                self._read_pool = ThreadPoolExecutor(max_workers=self.read_workers,
+                                                     thread_name_prefix="flat-file-read")
+        results = self._read_pool.map(lambda conversation_id: self.get_conversation(conversation_id, limit=limit),
+                                      conversation_ids)
+        return dict(zip(conversation_ids, results))
+
+    def iter_messages(self, conversation_id: str) -> Iterator[any]:
+        """
+        Yields the messages of a conversation one at a time instead of building
+        the whole list. JSONL files and segment records are memory-mapped and
+        parsed line by line, so memory use does not grow with the conversation.
+        Legacy .json conversations are loaded in full; migrate them with
+        migrate_to_jsonl() to stream them.
+
+        Args:
+            conversation_id (str): The conversation to read
+        """
+        with self._lock:
+            self._refresh_index()
+            relative_filepath = self.conversations_index.get(conversation_id)
+            if relative_filepath is None:
+                return
+            locations = parse_locators(relative_filepath)
+            if locations is not None:
+                cached = self._cache_get(conversation_id, relative_filepath)
+                if cached is None:
+                    extents = [(self.segments.map_segment(segment), start, start + length)
+                               for segment, start, length in locations]
+
+        if locations is not None:
+            if cached is not None:
+                yield from list(cached)
+                return
+            for mapped, start, end in extents:
+                if mapped is not None:
+                    with mapped:
+                        yield from self._iter_mapped_messages(mapped, start, end)
+            return
+
+        filepath = os.path.join(self.storage_dir, relative_filepath)
+        if not self._is_jsonl(filepath):
+            yield from self.get_conversation(conversation_id)
+            return
+
+        try:
+            f = open(filepath, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield from self._iter_mapped_messages(mapped, 0, size)
+
+    @timed("get_messages_since")
+    def get_messages_since(self, conversation_id: str, seq: int) -> List[any]:
+        """
+        Returns only the messages added to a conversation after sequence number
+        seq, so a client that already holds the conversation can catch up
+        without reading it again. Pass 0 to fetch everything.
+
+        Each JSONL line is stamped with its sequence number when it is written:
+        appends take the next number of the thread, and save_conversation()
+        numbers the rewritten messages after all earlier ones. The conversation
+        is read backwards from its end and parsing stops at the first message
+        the client already has, so the cost depends on the number of new
+        messages rather than the length of the conversation. Lines written
+        before sequence numbers existed, and legacy .json conversations, are
+        numbered by position. The numbers live on the messages themselves, so a
+        conversation saved with no messages starts again from 1, like a
+        deleted one.
+
+        Args:
+            conversation_id (str): The conversation to read
+            seq (int): The highest sequence number the client already has
+
+        Returns:
+            List[any]: The newer messages in order, each with its number under "seq"
+        """
+        with self._lock:
+            self._refresh_index()
+            relative_filepath = self.conversations_index.get(conversation_id)
+            if relative_filepath is None:
+                return []
+            locations = parse_locators(relative_filepath)
+            if locations is not None:
+                read_at, length = self._record_reader(locations)
+                return self._read_since(read_at, 0, length, seq)
+
+        filepath = os.path.join(self.storage_dir, relative_filepath)
+        if not self._is_jsonl(filepath):
+            messages = self._read_conversation_file(filepath)
+            return [{**message, SEQUENCE_FIELD: position + 1}
+                    for position, message in enumerate(messages) if position + 1 > seq]
+        try:
+            with open(filepath, 'rb') as f:
+                return self._read_since(self._file_reader(f), 0, os.fstat(f.fileno()).st_size, seq)
+        except FileNotFoundError:
+            return []
+
+    def _read_since(self, read_at, start: int, end: int, seq: int) -> List[any]:
+        """
+        Parses the lines of a JSONL byte range whose sequence numbers are above
+        seq, newest first, stopping at the first older line.
+        """
+        newer = []
+        for line in self._iter_lines_reversed(read_at, start, end):
+            message = json.loads(line)
+            message_seq = message.pop(SEQ_FIELD, None)
+            if message_seq is None:
+                # Unnumbered lines predate sequence numbers; number everything by position
+                numbered = []
+                for position, line in enumerate(self._iter_lines(read_at, start, end)):
+                    message = json.loads(line)
+                    message[SEQUENCE_FIELD] = message.pop(SEQ_FIELD, position + 1)
+                    numbered.append(message)
+                return [message for message in numbered if message[SEQUENCE_FIELD] > seq]
+            if message_seq <= seq:
+                break
+            message[SEQUENCE_FIELD] = message_seq
+            newer.append(message)
+        newer.reverse()
+        return newer
+
+    def _last_seq(self, conversation_id: str) -> int:
+        """
+        Returns the sequence number of the last message of a conversation, or 0
+        if it has none. Only the end of a JSONL conversation is read. The caller
+        holds self._lock, so the next number cannot be handed out twice.
+        """
+        relative_filepath = self.conversations_index.get(conversation_id)
+        if relative_filepath is None:
+            return 0
+        locations = parse_locators(relative_filepath)
+        if locations is not None:
+            read_at, length = self._record_reader(locations)
+            return self._last_seq_in(read_at, 0, length)
+
+        filepath = os.path.join(self.storage_dir, relative_filepath)
+        if not self._is_jsonl(filepath):
+            return len(self._read_conversation_file(filepath))
+        try:
+            with open(filepath, 'rb') as f:
+                return self._last_seq_in(self._file_reader(f), 0, os.fstat(f.fileno()).st_size)
+        except FileNotFoundError:
+            return 0
+
+    def _last_seq_in(self, read_at, start: int, end: int) -> int:
+        """
+        Returns the sequence number of the last line of a JSONL byte range.
+        """
+        for line in self._iter_lines_reversed(read_at, start, end, chunk_size=4096):
+            message = json.loads(line)
+            if isinstance(message, dict) and SEQ_FIELD in message:
+                return message[SEQ_FIELD]
+            # Written before sequence numbers existed, so numbered by position
+            return sum(1 for _ in self._iter_lines(read_at, start, end))
+        return 0
+
+    @staticmethod
+    def _iter_mapped_messages(mapped: mmap.mmap, start: int, end: int) -> Iterator[any]:
+        """
+        Parses the complete JSONL lines of a memory-mapped byte range one at a time.
+        """
+        position = start
+        while position < end:
+            newline = mapped.find(b"\n", position, end)
+            if newline == -1:
+                # Torn final line
+                return
+            if newline > position:
+                yield FlatFileManager._decode_jsonl(mapped[position:newline])
+            position = newline + 1
+
+    @staticmethod
+    def _slice_messages(messages: List[any], limit: Optional[int], before: Optional[int]) -> List[any]:
+        """
+        Returns a new list holding the requested page of messages.
+        """
+        end = len(messages) if before is None else before
+        start = 0 if limit is None else max(0, end - limit)
+        return messages[start:end]
+
+    def _read_jsonl_file_page(self, filepath: str, limit: Optional[int], before: Optional[int]) -> List[any]:
+        """
+        Reads a page of messages from a JSONL conversation file.
+        """
+        try:
+            with open(filepath, 'rb') as f:
+                return self._read_jsonl_page(self._file_reader(f), 0, os.fstat(f.fileno()).st_size, limit, before)
+        except FileNotFoundError:
+            return []
+
+    def _file_reader(self, f):
+        """
+        Returns a read_at(position, size) callable over an open binary file.
+        """
+        def read_at(position, size):
+            with phase(IO):
+                f.seek(position)
+                data = f.read(size)
+            self._count(BYTES_READ, len(data))
+            return data
+        return read_at
+
+    def _record_reader(self, locations: List[Tuple[int, int, int]]):
+        """
+        Returns a read_at(position, size) callable over a segment record, whose
+        extents read as one contiguous byte range, and the record's length.
         """
-        if conversation_id not in self.conversations_index:
+        starts = []
+        length = 0
+        for _, _, extent_length in locations:
+            starts.append(length)
+            length += extent_length
+
+        def read_at(position, size):
+            chunks = []
+            index = bisect.bisect_right(starts, position) - 1
+            while size > 0 and index < len(locations):
+                segment, offset, extent_length = locations[index]
+                skip = position - starts[index]
+                chunk = self.segments.read(segment, offset + skip, min(size, extent_length - skip))
+                chunks.append(chunk)
+                position += len(chunk)
+                size -= len(chunk)
+                index += 1
+            data = b"".join(chunks)
+            self._count(BYTES_READ, len(data))
+            return data
+        return read_at, length
+
+    def _read_jsonl_page(self, read_at, start: int, end: int,
+                         limit: Optional[int], before: Optional[int]) -> List[any]:
+        """
+        Parses only the requested page of a JSONL byte range.
+
+        Args:
+            read_at: Callable (position, size) -> bytes reading from the backing file
+            start (int): Offset of the first byte of the conversation
+            end (int): Offset just past the last byte of the conversation
+        """
+        if limit == 0:
             return []
+        if before is None:
+            lines = self._tail_lines(read_at, start, end, limit)
+        else:
+            first = 0 if limit is None else max(0, before - limit)
+            lines = []
+            for position, line in enumerate(self._iter_lines(read_at, start, end)):
+                if position >= before:
+                    break
+                if position >= first:
+                    lines.append(line)
+        with phase(DESERIALIZE):
+            return [self._decode_jsonl(line) for line in lines]
+
+    @staticmethod
+    def _iter_lines(read_at, start: int, end: int, chunk_size: int = 64 * 1024):
+        """
+        Yields the complete, non-empty lines of a byte range, reading forwards in chunks.
+        A torn final line is not yielded.
+        """
+        position = start
+        pending = b""
+        while position < end:
+            chunk = read_at(position, min(chunk_size, end - position))
+            if not chunk:
+                break
+            position += len(chunk)
+            lines = (pending + chunk).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                if line:
+                    yield line
+
+    @staticmethod
+    def _tail_lines(read_at, start: int, end: int, count: int, chunk_size: int = 64 * 1024) -> List[bytes]:
+        """
+        Returns the last `count` complete lines of a byte range by reading
+        backwards from the end until enough newlines have been seen.
+        """
+        chunks = []
+        newlines = 0
+        position = end
+        while position > start and newlines <= count:
+            size = min(chunk_size, position - start)
+            position -= size
+            chunk = read_at(position, size)
+            chunks.append(chunk)
+            newlines += chunk.count(b"\n")
+        lines = b"".join(reversed(chunks)).split(b"\n")
+        lines.pop()  # Bytes after the final newline are a torn write (or empty)
+        if position > start:
+            lines = lines[1:]  # The first line may have been cut by the seek
+        return [line for line in lines if line][-count:]
+
+    @staticmethod
+    def _iter_lines_reversed(read_at, start: int, end: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """
+        Yields the complete, non-empty lines of a byte range from last to first,
+        reading backwards in chunks. A torn final line is not yielded.
+        """
+        position = end
+        pending = None  # Bytes after the last newline seen so far
+        while position > start:
+            size = min(chunk_size, position - start)
+            position -= size
+            lines = read_at(position, size).split(b"\n")
+            if pending is not None:
+                lines[-1] += pending
+                pending = None
+            else:
+                lines.pop()  # Torn write (or empty) after the final newline
+                if not lines:
+                    continue
+            pending = lines[0]
+            for line in reversed(lines[1:]):
+                if line:
+                    yield line
+        if pending:
+            yield pending
+
+    def _cache_get(self, conversation_id: str, validator) -> Optional[List[any]]:
+        """
+        Looks up a conversation in the cache, if caching is enabled.
+        """
+        if self.cache is None:
+            return None
+        cached = self.cache.get(conversation_id, validator)
+        self._count(CACHE_MISSES if cached is None else CACHE_HITS)
+        return cached
 
-        filepath = os.path.join(self.storage_dir, self.conversations_index[conversation_id])
+    def _cache_put(self, conversation_id: str, validator, messages: List[any], size: int) -> None:
+        """
+        Stores a fully parsed conversation in the cache, if caching is enabled.
+        """
+        if self.cache is not None:
+            self.cache.put(conversation_id, validator, messages, size)
 
+    def _read_conversation_file(self, filepath: str) -> List[any]:
+        """
+        Reads a .json or .jsonl conversation file, or returns [] if it is missing.
+        """
         try:
             with open(filepath, 'r') as f:
-                messages = json.load(f)
-            return messages
+                if self._is_jsonl(filepath):
+                    messages = self._read_jsonl(f)
+                    if self.metrics is not None:
+                        self._count(BYTES_READ, f.buffer.tell())
+                    return messages
+                with phase(IO):
+                    data = f.read()
+                if self.metrics is not None:
+                    self._count(BYTES_READ, f.buffer.tell())
+            with phase(DESERIALIZE):
+                return json.loads(data)
         except FileNotFoundError:
             return []
 
-    def save_conversation(self, conversation_id: str, relative_filepath: str, messages: List[any]) -> None:
+    def _count(self, name: str, amount: int = 1) -> None:
+        """
+        Adds amount to a metrics counter, if metrics are enabled.
+        """
+        if self.metrics is not None:
+            self.metrics.increment(self.metrics_backend, name, amount)
+
+    def _invalidate_cache(self, conversation_id: str) -> None:
+        """
+        Drops a conversation from the cache after this manager writes to it.
+        """
+        if self.cache is not None:
+            self.cache.invalidate(conversation_id)
+
+    def cache_stats(self) -> dict:
+        """
+        Returns the conversation cache's hit/miss/eviction counters, or an empty
+        dict if caching is disabled.
+        """
+        return self.cache.stats() if self.cache is not None else {}
+
+    @timed("save_conversation")
+    def save_conversation(self, conversation_id: str, relative_filepath: str, messages: List[any],
+                          durability: Optional[str] = None) -> None:
         """
         --- TODO 5: Save a user's conversation ---
         1 - Add the conversation ID and filepath to self.conversation_index
@@ -90,17 +902,384 @@ class FlatFileManager:
             This method should overwrite the entire file with the new contents of the `messages` list.
             - Use JSON formatting to make the file human-readable (e.g., indentation).
             Hint: Use `json.dump()` with the `indent` parameter.
+
+        Args:
+            durability (Optional[str]): Overrides the manager's durability for this write
         """
-        # Add to index
-        self.conversations_index[conversation_id] = relative_filepath
+        level = check_durability(durability or self.durability)
+        self._invalidate_cache(conversation_id)
+        if self.storage_mode == "segments":
+            # relative_filepath is not used; the record location is indexed instead
+            with self._lock:
+                first_seq = self._last_seq(conversation_id) + 1
+                with phase(SERIALIZE):
+                    data = "".join(self._encode_jsonl(message, first_seq + offset)
+                                   for offset, message in enumerate(messages)).encode("utf-8")
+                self._update_index(conversation_id, format_locator(*self.segments.append(data)))
+                self._count(BYTES_WRITTEN, len(data))
+                self._index_for_search(conversation_id, first_seq, messages, replace=True)
+            self._make_durable(level, segments=True, index_changed=True)
+            return
 
-        # Save index to disk
-        self.save_index()
+        with self._conversation_lock(conversation_id), self._lock:
+            self._refresh_index()
+            # Rewritten messages are numbered after every message handed out before
+            first_seq = self._last_seq(conversation_id) + 1 if self._is_jsonl(relative_filepath) else None
 
-        # Save conversation to disk
-        filepath = os.path.join(self.storage_dir, relative_filepath)
-        with open(filepath, 'w') as f:
-            json.dump(messages, f, indent=2)
+            # Add to index (journaled, and only if the entry changed)
+            index_changed = self.conversations_index.get(conversation_id) != relative_filepath
+            self._update_index(conversation_id, relative_filepath)
+
+            # Save conversation to a temporary file and rename it over the old one,
+            # so readers (in any process) see either the old or the new conversation
+            filepath = os.path.join(self.storage_dir, relative_filepath)
+            tmp_filepath = f"{filepath}.{os.getpid()}.tmp"
+            with phase(SERIALIZE):
+                if first_seq is not None:
+                    data = "".join(self._encode_jsonl(message, first_seq + offset)
+                                   for offset, message in enumerate(messages))
+                else:
+                    data = json.dumps(messages, indent=2)
+            with phase(IO):
+                with open(tmp_filepath, 'w') as f:
+                    f.write(data)
+                    if level == DURABLE:
+                        # The data must be on disk before the rename can expose it
+                        f.flush()
+                        os.fsync(f.fileno())
+                os.replace(tmp_filepath, filepath)
+            # The encoders escape non-ASCII characters, so characters are bytes
+            self._count(BYTES_WRITTEN, len(data))
+            self._index_for_search(conversation_id, first_seq or 1, messages, replace=True)
+        self._make_durable(level, directories=[os.path.dirname(filepath)], index_changed=index_changed)
+
+    @timed("append_message")
+    def append_message(self, conversation_id: str, message: any, durability: Optional[str] = None) -> None:
+        """
+        Appends a single message to a conversation without rewriting it.
+
+        Conversations stored in the JSONL format only need the new line written
+        to the end of the file, so the cost of an append does not depend on the
+        length of the conversation. Legacy .json conversations are migrated to
+        JSONL the first time they are appended to. New conversations are
+        created as <conversation_id>.jsonl. The line is stamped with the thread's
+        next sequence number, read from the line before it; see get_messages_since().
+
+        Args:
+            conversation_id (str): The conversation to append to
+            message (any): A single message to append
+            durability (Optional[str]): Overrides the manager's durability for this write
+        """
+        level = check_durability(durability or self.durability)
+        self._invalidate_cache(conversation_id)
+        if self.storage_mode == "segments":
+            with self._lock:
+                seq = self._last_seq(conversation_id) + 1
+                with phase(SERIALIZE):
+                    data = self._encode_jsonl(message, seq).encode("utf-8")
+                self._append_to_segment(conversation_id, data)
+                self._count(BYTES_WRITTEN, len(data))
+                self._index_for_search(conversation_id, seq, [message])
+            self._make_durable(level, segments=True, index_changed=True)
+            return
+
+        with self._conversation_lock(conversation_id), self._lock:
+            self._refresh_index()
+            relative_filepath = self.conversations_index.get(conversation_id)
+            index_changed = relative_filepath is None or not self._is_jsonl(relative_filepath)
+            if relative_filepath is None:
+                relative_filepath = f"{conversation_id}{JSONL_EXTENSION}"
+                self._update_index(conversation_id, relative_filepath)
+            elif not self._is_jsonl(relative_filepath):
+                relative_filepath = self.migrate_to_jsonl(conversation_id)
+
+            seq = self._last_seq(conversation_id) + 1
+            filepath = os.path.join(self.storage_dir, relative_filepath)
+            with phase(SERIALIZE):
+                line = self._encode_jsonl(message, seq)
+            with phase(IO), open(filepath, 'a') as f:
+                f.write(line)
+            self._count(BYTES_WRITTEN, len(line))
+            self._index_for_search(conversation_id, seq, [message])
+        self._make_durable(level, [filepath], index_changed=index_changed)
+
+    def _make_durable(self, level: str, filepaths: List[str] = (), segments: bool = False,
+                      index_changed: bool = False, directories: List[str] = ()) -> None:
+        """
+        Fsyncs what a write touched if it asked for the durable level. Called
+        after self._lock is released, so concurrent writers can share a group commit.
+
+        Args:
+            level (str): The write's durability level
+            filepaths (List[str]): Conversation files the write changed
+            segments (bool): True if the write appended to the active segment
+            index_changed (bool): True if the write changed the index, so the
+                journal needs syncing too
+            directories (List[str]): Directories whose entries the write renamed
+        """
+        if level != DURABLE:
+            return
+        targets = {filepath: partial(fsync_path, filepath) for filepath in filepaths}
+        targets.update((directory, partial(fsync_path, directory)) for directory in directories)
+        if segments:
+            targets[SEGMENT_DIRNAME] = self.segments.sync
+        if index_changed:
+            journal_file = os.path.join(self.storage_dir, INDEX_JOURNAL_FILENAME)
+            targets[journal_file] = partial(fsync_path, journal_file)
+            if filepaths or not self._storage_dir_synced:
+                # A new conversation file (or the journal itself) was created
+                targets[self.storage_dir] = partial(fsync_path, self.storage_dir)
+                self._storage_dir_synced = True
+
+        with phase(IO):
+            if self._group_committer is not None:
+                self._group_committer.sync(targets)
+            else:
+                for sync in targets.values():
+                    sync()
+
+    def _index_for_search(self, conversation_id: str, first_seq: int, messages: List[any],
+                          replace: bool = False) -> None:
+        """
+        Adds written messages to the full-text index, if it is enabled. The
+        caller holds self._lock.
+
+        Args:
+            conversation_id (str): The conversation written to
+            first_seq (int): Sequence number of the first message
+            messages (List[any]): The messages written, in order
+            replace (bool): True if the messages replace the whole conversation
+        """
+        if self.search_index is None:
+            return
+        if replace:
+            self.search_index.drop(conversation_id)
+        self.search_index.add(conversation_id, enumerate(messages, first_seq))
+
+    @timed("search")
+    def search(self, query: str, conversation_ids: Optional[Iterable[str]] = None, limit: int = 10) -> List[Dict]:
+        """
+        Finds the messages containing every word of query across all
+        conversations, best matches first, using the full-text index alone.
+        Fetch a hit's message with get_messages_since(conversation_id, seq - 1).
+
+        Conversation IDs are opaque here, so a user's ID cannot be told apart
+        from a prefix of another user's ("bob" and "bob_smith"). To search one
+        user's history, pass the IDs of that user's conversations.
+
+        Args:
+            query (str): Words to look for; case and punctuation are ignored
+            conversation_ids (Optional[Iterable[str]]): If set, only search these conversations
+            limit (int): Maximum number of hits to return
+
+        Returns:
+            List[Dict]: Hits with "conversation_id", "seq" and "score" keys
+        """
+        if self.search_index is None:
+            raise RuntimeError("Full-text search is disabled; create the manager with full_text_search=True")
+        with self._lock:
+            return self.search_index.search(query, conversation_ids=conversation_ids, limit=limit)
+
+    def rebuild_search_index(self) -> None:
+        """
+        Rebuilds the full-text index from the conversation files, for example
+        after it was deleted or fell behind because of a crash.
+        """
+        if self.search_index is None:
+            raise RuntimeError("Full-text search is disabled; create the manager with full_text_search=True")
+        with self._lock:
+            conversation_ids = list(self.conversations_index.keys())
+            self.search_index.rebuild(
+                (conversation_id, [(message.pop(SEQUENCE_FIELD), message)
+                                   for message in self.get_messages_since(conversation_id, 0)])
+                for conversation_id in conversation_ids)
+
+    def _append_to_segment(self, conversation_id: str, data: bytes) -> None:
+        """
+        Appends encoded message lines to a conversation in segment mode. If the
+        conversation's record ends with the last record of the active segment,
+        it is extended in place. Otherwise only the new lines are appended, as a
+        delta extent chained after the record's existing ones, so the cost of an
+        append does not depend on the length of the conversation. A chain of
+        MAX_RECORD_EXTENTS extents is rewritten as one record instead, and
+        compact() merges the chains it copies.
+        """
+        with self._lock:
+            locations = parse_locators(self.conversations_index.get(conversation_id, ""))
+            if locations is None:
+                locations = [self.segments.append(data)]
+            else:
+                extended = self.segments.extend(*locations[-1], data)
+                if extended is not None:
+                    locations[-1] = extended
+                elif len(locations) < MAX_RECORD_EXTENTS:
+                    locations.append(self.segments.append(data))
+                else:
+                    locations = [self.segments.append(self.segments.read_extents(locations) + data)]
+            self._update_index(conversation_id, format_locators(locations))
+
+    @timed("delete_conversation")
+    def delete_conversation(self, conversation_id: str, durability: Optional[str] = None) -> bool:
+        """
+        Deletes a conversation. In segment mode the record's space is reclaimed
+        by the next compaction.
+
+        Args:
+            conversation_id (str): The conversation to delete
+            durability (Optional[str]): Overrides the manager's durability for this write
+
+        Returns:
+            bool: True if a conversation was deleted, False otherwise
+        """
+        level = check_durability(durability or self.durability)
+        with self._conversation_lock(conversation_id), self._lock:
+            self._refresh_index()
+            relative_filepath = self.conversations_index.get(conversation_id)
+            if relative_filepath is None:
+                return False
+            self._update_index(conversation_id, None)
+            self._invalidate_cache(conversation_id)
+            if self.search_index is not None:
+                self.search_index.drop(conversation_id)
+
+            if parse_locators(relative_filepath) is None:
+                try:
+                    os.remove(os.path.join(self.storage_dir, relative_filepath))
+                except FileNotFoundError:
+                    pass
+        self._make_durable(level, index_changed=True)
+        return True
+
+    @timed("compact")
+    def compact(self) -> int:
+        """
+        Reclaims space from segments whose records have mostly been rewritten or
+        deleted. Conversations with live data in those segments are copied to
+        the active segment, each merged into a single record if it was chained
+        by appends, the index is checkpointed, and only then are the old
+        segments removed.
+
+        Returns:
+            int: The number of segments that were removed
+        """
+        if self.segments is None:
+            return 0
+
+        with self._lock:
+            live_bytes = defaultdict(int)
+            records = defaultdict(list)
+            for conversation_id, value in self.conversations_index.items():
+                locations = parse_locators(value)
+                if locations is not None:
+                    for segment, _, length in locations:
+                        live_bytes[segment] += length
+                        records[segment].append((conversation_id, locations))
+
+            candidates = []
+            for segment in self.segments.segments():
+                if segment == self.segments.active_segment:
+                    continue
+                size = self.segments.segment_size(segment)
+                if size == 0 or live_bytes[segment] / size < self.compaction_threshold:
+                    candidates.append(segment)
+            if not candidates:
+                return 0
+
+            copied = set()
+            for segment in candidates:
+                for conversation_id, locations in records[segment]:
+                    if conversation_id in copied:
+                        continue
+                    copied.add(conversation_id)
+                    new_location = self.segments.append(self.segments.read_extents(locations))
+                    self._update_index(conversation_id, format_locator(*new_location))
+
+            # The copies and the index that points at them must be durable
+            # before the old segments disappear.
+            self.segments.sync()
+            self.save_index()
+            for segment in candidates:
+                self.segments.remove(segment)
+            return len(candidates)
+
+    def _compaction_loop(self, interval: float) -> None:
+        """
+        Runs compact() every interval seconds until close() is called.
+        """
+        while not self._stop_compaction.wait(interval):
+            self.compact()
+
+    def close(self) -> None:
+        """
+        Stops background compaction and the read pool, and closes any open
+        segment and index files.
+        """
+        self._stop_compaction.set()
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+            self._compaction_thread = None
+        if self._read_pool is not None:
+            self._read_pool.shutdown()
+            self._read_pool = None
+        if self.segments is not None:
+            self.segments.close()
+        if isinstance(self.conversations_index, SortedIndex):
+            self.conversations_index.close()
+        if self._locks is not None:
+            self._locks.close()
+
+    def migrate_to_jsonl(self, conversation_id: str) -> Optional[str]:
+        """
+        Converts a conversation stored as a .json array into the JSONL format.
+
+        The JSONL file is written next to the original one and the index is
+        updated before the old file is removed, so an interrupted migration
+        leaves the original conversation readable. In multiprocess mode the
+        conversation is locked for the whole migration.
+
+        Args:
+            conversation_id (str): The conversation to migrate
+
+        Returns:
+            Optional[str]: The new relative filepath, or None if the conversation is not indexed
+        """
+        with self._conversation_lock(conversation_id), self._lock:
+            self._refresh_index()
+            relative_filepath = self.conversations_index.get(conversation_id)
+            if relative_filepath is None:
+                return None
+            if self._is_jsonl(relative_filepath):
+                return relative_filepath
+
+            messages = self.get_conversation(conversation_id)
+            new_relative_filepath = os.path.splitext(relative_filepath)[0] + JSONL_EXTENSION
+            new_filepath = os.path.join(self.storage_dir, new_relative_filepath)
+            tmp_filepath = new_filepath + ".tmp"
+            with open(tmp_filepath, 'w') as f:
+                f.writelines(self._encode_jsonl(message, position + 1) for position, message in enumerate(messages))
+            os.replace(tmp_filepath, new_filepath)
+
+            self._update_index(conversation_id, new_relative_filepath)
+
+            try:
+                os.remove(os.path.join(self.storage_dir, relative_filepath))
+            except FileNotFoundError:
+                pass
+            return new_relative_filepath
+
+    def migrate_all_to_jsonl(self) -> int:
+        """
+        Migrates every indexed .json conversation to the JSONL format.
+
+        Returns:
+            int: The number of conversations that were migrated
+        """
+        migrated = 0
+        for conversation_id, relative_filepath in list(self.conversations_index.items()):
+            if not self._is_jsonl(relative_filepath) and parse_locators(relative_filepath) is None:
+                self.migrate_to_jsonl(conversation_id)
+                migrated += 1
+        return migrated
 
     def run_tests(self):
         print("Testing FlatFileManager._ensure_storage_exists()")
@@ -128,6 +1307,172 @@ class FlatFileManager:
             return
         print("Successfully retrieved conversation!")
 
+        print("Testing FlatFileManager.append_message()")
+        self.save_conversation("legacy_user", "legacy_user.json", messages)
+        self.append_message("legacy_user", {"role": "assistant", "content": "hi there"})
+        if self.conversations_index["legacy_user"] != "legacy_user.jsonl":
+            print("Failed to migrate conversation to JSONL!")
+            return
+        self.append_message("new_user", {"role": "user", "content": "first"})
+        self.append_message("new_user", {"role": "assistant", "content": "second"})
+        if len(self.get_conversation("legacy_user")) != 2 or len(self.get_conversation("new_user")) != 2:
+            print("Failed to append messages!")
+            return
+        print("Successfully appended messages!")
+
+        print("Testing FlatFileManager index journal")
+        reopened = FlatFileManager(storage_dir=self.storage_dir)
+        if reopened.conversations_index != self.conversations_index:
+            print("Failed to replay index journal!")
+            return
+        reopened.save_index()
+        if FlatFileManager(storage_dir=self.storage_dir).conversations_index != self.conversations_index:
+            print("Failed to checkpoint index!")
+            return
+        print("Successfully replayed and checkpointed index!")
+
+        print("Testing FlatFileManager sorted index")
+        sorted_manager = FlatFileManager(storage_dir=self.storage_dir, index_format="sorted")
+        if dict(sorted_manager.conversations_index) != dict(self.conversations_index):
+            print("Failed to convert index to sorted format!")
+            return
+        sorted_manager.append_message("sorted_user", {"role": "user", "content": "sorted"})
+        sorted_manager.save_index()
+        reopened = FlatFileManager(storage_dir=self.storage_dir, index_format="sorted")
+        if reopened.get_conversation("sorted_user") != [{"role": "user", "content": "sorted"}]:
+            print("Failed to read through sorted index!")
+            return
+        reopened.append_message("sorted_user", {"role": "user", "content": "journaled"})
+        converted = FlatFileManager(storage_dir=self.storage_dir)
+        if len(converted.get_conversation("sorted_user")) != 2 \
+                or os.path.exists(os.path.join(self.storage_dir, SORTED_INDEX_FILENAME)):
+            print("Failed to convert sorted index back to json!")
+            return
+        print("Successfully used sorted index!")
+
+        print("Testing FlatFileManager segment store")
+        segment_manager = FlatFileManager(storage_dir=os.path.join(self.storage_dir, "packed"),
+                                          storage_mode="segments", max_segment_size=256)
+        for i in range(20):
+            segment_manager.save_conversation(f"thread_{i % 4}", f"thread_{i % 4}.json", messages)
+            segment_manager.append_message(f"thread_{i % 4}", {"role": "assistant", "content": f"reply {i}"})
+        segment_manager.delete_conversation("thread_3")
+        segment_manager.compact()
+        if len(segment_manager.get_conversation("thread_0")) != 2 or segment_manager.get_conversation("thread_3"):
+            print("Failed to read packed conversations after compaction!")
+            return
+        segment_manager.close()
+        print("Successfully used segment store!")
+
+        print("Testing FlatFileManager conversation cache")
+        cached_manager = FlatFileManager(storage_dir=self.storage_dir, cache_entries=8)
+        cached_manager.get_conversation("new_user")
+        cached_manager.get_conversation("new_user")
+        cached_manager.append_message("new_user", {"role": "user", "content": "third"})
+        if len(cached_manager.get_conversation("new_user")) != 3 or cached_manager.cache_stats()["hits"] != 1:
+            print("Failed to cache conversation!")
+            return
+        print("Successfully cached conversation!")
+
+        print("Testing FlatFileManager.get_conversation() pagination")
+        last_two = self.get_conversation("new_user", limit=2)
+        first_one = self.get_conversation("new_user", limit=1, before=1)
+        if [m["content"] for m in last_two] != ["second", "third"] or first_one[0]["content"] != "first":
+            print("Failed to paginate conversation!")
+            return
+        print("Successfully paginated conversation!")
+
+        print("Testing FlatFileManager durability levels")
+        durable_manager = FlatFileManager(storage_dir=self.storage_dir, durability="durable", group_commit=True)
+        durable_manager.append_message("durable_user", {"role": "user", "content": "synced"})
+        durable_manager.append_message("durable_user", {"role": "assistant", "content": "not synced"},
+                                       durability="acknowledged")
+        if len(durable_manager.get_conversation("durable_user")) != 2 or durable_manager._group_committer.batches != 1:
+            print("Failed to write with durability levels!")
+            return
+        durable_manager.close()
+        print("Successfully wrote with durability levels!")
+
+        print("Testing FlatFileManager.get_conversations()")
+        conversations = self.get_conversations(["new_user", "legacy_user", "missing_user"], limit=2)
+        if [m["content"] for m in conversations["new_user"]] != ["second", "third"] \
+                or len(conversations["legacy_user"]) != 2 or conversations["missing_user"] != []:
+            print("Failed to get multiple conversations!")
+            return
+        print("Successfully retrieved multiple conversations!")
+
+        print("Testing FlatFileManager.get_messages_since()")
+        newer = self.get_messages_since("new_user", 2)
+        if [(m["seq"], m["content"]) for m in newer] != [(3, "third")] or self.get_messages_since("new_user", 3):
+            print("Failed to fetch only the newer messages!")
+            return
+        self.save_conversation("new_user", "new_user.jsonl", [{"role": "user", "content": "rewritten"}])
+        if [m["seq"] for m in self.get_messages_since("new_user", 3)] != [4]:
+            print("Failed to number rewritten messages after earlier ones!")
+            return
+        print("Successfully fetched only the newer messages!")
+
+        print("Testing FlatFileManager multiprocess mode")
+        shared_dir = os.path.join(self.storage_dir, "shared")
+        FlatFileManager(storage_dir=shared_dir, multiprocess=True).close()
+        workers = [multiprocessing.Process(target=_shared_append_worker, args=(shared_dir, worker_num, 50))
+                   for worker_num in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        # Two managers in one process, appending from two threads, must exclude each other too
+        first = FlatFileManager(storage_dir=shared_dir, multiprocess=True)
+        second = FlatFileManager(storage_dir=shared_dir, multiprocess=True)
+        threads = [threading.Thread(target=_shared_append_worker, args=(shared_dir, worker_num, 50, manager))
+                   for worker_num, manager in ((2, first), (3, second))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        first.close()
+        shared = FlatFileManager(storage_dir=shared_dir).get_messages_since("shared_user", 0)
+        second.close()
+        if any(worker.exitcode != 0 for worker in workers) or [m["seq"] for m in shared] != list(range(1, 201)) \
+                or sorted(m["content"] for m in shared) != sorted(f"{w} {i}" for w in range(4) for i in range(50)):
+            print("Failed to share conversations between processes!")
+            return
+        print("Successfully shared conversations between processes!")
+
+        print("Testing FlatFileManager.search()")
+        search_manager = FlatFileManager(storage_dir=os.path.join(self.storage_dir, "search"), full_text_search=True)
+        search_manager.append_message("alice_pets", {"role": "user", "content": "My cat is called Tom"})
+        search_manager.append_message("alice_pets", {"role": "assistant", "content": "Tom is a fine name"})
+        search_manager.append_message("bob_pets", {"role": "user", "content": "My cat ignores me"})
+        search_manager.append_message("alice_pets_2", {"role": "user", "content": "My cat is old"})
+        hits = search_manager.search("my cat", conversation_ids=["alice_pets"])
+        search_manager.rebuild_search_index()
+        if [(hit["conversation_id"], hit["seq"]) for hit in hits] != [("alice_pets", 1)] \
+                or len(search_manager.search("CAT")) != 3 or search_manager.search("dog"):
+            print("Failed to search conversations!")
+            return
+        # A crash after the checkpoint is renamed but before the journal is replaced must not replay it twice
+        search_manager.append_message("bob_pets", {"role": "user", "content": "My dog chases the cat"})
+        journal_file = os.path.join(search_manager.storage_dir, SEARCH_JOURNAL_FILENAME)
+        with open(journal_file) as f:
+            journal = f.read()
+        search_manager.search_index.checkpoint()
+        with open(journal_file, 'w') as f:
+            f.write(journal)
+        reloaded = SearchIndex(search_manager.storage_dir)
+        if len(reloaded) != len(search_manager.search_index) \
+                or reloaded.search("cat") != search_manager.search_index.search("cat"):
+            print("Failed to reload the search index after an interrupted checkpoint!")
+            return
+        search_manager.close()
+        print("Successfully searched conversations!")
+
+        print("Testing FlatFileManager.iter_messages()")
+        if list(self.iter_messages("new_user")) != self.get_conversation("new_user"):
+            print("Failed to stream conversation!")
+            return
+        print("Successfully streamed conversation!")
+
         try:
             shutil.rmtree(self.storage_dir)
             print("Deleted storage directory")
@@ -137,6 +1482,22 @@ class FlatFileManager:
         print("All tests passed!")
 
 
+def _shared_append_worker(storage_dir: str, worker_num: int, appends: int, manager: Optional[FlatFileManager] = None):
+    """
+    Appends to a conversation shared with other workers, checkpointing the
+    index halfway; the multiprocess test runs it in separate processes and threads.
+    """
+    own_manager = manager is None
+    if own_manager:
+        manager = FlatFileManager(storage_dir=storage_dir, multiprocess=True)
+    for i in range(appends):
+        manager.append_message("shared_user", {"role": "user", "content": f"{worker_num} {i}"})
+        if i == appends // 2:
+            manager.save_index()
+    if own_manager:
+        manager.close()
+
+
 if __name__ == "__main__":
     print("Testing FlatFileManager")
     manager = FlatFileManager(storage_dir="data_test")
@@ -0,0 +1,211 @@
+import time
+import bisect
+import functools
+import threading
+from typing import Dict, Tuple
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Counters the managers report besides operation latencies
+BYTES_READ = "bytes_read"
+BYTES_WRITTEN = "bytes_written"
+CACHE_HITS = "cache_hits"
+CACHE_MISSES = "cache_misses"
+
+# Prefix of every metric name in the text exposition
+METRIC_PREFIX = "chai"
+
+
+class _OperationStats:
+    """
+    Latency histogram and counts of one operation of one backend.
+    """
+    __slots__ = ("buckets", "count", "errors", "total", "max", "last")
+
+    def __init__(self, bucket_count: int):
+        self.buckets = [0] * bucket_count
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+
+class MetricsRegistry:
+    """
+    Collects runtime metrics from the storage managers: a latency histogram,
+    call count and error count per operation, and counters for bytes read and
+    written and cache hits and misses, all labelled with the backend that
+    reported them. Pass one registry to any number of managers with their
+    metrics argument.
+
+    Recording an operation is a bisect and a few additions under a lock, so a
+    registry can stay attached in production. Read it with snapshot(), or
+    with exposition() in the Prometheus text format (see serve_metrics()).
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        """
+        Args:
+            buckets (Tuple[float, ...]): Increasing upper bounds, in seconds, of the
+                latency histogram buckets; slower operations land in a final +Inf bucket
+        """
+        if list(buckets) != sorted(set(buckets)):
+            raise ValueError("Histogram buckets must be strictly increasing")
+        self.buckets = tuple(buckets)
+        self._operations: Dict[Tuple[str, str], _OperationStats] = {}
+        self._counters: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, backend: str, operation: str, seconds: float, error: bool = False) -> None:
+        """
+        Records one call of operation that took seconds and raised if error is True.
+        """
+        index = bisect.bisect_left(self.buckets, seconds)
+        key = (backend, operation)
+        with self._lock:
+            stats = self._operations.get(key)
+            if stats is None:
+                stats = self._operations[key] = _OperationStats(len(self.buckets) + 1)
+            stats.buckets[index] += 1
+            stats.count += 1
+            stats.total += seconds
+            stats.last = seconds
+            if seconds > stats.max:
+                stats.max = seconds
+            if error:
+                stats.errors += 1
+
+    def increment(self, backend: str, name: str, amount: int = 1) -> None:
+        """
+        Adds amount to counter name, e.g. BYTES_READ, of backend.
+        """
+        key = (backend, name)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Returns a copy of every metric, keyed by backend.
+
+        Returns:
+            Dict[str, Dict]: {backend: {"operations": {operation: {count, errors,
+            total_seconds, max_seconds, last_seconds, buckets}}, "counters":
+            {name: value}}}. buckets lists [upper_bound, cumulative_count] pairs;
+            the implicit +Inf bucket holds count.
+        """
+        with self._lock:
+            snapshot = {}
+            for (backend, operation), stats in sorted(self._operations.items()):
+                cumulative = 0
+                buckets = []
+                for bound, bucket_count in zip(self.buckets, stats.buckets):
+                    cumulative += bucket_count
+                    buckets.append([bound, cumulative])
+                snapshot.setdefault(backend, {"operations": {}, "counters": {}})["operations"][operation] = {
+                    "count": stats.count,
+                    "errors": stats.errors,
+                    "total_seconds": stats.total,
+                    "max_seconds": stats.max,
+                    "last_seconds": stats.last,
+                    "buckets": buckets,
+                }
+            for (backend, name), value in sorted(self._counters.items()):
+                snapshot.setdefault(backend, {"operations": {}, "counters": {}})["counters"][name] = value
+            return snapshot
+
+    def exposition(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        duration = f"{METRIC_PREFIX}_operation_duration_seconds"
+        errors = f"{METRIC_PREFIX}_operation_errors_total"
+        lines = [f"# HELP {duration} Latency of storage manager operations.",
+                 f"# TYPE {duration} histogram"]
+        error_lines = [f"# HELP {errors} Storage manager operations that raised.",
+                       f"# TYPE {errors} counter"]
+        for backend, metrics in snapshot.items():
+            for operation, stats in metrics["operations"].items():
+                labels = f'backend="{backend}",operation="{operation}"'
+                for bound, cumulative in stats["buckets"]:
+                    lines.append(f'{duration}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{duration}_bucket{{{labels},le="+Inf"}} {stats["count"]}')
+                lines.append(f"{duration}_sum{{{labels}}} {stats['total_seconds']}")
+                lines.append(f"{duration}_count{{{labels}}} {stats['count']}")
+                error_lines.append(f"{errors}{{{labels}}} {stats['errors']}")
+        lines += error_lines
+
+        names = sorted({name for metrics in snapshot.values() for name in metrics["counters"]})
+        for name in names:
+            counter = f"{METRIC_PREFIX}_{name}_total"
+            lines += [f"# HELP {counter} {name.replace('_', ' ').capitalize()} by the storage managers.",
+                      f"# TYPE {counter} counter"]
+            for backend, metrics in snapshot.items():
+                if name in metrics["counters"]:
+                    lines.append(f'{counter}{{backend="{backend}"}} {metrics["counters"][name]}')
+        return "\n".join(lines) + "\n"
+
+
+def timed(operation: str):
+    """
+    Decorates a manager method to report its latency, and any exception it
+    raises, as operation to the manager's metrics registry. The manager needs
+    metrics (a MetricsRegistry or None) and metrics_backend attributes; with
+    no registry the method is called directly.
+
+    Args:
+        operation (str): Operation name to report
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if metrics is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = method(self, *args, **kwargs)
+            except BaseException:
+                metrics.observe(self.metrics_backend, operation, time.perf_counter() - start, error=True)
+                raise
+            metrics.observe(self.metrics_backend, operation, time.perf_counter() - start)
+            return result
+        return wrapper
+    return decorate
+
+
+def serve_metrics(registry: MetricsRegistry, port: int, host: str = "127.0.0.1"):
+    """
+    Serves registry.exposition() over HTTP at /metrics from a daemon thread,
+    for a local Prometheus-compatible scraper.
+
+    Args:
+        registry (MetricsRegistry): The registry to expose
+        port (int): Port to listen on (0 picks a free one, see server_address)
+        host (str): Interface to listen on
+
+    Returns:
+        ThreadingHTTPServer: The running server; call shutdown() to stop it
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.exposition().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -1,24 +1,135 @@
 import os
+import sys
+import re
+import time
+import threading
 from datetime import datetime, UTC
-from typing import List, Dict, Optional
-from pymongo import MongoClient
-from pymongo.collection import Collection
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+if __package__ in (None, ""):
+    # Run as a script (python db_wrappers/mongodb_manager.py): make the db_wrappers package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_wrappers.conversation_cache import ConversationCache
+from db_wrappers.durability import ACKNOWLEDGED, DURABLE, FIRE_AND_FORGET, check_durability
+from db_wrappers.metrics import BYTES_WRITTEN, CACHE_HITS, CACHE_MISSES, MetricsRegistry, timed
+from db_wrappers.profiling import event_listeners
+from db_wrappers.search_index import tokenize
+
+# pymongo is imported lazily (on first connection), so importing this module
+# and constructing a manager stay cheap for short-lived CLI and worker processes.
+if TYPE_CHECKING:
+    from pymongo import MongoClient, UpdateOne
+    from pymongo.collection import Collection
+    from pymongo.database import Database
+
+# Field added to each message in the bucketed layout to record its position in the thread
+POSITION_FIELD = "_i"
+
+# Bump when _ensure_indexes() changes, so existing databases get the new indexes
+INDEX_VERSION = 4
+META_COLLECTION = "chai_meta"
+# Stats materialized per thread by ConversationAnalytics; deleting a thread drops its entry
+STATS_COLLECTION = "thread_stats"
+
+# Write concern options for each durability level
+WRITE_CONCERNS = {
+    FIRE_AND_FORGET: {"w": 0},
+    ACKNOWLEDGED: {"w": 1},
+    DURABLE: {"w": 1, "j": True},
+}
+
+# Key added to the messages returned by get_messages_since() holding each one's sequence number
+SEQUENCE_FIELD = "seq"
+
+# Characters of the last message kept on the conversation document for thread listings
+PREVIEW_LENGTH = 80
+
+# Serves list_threads()/list_user_threads() as a covered query, newest first
+THREAD_LISTING_INDEX = [
+    ("user_id", 1), ("updated_at", -1), ("thread_name", 1),
+    ("message_count", 1), ("last_role", 1), ("last_preview", 1),
+]
+THREAD_LISTING_FIELDS = ["thread_name", "message_count", "updated_at", "last_role", "last_preview"]
+
+# Serves search_messages(): a text index on message contents, scoped to one user.
+# Only created with full_text_search=True, since every write re-indexes the whole
+# messages array of the document it changes.
+MESSAGE_SEARCH_INDEX = [("user_id", 1), ("messages.content", "text")]
+
+# Indexes replaced by THREAD_LISTING_INDEX, dropped by the index upgrade, as (collection, index name)
+DROPPED_INDEXES = [("conversations", "user_id_1")]
+
+# Threads written before the thread listing fields existed
+THREAD_FIELDS_MISSING = {"$or": [{field: {"$exists": False}} for field in ("message_count", "last_seq", "last_role")]}
+
+# Databases whose indexes this process has already verified
+_verified_indexes = set()
+_verified_indexes_lock = threading.Lock()
 
 
 class MongoDBManager:
     """
     Manages storing and retrieving chat conversations in MongoDB.
     Each conversation is stored as a single document with an array of messages.
+
+    With storage_layout="bucketed", the conversations collection only holds
+    thread metadata and messages live in fixed-size documents in the
+    message_buckets collection, so no document grows with the conversation.
+    A database should be used with a single layout.
     """
 
-    def __init__(self, connection_string: str = "mongodb://localhost:27017/", database_name: str = "chai_db"):
+    # Backend label of the metrics this manager reports
+    metrics_backend = "mongodb"
+
+    def __init__(self, connection_string: str = "mongodb://localhost:27017/", database_name: str = "chai_db",
+                 write_behind: bool = False, flush_interval: float = 0.05, flush_size: int = 100,
+                 storage_layout: str = "embedded", bucket_size: int = 200,
+                 cache_entries: int = 0, cache_bytes: int = 64 * 1024 * 1024,
+                 durability: Optional[str] = None, full_text_search: bool = False,
+                 metrics: Optional[MetricsRegistry] = None):
         """
         Initializes the MongoDBManager.
 
         Args:
             connection_string (str): MongoDB connection string
             database_name (str): Name of the database to use
+            write_behind (bool): If True, appends are buffered and coalesced per thread,
+                then written with a single bulk_write every flush_interval seconds or
+                once flush_size messages are pending. close() flushes the buffer.
+            flush_interval (float): Maximum seconds an append waits in the buffer
+            flush_size (int): Number of pending messages that triggers an immediate flush
+            storage_layout (str): "embedded" keeps all messages in the conversation
+                document. "bucketed" stores them in message_buckets documents of at
+                most bucket_size messages, keyed by conversation and bucket number.
+            bucket_size (int): Messages per bucket document in the bucketed layout
+            cache_entries (int): If greater than zero, keep up to this many conversations
+                in a read-through cache. Every write increments a version counter on the
+                conversation document, so a cached read only fetches that counter and
+                transfers the messages again only when it has moved.
+            cache_bytes (int): Approximate size limit for the cache
+            durability (Optional[str]): Default durability of writes, overridable per
+                call: "fire-and-forget" (w=0), "acknowledged" (w=1) or "durable"
+                (w=1, j=True, journaled before the write returns). None keeps the
+                write concern of the connection string.
+            full_text_search (bool): If True, maintain the text index behind
+                search_messages(). MongoDB re-tokenizes every message of a document
+                the index covers whenever the document is written, so in the embedded
+                layout each append then costs time proportional to the length of the
+                thread; in the bucketed layout it is bounded by bucket_size.
+            metrics (Optional[MetricsRegistry]): If set, report operation latencies and
+                errors, bytes written (estimated from the messages, as for the cache)
+                and cache hits to this registry. Bytes read are not reported: pymongo
+                does not expose the size of a decoded reply, and measuring the returned
+                documents would cost more than the read.
         """
+        self.metrics = metrics
+        self.durability = check_durability(durability) if durability is not None else None
+        if storage_layout not in ("embedded", "bucketed"):
+            raise ValueError(f"Unknown storage layout: {storage_layout}")
+        self.storage_layout = storage_layout
+        self.bucket_size = bucket_size
+        self.full_text_search = full_text_search
+        self.cache = ConversationCache(cache_entries, cache_bytes) if cache_entries > 0 else None
+
         # --- TODO 1: Initialize MongoDB Connection ---
         # 1. Create a MongoClient using the connection_string
         # 2. Get the database using database_name
@@ -26,22 +137,185 @@ class MongoDBManager:
         # Store these as instance variables: self.client, self.db, self.conversations
         # Hint: self.client[database_name] gets a database
         # Hint: db[collection_name] gets a collection - use "conversations" as the collection_name
-        self.client = MongoClient(connection_string)
-        self.db = self.client[database_name]
-        self.conversations =  self.db["conversations"]
-        self._ensure_indexes()
+        #
+        # The connection is opened on first use (see the client property), and
+        # indexes are verified once per database before the first write.
+        self.connection_string = connection_string
+        self.database_name = database_name
+        self._client = None
+        self._connect_lock = threading.Lock()
+
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending = {}  # Key: conversation_id => Value: (user_id, thread_name, messages, updated_at)
+        self._pending_count = 0
+        self._pending_lock = threading.Lock()
+        # Held from taking a batch until it is written, so batches of one thread land in order
+        self._flush_lock = threading.Lock()
+        self._flush_error = None
+        self._stop_flushing = threading.Event()
+        self._flush_thread = None
+        if write_behind:
+            self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flush_thread.start()
+
+    @property
+    def client(self) -> "MongoClient":
+        """
+        The MongoClient, created (and pymongo imported) on first access. If a
+        PhaseRecorder is installed by then, the client reports command round trips to it.
+        """
+        if self._client is None:
+            with self._connect_lock:
+                if self._client is None:
+                    from pymongo import MongoClient
+                    self._client = MongoClient(self.connection_string, event_listeners=event_listeners())
+        return self._client
+
+    @property
+    def db(self) -> "Database":
+        return self.client[self.database_name]
+
+    @property
+    def conversations(self) -> "Collection":
+        return self.db["conversations"]
+
+    @property
+    def message_buckets(self) -> "Collection":
+        return self.db["message_buckets"]
+
+    def _collection(self, name: str, durability: Optional[str] = None) -> "Collection":
+        """
+        Returns a collection whose writes use the write concern of durability,
+        or of the manager's default durability if it is None.
+        """
+        level = durability or self.durability
+        if level is None:
+            return self.db[name]
+        from pymongo.write_concern import WriteConcern
+        return self.db[name].with_options(write_concern=WriteConcern(**WRITE_CONCERNS[level]))
+
+    def _verify_indexes(self) -> None:
+        """
+        Makes sure the indexes exist before the first write, at most once per
+        database per process. A marker document in the chai_meta collection
+        records the index version already built, so a new process only pays
+        one find_one instead of a create_index per index.
+        """
+        key = (self.connection_string, self.database_name, self.storage_layout, self.full_text_search)
+        if key in _verified_indexes:
+            return
+        with _verified_indexes_lock:
+            if key in _verified_indexes:
+                return
+            marker_id = self._index_marker_id(self.storage_layout, self.full_text_search)
+            marker = self.db[META_COLLECTION].find_one({"_id": marker_id})
+            if not marker or marker.get("version") != INDEX_VERSION:
+                self._ensure_indexes()
+                self._backfill_thread_fields()
+                self.db[META_COLLECTION].update_one(
+                    {"_id": marker_id}, {"$set": {"version": INDEX_VERSION}}, upsert=True)
+            _verified_indexes.add(key)
+
+    @staticmethod
+    def _index_marker_id(storage_layout: str, full_text_search: bool) -> str:
+        """
+        Returns the _id of the chai_meta document recording the index version
+        built for a storage layout. Shared with AsyncMongoDBManager.
+        """
+        return f"indexes:{storage_layout}{':search' if full_text_search else ''}"
+
+    @staticmethod
+    def _index_definitions(storage_layout: str, full_text_search: bool) -> List[Tuple[str, List, Dict]]:
+        """
+        Returns the indexes a storage layout needs as (collection, keys,
+        create_index options) triples. Shared with AsyncMongoDBManager.
+        """
+        indexes = [
+            # Create a compound index on user_id and thread_name for fast lookups
+            ("conversations", [("user_id", 1), ("thread_name", 1)], {"unique": True}),
+            # Thread listings are served newest first straight from this index. It also
+            # covers plain user_id lookups, so the old standalone user_id index is dropped.
+            ("conversations", THREAD_LISTING_INDEX, {"name": "thread_listing"}),
+        ]
+        if storage_layout == "bucketed":
+            # Buckets are looked up and range-scanned by conversation and bucket number
+            indexes.append(("message_buckets", [("conversation_id", 1), ("bucket", 1)], {"unique": True}))
+        if full_text_search:
+            collection = "message_buckets" if storage_layout == "bucketed" else "conversations"
+            indexes.append((collection, MESSAGE_SEARCH_INDEX, {"name": "message_search"}))
+        return indexes
 
     def _ensure_indexes(self) -> None:
         """
         Creates indexes on the conversations collection for efficient querying.
         This is already implemented for you.
         """
-        # Create a compound index on user_id and thread_name for fast lookups
-        self.conversations.create_index([("user_id", 1), ("thread_name", 1)], unique=True)
-        # Create an index on user_id for listing all threads for a user
-        self.conversations.create_index("user_id")
+        for collection, keys, options in self._index_definitions(self.storage_layout, self.full_text_search):
+            self.db[collection].create_index(keys, **options)
+        for collection, name in DROPPED_INDEXES:
+            if name in self.db[collection].index_information():
+                self.db[collection].drop_index(name)
+
+    def _backfill_thread_fields(self) -> None:
+        """
+        Fills in message_count, last_seq, last_role and last_preview on threads
+        written before those fields existed. Appends $inc the counters, so
+        without them a thread's count and sequence numbers would restart from
+        zero. Runs once per database, with the index upgrade, before any write.
+        """
+        if self.storage_layout == "bucketed":
+            for document in self.conversations.find(THREAD_FIELDS_MISSING, {"message_count": True, "last_seq": True}):
+                self._backfill_bucketed_thread(document)
+            return
+        self.conversations.update_many(THREAD_FIELDS_MISSING, self._embedded_backfill_pipeline())
+
+    @staticmethod
+    def _embedded_backfill_pipeline() -> List[Dict]:
+        """
+        Returns the update pipeline that backfills the thread listing fields of
+        embedded threads from their messages. Shared with AsyncMongoDBManager.
+        """
+        size = {"$size": {"$ifNull": ["$messages", []]}}
+        content = "$_backfill_last.content"
+        return [
+            {"$set": {"_backfill_last": {"$arrayElemAt": [{"$ifNull": ["$messages", []]}, -1]}}},
+            {"$set": {
+                "message_count": {"$ifNull": ["$message_count", size]},
+                "last_seq": {"$ifNull": ["$last_seq", size]},
+                "last_role": {"$ifNull": ["$last_role", "$_backfill_last.role", None]},
+                "last_preview": {"$ifNull": ["$last_preview", {"$cond": [
+                    {"$eq": [{"$type": content}, "string"]},
+                    {"$substrCP": [content, 0, PREVIEW_LENGTH]},
+                    {"$ifNull": [content, None]},
+                ]}]},
+            }},
+            {"$project": {"_backfill_last": False}},
+        ]
 
-    def get_conversation(self, user_id: str, thread_name: str) -> List[Dict]:
+    def _backfill_bucketed_thread(self, document: Dict) -> None:
+        """
+        Backfills the thread listing fields of one bucketed thread from its buckets.
+        """
+        conversation_id = document["_id"]
+        count = document.get("message_count")
+        if count is None:
+            totals = list(self.message_buckets.aggregate([
+                {"$match": {"conversation_id": conversation_id}},
+                {"$group": {"_id": None, "count": {"$sum": {"$size": "$messages"}}}},
+            ]))
+            count = totals[0]["count"] if totals else 0
+        last_bucket = self.message_buckets.find_one(
+            {"conversation_id": conversation_id}, {"_id": False, "messages": True}, sort=[("bucket", -1)])
+        messages = sorted(last_bucket["messages"], key=lambda message: message[POSITION_FIELD]) if last_bucket else []
+        fields = {"message_count": count, "last_seq": document.get("last_seq", count),
+                  **self._last_message_fields([self._strip_position(message) for message in messages[-1:]])}
+        self.conversations.update_one({"_id": conversation_id}, {"$set": fields})
+
+    @timed("get_conversation")
+    def get_conversation(self, user_id: str, thread_name: str,
+                         limit: Optional[int] = None, before: Optional[int] = None) -> List[Dict]:
         """
         --- TODO 2: Retrieve a conversation from MongoDB ---
         Retrieves the messages for a specific conversation.
@@ -49,6 +323,12 @@ class MongoDBManager:
         Args:
             user_id (str): The user's ID
             thread_name (str): The name of the conversation thread
+            limit (Optional[int]): If set, return at most this many messages, ending
+                at `before` (or at the end of the conversation)
+            before (Optional[int]): If set, only return messages at positions before this one
+
+        When limit or before is given, a $slice projection is used so only the
+        requested page of the messages array is sent over the wire.
 
         Returns:
             List[Dict]: List of message dictionaries, or empty list if not found
@@ -60,12 +340,330 @@ class MongoDBManager:
 
         Hint: find_one({"user_id": user_id, "thread_name": thread_name})
         """
-        document = self.conversations.find_one(filter={"user_id": user_id,"thread_name": thread_name})
+        self._flush_pending(user_id, thread_name)
+        if self.cache is not None:
+            return self._cached_get(f"{user_id}_{thread_name}", limit, before)
+        if self.storage_layout == "bucketed":
+            return self._bucketed_get(f"{user_id}_{thread_name}", limit, before)
+
+        projection = None
+        if limit is not None or before is not None:
+            message_slice = self._slice_spec(limit, before)
+            if message_slice is None:
+                return []
+            projection = {"messages": {"$slice": message_slice}}
+
+        document = self.conversations.find_one(filter={"user_id": user_id,"thread_name": thread_name}, projection=projection)
         if not document or "messages" not in document:
             return []
         return document["messages"]
 
-    def save_conversation(self, user_id: str, thread_name: str, messages: List[Dict]) -> None:
+    @timed("get_conversations")
+    def get_conversations(self, user_id: str, thread_names: List[str],
+                          limit: Optional[int] = None) -> Dict[str, List[Dict]]:
+        """
+        Retrieves several of a user's conversations in one round trip, for
+        example to fill a dashboard of recent threads. The embedded layout uses
+        a single $in query; with limit, a $slice projection trims each messages
+        array on the server. The bucketed layout reads all the buckets with one
+        $in query (plus one for the message counts when limit is set).
+
+        Args:
+            user_id (str): The user's ID
+            thread_names (List[str]): The conversation threads to read
+            limit (Optional[int]): If set, only return the last `limit` messages of each
+
+        Returns:
+            Dict[str, List[Dict]]: Messages keyed by thread name, in the order
+            requested. Missing threads map to an empty list.
+        """
+        thread_names = list(dict.fromkeys(thread_names))
+        for thread_name in thread_names:
+            self._flush_pending(user_id, thread_name)
+        conversations = {thread_name: [] for thread_name in thread_names}
+        if not thread_names or limit == 0:
+            return conversations
+        ids = {f"{user_id}_{thread_name}": thread_name for thread_name in thread_names}
+
+        if self.storage_layout == "bucketed":
+            for conversation_id, messages in self._bucketed_get_many(list(ids), limit).items():
+                conversations[ids[conversation_id]] = messages
+            return conversations
+
+        projection = {"_id": True, "messages": True}
+        if limit is not None:
+            projection["messages"] = {"$slice": -limit}
+        for document in self.conversations.find({"_id": {"$in": list(ids)}}, projection):
+            conversations[ids[document["_id"]]] = document.get("messages", [])
+        return conversations
+
+    def _bucketed_get_many(self, conversation_ids: List[str], limit: Optional[int]) -> Dict[str, List[Dict]]:
+        """
+        Reads several bucketed conversations, or their last `limit` messages,
+        with one query over message_buckets.
+        """
+        query = {"conversation_id": {"$in": conversation_ids}}
+        ranges = {}  # Key: conversation_id => Value: (start, end) positions to return
+        if limit is not None:
+            counts = self.conversations.find({"_id": {"$in": conversation_ids}}, {"message_count": True})
+            for document in counts:
+                end = document.get("message_count", 0)
+                if end > 0:
+                    ranges[document["_id"]] = (max(0, end - limit), end)
+            if not ranges:
+                return {}
+            query = {"$or": [
+                {"conversation_id": conversation_id,
+                 "bucket": {"$gte": start // self.bucket_size, "$lte": (end - 1) // self.bucket_size}}
+                for conversation_id, (start, end) in ranges.items()
+            ]}
+
+        conversations = {}
+        buckets = self.message_buckets.find(
+            query, projection={"_id": False, "conversation_id": True, "messages": True}
+        ).sort([("conversation_id", 1), ("bucket", 1)])
+        for bucket in buckets:
+            start, end = ranges.get(bucket["conversation_id"], (0, None))
+            messages = conversations.setdefault(bucket["conversation_id"], [])
+            for message in bucket["messages"]:
+                position = message[POSITION_FIELD]
+                if position >= start and (end is None or position < end):
+                    messages.append(self._strip_position(message))
+        return conversations
+
+    def _cached_get(self, conversation_id: str, limit: Optional[int], before: Optional[int]) -> List[Dict]:
+        """
+        Serves get_conversation() through the cache. The conversation's version
+        is fetched on its own; if the cached copy has that version, the page is
+        sliced from it locally. Otherwise whole conversations are fetched and
+        cached, and pages are read from the server as usual.
+        """
+        projection = {"_id": False, "version": True}
+        if self.storage_layout == "bucketed":
+            projection["message_count"] = True
+        document = self.conversations.find_one({"_id": conversation_id}, projection)
+        if document is None:
+            self.cache.invalidate(conversation_id)
+            return []
+
+        cached = self.cache.get(conversation_id, document.get("version"))
+        if self.metrics is not None:
+            self.metrics.increment(self.metrics_backend, CACHE_MISSES if cached is None else CACHE_HITS)
+        if cached is not None:
+            end = len(cached) if before is None else before
+            start = 0 if limit is None else max(0, end - limit)
+            return cached[start:end]
+
+        if self.storage_layout == "bucketed":
+            messages = self._bucketed_get(conversation_id, limit, before)
+            # Positions are reserved before their messages land in the buckets, so
+            # only a read that found all of them is complete for this version
+            if limit is None and before is None and len(messages) == document.get("message_count", 0):
+                self._cache_store(conversation_id, document.get("version"), messages)
+            return messages
+
+        if limit is not None or before is not None:
+            message_slice = self._slice_spec(limit, before)
+            if message_slice is None:
+                return []
+            document = self.conversations.find_one({"_id": conversation_id},
+                                                   projection={"messages": {"$slice": message_slice}})
+            return document.get("messages", []) if document else []
+
+        document = self.conversations.find_one({"_id": conversation_id},
+                                               projection={"_id": False, "messages": True, "version": True})
+        if not document:
+            return []
+        messages = document.get("messages", [])
+        self._cache_store(conversation_id, document.get("version"), messages)
+        return list(messages)
+
+    def _cache_store(self, conversation_id: str, version: Optional[int], messages: List[Dict]) -> None:
+        """
+        Caches the full contents of a conversation at the given version. An
+        unknown version (an unacknowledged write) drops the entry instead.
+        """
+        if self.cache is None:
+            return
+        if version is None:
+            self.cache.invalidate(conversation_id)
+        else:
+            self.cache.put(conversation_id, version, list(messages), self._approximate_size(messages))
+
+    def _cache_appended(self, conversation_id: str, version: Optional[int], messages: List[Dict]) -> None:
+        """
+        Updates a cached conversation after this manager appended messages to it.
+        The cached copy is only extended if no other write happened in between,
+        which is the case when the append moved the version up by exactly one.
+        """
+        if self.cache is None:
+            return
+        if version is None:
+            self.cache.invalidate(conversation_id)
+        else:
+            self.cache.extend(conversation_id, version - 1, version, list(messages),
+                              self._approximate_size(messages))
+
+    @staticmethod
+    def _approximate_size(messages: List[Dict]) -> int:
+        """
+        A cheap estimate of the memory held by messages, used to bound the cache.
+        """
+        return sum(len(str(message)) for message in messages)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """
+        Returns the conversation cache's hit/miss/eviction counters, or an empty
+        dict if caching is disabled. A hit is a read that only fetched the version.
+        """
+        return self.cache.stats() if self.cache is not None else {}
+
+    def iter_messages(self, user_id: str, thread_name: str, batch_size: int = 500) -> Iterator[Dict]:
+        """
+        Yields the messages of a conversation one at a time, fetching them in
+        batches with a $slice projection so at most batch_size messages are held
+        in memory (or in flight) at once.
+
+        Args:
+            user_id (str): The user's ID
+            thread_name (str): The name of the conversation thread
+            batch_size (int): Number of messages fetched per round trip. In the
+                bucketed layout, whole buckets are fetched through a cursor instead.
+        """
+        self._flush_pending(user_id, thread_name)
+        conversation_id = f"{user_id}_{thread_name}"
+        if self.storage_layout == "bucketed":
+            buckets = self.message_buckets.find(
+                {"conversation_id": conversation_id}, projection={"_id": False, "messages": True}
+            ).sort("bucket", 1).batch_size(max(1, batch_size // self.bucket_size))
+            for bucket in buckets:
+                for message in bucket["messages"]:
+                    yield self._strip_position(message)
+            return
+
+        skip = 0
+        while True:
+            document = self.conversations.find_one(
+                {"_id": conversation_id},
+                projection={"_id": False, "messages": {"$slice": [skip, batch_size]}},
+            )
+            if not document or not document.get("messages"):
+                return
+            batch = document["messages"]
+            yield from batch
+            if len(batch) < batch_size:
+                return
+            skip += batch_size
+
+    @timed("get_messages_since")
+    def get_messages_since(self, user_id: str, thread_name: str, seq: int) -> List[Dict]:
+        """
+        Returns only the messages added to a conversation after sequence number
+        seq, so a client that already holds the conversation can catch up
+        without fetching it again. Pass 0 to fetch everything.
+
+        Every append hands out the next sequence numbers of the thread, and
+        save_conversation() numbers the rewritten messages after all earlier
+        ones, so a client never misses a change by holding on to the highest
+        seq it has seen. The conversation document only stores last_seq; a
+        message's number is derived from its position, and only the new tail
+        of the messages array is sent over the wire.
+
+        Args:
+            user_id (str): The user's ID
+            thread_name (str): The name of the conversation thread
+            seq (int): The highest sequence number the client already has
+
+        Returns:
+            List[Dict]: The newer messages in order, each with its number under "seq"
+        """
+        self._flush_pending(user_id, thread_name)
+        conversation_id = f"{user_id}_{thread_name}"
+        if self.storage_layout == "bucketed":
+            return self._bucketed_since(conversation_id, seq)
+
+        documents = list(self.conversations.aggregate(self._since_pipeline(conversation_id, seq)))
+        if not documents:
+            return []
+        document = documents[0]
+        return self._number_messages(document["messages"], document["first_seq"])
+
+    @staticmethod
+    def _since_pipeline(conversation_id: str, seq: int) -> List[Dict]:
+        """
+        Builds the aggregation that slices the messages after seq out of an
+        embedded conversation, along with the sequence number of the first one.
+
+        The message at position i has number last_seq - message_count + i + 1.
+        Threads written before sequence numbers existed start at 1.
+        """
+        base = {"$max": [0, {"$subtract": [{"$ifNull": ["$last_seq", 0]}, {"$size": "$$messages"}]}]}
+        skip = {"$max": [0, {"$subtract": [seq, base]}]}
+        return [
+            {"$match": {"_id": conversation_id}},
+            {"$project": {"_id": False, "result": {"$let": {
+                "vars": {"messages": {"$ifNull": ["$messages", []]}},
+                "in": {"$let": {
+                    "vars": {"base": base, "skip": skip},
+                    "in": {
+                        "first_seq": {"$add": ["$$base", "$$skip", 1]},
+                        # $slice needs a positive count; a skip past the end yields []
+                        "messages": {"$slice": ["$$messages", "$$skip", {
+                            "$max": [1, {"$subtract": [{"$size": "$$messages"}, "$$skip"]}]}]},
+                    },
+                }},
+            }}}},
+            {"$replaceRoot": {"newRoot": "$result"}},
+        ]
+
+    def _bucketed_since(self, conversation_id: str, seq: int) -> List[Dict]:
+        """
+        Reads the messages after seq from a bucketed conversation, fetching only
+        the buckets that hold them.
+        """
+        document = self.conversations.find_one({"_id": conversation_id}, {"message_count": True, "last_seq": True})
+        if not document:
+            return []
+        count = document.get("message_count", 0)
+        base = max(0, document.get("last_seq", 0) - count)
+        first = max(0, seq - base)
+        if first >= count:
+            return []
+
+        buckets = self.message_buckets.find(
+            {"conversation_id": conversation_id, "bucket": {"$gte": first // self.bucket_size}},
+            projection={"_id": False, "messages": True},
+        ).sort("bucket", 1)
+        messages = []
+        for bucket in buckets:
+            for message in bucket["messages"]:
+                position = message[POSITION_FIELD]
+                if first <= position < count:
+                    messages.append(self._strip_position(message))
+        return self._number_messages(messages, base + first + 1)
+
+    @staticmethod
+    def _number_messages(messages: List[Dict], first_seq: int) -> List[Dict]:
+        """
+        Returns copies of consecutive messages tagged with their sequence numbers.
+        """
+        return [{**message, SEQUENCE_FIELD: first_seq + offset} for offset, message in enumerate(messages)]
+
+    @staticmethod
+    def _slice_spec(limit: Optional[int], before: Optional[int]):
+        """
+        Converts a (limit, before) page request into a $slice argument, or None
+        if the page is empty.
+        """
+        if before is None:
+            return -limit if limit > 0 else None
+        skip = 0 if limit is None else max(0, before - limit)
+        count = before - skip
+        return [skip, count] if count > 0 else None
+
+    @timed("save_conversation")
+    def save_conversation(self, user_id: str, thread_name: str, messages: List[Dict],
+                          durability: Optional[str] = None) -> None:
         """
         --- TODO 3: Save a conversation to MongoDB ---
         Saves the entire conversation, replacing the existing one if it exists.
@@ -74,6 +672,7 @@ class MongoDBManager:
             user_id (str): The user's ID
             thread_name (str): The name of the conversation thread
             messages (List[Dict]): List of message dictionaries
+            durability (Optional[str]): Overrides the manager's durability for this write
 
         Steps:
         1. Create a conversation_id by combining user_id and thread_name (e.g., f"{user_id}_{thread_name}")
@@ -91,7 +690,13 @@ class MongoDBManager:
 
         Hint: self.conversations.update_one({filter goes here}, {update goes here}, upsert=True)
         """
+        if durability is not None:
+            check_durability(durability)
+        self._flush_pending(user_id, thread_name)
+        self._verify_indexes()
         conversation_id = f"{user_id}_{thread_name}"
+        if self.metrics is not None:
+            self.metrics.increment(self.metrics_backend, BYTES_WRITTEN, self._approximate_size(messages))
         
         document = {
            "_id": conversation_id,
@@ -100,10 +705,60 @@ class MongoDBManager:
            "messages": messages,
             "created_at": datetime.now(UTC).isoformat(),
             "updated_at": datetime.now(UTC).isoformat(),
+            "message_count": len(messages),
+            **self._last_message_fields(messages),
         }
-        self.conversations.update_one({"_id": conversation_id},{"$set": document},upsert=True)
+        if self.storage_layout == "bucketed":
+            # Not atomic with respect to concurrent appends to the same thread
+            del document["messages"]
+            message_buckets = self._collection("message_buckets", durability)
+            message_buckets.delete_many({"conversation_id": conversation_id})
+            buckets = [
+                {
+                    "conversation_id": conversation_id,
+                    "user_id": user_id,
+                    "thread_name": thread_name,
+                    "bucket": start // self.bucket_size,
+                    "messages": [{**message, POSITION_FIELD: start + offset}
+                                 for offset, message in enumerate(messages[start:start + self.bucket_size])],
+                }
+                for start in range(0, len(messages), self.bucket_size)
+            ]
+            if buckets:
+                message_buckets.insert_many(buckets)
+
+        # Rewritten messages get new sequence numbers after every one handed out before
+        version = self._write_conversation(
+            conversation_id, {"$set": document, "$inc": {"last_seq": len(messages), "version": 1}}, durability)
+        self._cache_store(conversation_id, version, messages)
 
-    def append_message(self, user_id: str, thread_name: str, message: Dict) -> None:
+    def _write_conversation(self, conversation_id: str, update: Dict,
+                            durability: Optional[str] = None) -> Optional[int]:
+        """
+        Applies an upserting update to a conversation document. With the cache
+        enabled it is sent as a find_one_and_update, in the same single round
+        trip, so the new version comes back with it.
+
+        Returns:
+            Optional[int]: The conversation's new version, or None without a cache
+            or for a fire-and-forget write
+        """
+        conversations = self._collection("conversations", durability)
+        if self.cache is None or (durability or self.durability) == FIRE_AND_FORGET:
+            conversations.update_one({"_id": conversation_id}, update, upsert=True)
+            return None
+        from pymongo import ReturnDocument
+        document = conversations.find_one_and_update(
+            {"_id": conversation_id}, update,
+            projection={"_id": False, "version": True},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return document["version"]
+
+    @timed("append_message")
+    def append_message(self, user_id: str, thread_name: str, message: Dict,
+                       durability: Optional[str] = None) -> None:
         """
         --- TODO 4: Append a single message to a conversation ---
         This is a more efficient operation than rewriting the entire conversation.
@@ -112,6 +767,7 @@ class MongoDBManager:
             user_id (str): The user's ID
             thread_name (str): The name of the conversation thread
             message (Dict): A single message dictionary to append
+            durability (Optional[str]): Overrides the manager's durability for this write
 
         Steps:
         1. Create conversation_id like in save_conversation
@@ -125,24 +781,362 @@ class MongoDBManager:
         Hint: $push adds to an array, $setOnInsert sets values only on insert
         Hint: update_one(filter, {"$push": {...}, "$set": {...}, "$setOnInsert": {...}}, upsert=True)
         """
-        conversation_id = f"{user_id}_{thread_name}" 
-        update = {
-            "$push": {"messages": message},
-            "$set": {"updated_at": datetime.now(UTC).isoformat()},
-            "$setOnInsert": {
-                "_id": conversation_id,
-                "user_id": user_id,
-                "thread_name": thread_name,
-                "created_at": datetime.now(UTC).isoformat(),
-            }   
+        self._append_messages(user_id, thread_name, [message], durability)
+
+    @timed("append_messages")
+    def append_messages(self, user_id: str, thread_name: str, messages: List[Dict],
+                        durability: Optional[str] = None) -> None:
+        """
+        Appends several messages to a conversation in a single $push with $each,
+        so a chat turn (user message plus assistant reply) is one round trip.
+        In write-behind mode the messages are buffered instead; see flush().
+
+        Args:
+            user_id (str): The user's ID
+            thread_name (str): The name of the conversation thread
+            messages (List[Dict]): Messages to append, in order
+            durability (Optional[str]): Overrides the manager's durability for this
+                write. In write-behind mode, an append with its own durability skips
+                the buffer (after flushing the thread's buffered appends).
+        """
+        self._append_messages(user_id, thread_name, messages, durability)
+
+    def _append_messages(self, user_id: str, thread_name: str, messages: List[Dict],
+                         durability: Optional[str]) -> None:
+        """
+        Implements append_messages() and append_message(), so that each call is
+        timed once, under the name of the method that was called.
+        """
+        if durability is not None:
+            check_durability(durability)
+        if not messages:
+            return
+        if self.metrics is not None:
+            self.metrics.increment(self.metrics_backend, BYTES_WRITTEN, self._approximate_size(messages))
+        timestamp = datetime.now(UTC).isoformat()
+
+        if durability is not None:
+            self._flush_pending(user_id, thread_name)
+        elif self.write_behind:
+            conversation_id = f"{user_id}_{thread_name}"
+            with self._pending_lock:
+                pending = self._pending.get(conversation_id)
+                if pending is None:
+                    self._pending[conversation_id] = (user_id, thread_name, list(messages), timestamp)
+                else:
+                    pending[2].extend(messages)
+                    self._pending[conversation_id] = (user_id, thread_name, pending[2], timestamp)
+                self._pending_count += len(messages)
+                full = self._pending_count >= self.flush_size
+            if full:
+                self.flush()
+            return
+
+        self._verify_indexes()
+        conversation_id = f"{user_id}_{thread_name}"
+        if self.storage_layout == "bucketed":
+            first_position, version = self._reserve_positions(user_id, thread_name, messages, timestamp, durability)
+            self._collection("message_buckets", durability).bulk_write(
+                self._bucket_pushes(user_id, thread_name, first_position, messages), ordered=False)
+        else:
+            version = self._write_conversation(
+                conversation_id, self._append_update(user_id, thread_name, messages, timestamp), durability)
+        self._cache_appended(conversation_id, version, messages)
+
+    @staticmethod
+    def _insert_fields(user_id: str, thread_name: str, timestamp: str) -> Dict:
+        """
+        Fields set only when an append creates a new conversation document.
+        """
+        return {
+            "_id": f"{user_id}_{thread_name}",
+            "user_id": user_id,
+            "thread_name": thread_name,
+            "created_at": timestamp,
+        }
+
+    def _append_update(self, user_id: str, thread_name: str, messages: List[Dict], timestamp: str) -> Dict:
+        """
+        Builds the upsert update document that appends messages to a conversation.
+        """
+        return {
+            "$push": {"messages": {"$each": messages}},
+            "$inc": {"message_count": len(messages), "last_seq": len(messages), "version": 1},
+            "$set": {"updated_at": timestamp, **self._last_message_fields(messages)},
+            "$setOnInsert": self._insert_fields(user_id, thread_name, timestamp),
         }
 
-        self.conversations.update_one(
-            {"_id": conversation_id},
-            update,
-            upsert=True
+    @staticmethod
+    def _last_message_fields(messages: List[Dict]) -> Dict:
+        """
+        Thread listing fields describing the last of messages, kept on the
+        conversation document so listings never read the messages themselves.
+        """
+        if not messages:
+            return {"last_role": None, "last_preview": None}
+        last = messages[-1]
+        content = last.get("content")
+        return {
+            "last_role": last.get("role"),
+            "last_preview": content[:PREVIEW_LENGTH] if isinstance(content, str) else content,
+        }
+
+    def _reserve_positions(self, user_id: str, thread_name: str, messages: List[Dict],
+                           timestamp: str, durability: Optional[str] = None) -> Tuple[int, int]:
+        """
+        Atomically reserves positions for messages in a bucketed conversation by
+        incrementing its message_count, and returns the first reserved position
+        along with the conversation's new version. The reservation has to be
+        acknowledged, so fire-and-forget appends still wait for it.
+        """
+        from pymongo import ReturnDocument
+        if (durability or self.durability) == FIRE_AND_FORGET:
+            durability = ACKNOWLEDGED
+        count = len(messages)
+        document = self._collection("conversations", durability).find_one_and_update(
+            {"_id": f"{user_id}_{thread_name}"},
+            {
+                "$inc": {"message_count": count, "last_seq": count, "version": 1},
+                "$set": {"updated_at": timestamp, **self._last_message_fields(messages)},
+                "$setOnInsert": self._insert_fields(user_id, thread_name, timestamp),
+            },
+            projection={"message_count": True, "version": True},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
         )
+        return document["message_count"] - count, document["version"]
 
+    def _bucket_pushes(self, user_id: str, thread_name: str, first_position: int,
+                       messages: List[Dict]) -> List["UpdateOne"]:
+        """
+        Builds one upserting $push per bucket touched by messages starting at
+        first_position. Each bucket is kept sorted by position, so concurrent
+        appenders that reserved adjacent positions cannot interleave out of order.
+        New buckets record their user and thread for search_messages().
+        """
+        from pymongo import UpdateOne
+        conversation_id = f"{user_id}_{thread_name}"
+        grouped = {}
+        for offset, message in enumerate(messages):
+            position = first_position + offset
+            grouped.setdefault(position // self.bucket_size, []).append({**message, POSITION_FIELD: position})
+        return [
+            UpdateOne(
+                {"conversation_id": conversation_id, "bucket": bucket},
+                {
+                    "$push": {"messages": {"$each": entries, "$sort": {POSITION_FIELD: 1}}},
+                    "$setOnInsert": {"user_id": user_id, "thread_name": thread_name},
+                },
+                upsert=True,
+            )
+            for bucket, entries in grouped.items()
+        ]
+
+    def _bucketed_get(self, conversation_id: str, limit: Optional[int], before: Optional[int]) -> List[Dict]:
+        """
+        Reads a page of a bucketed conversation, fetching only the buckets that
+        overlap positions [before - limit, before).
+        """
+        start, end = 0, None
+        if limit is not None or before is not None:
+            end = before
+            if end is None:
+                document = self.conversations.find_one({"_id": conversation_id}, {"message_count": True})
+                if not document:
+                    return []
+                end = document.get("message_count", 0)
+            start = 0 if limit is None else max(0, end - limit)
+            if start >= end:
+                return []
+
+        query = {"conversation_id": conversation_id}
+        if end is not None:
+            query["bucket"] = {"$gte": start // self.bucket_size, "$lte": (end - 1) // self.bucket_size}
+        buckets = self.message_buckets.find(query, projection={"_id": False, "messages": True}).sort("bucket", 1)
+
+        messages = []
+        for bucket in buckets:
+            for message in bucket["messages"]:
+                position = message[POSITION_FIELD]
+                if position >= start and (end is None or position < end):
+                    messages.append(self._strip_position(message))
+        return messages
+
+    @staticmethod
+    def _strip_position(message: Dict) -> Dict:
+        """
+        Removes the bucketed layout's position field from a stored message.
+        """
+        return {key: value for key, value in message.items() if key != POSITION_FIELD}
+
+    @timed("flush")
+    def flush(self, conversation_id: Optional[str] = None) -> None:
+        """
+        Writes buffered write-behind appends to MongoDB with one bulk_write.
+        If a background flush failed, its error is raised here.
+
+        Args:
+            conversation_id (Optional[str]): If set, only flush this conversation
+        """
+        if conversation_id is None:
+            self._flush_where(lambda key, pending: True)
+        else:
+            self._flush_where(lambda key, pending: key == conversation_id)
+
+    def _flush_where(self, selected) -> None:
+        """
+        Flushes the buffered appends of the conversations for which
+        selected(conversation_id, pending) is true. See flush().
+
+        Flushes run one at a time. A flush that started earlier may still be
+        writing an older batch of the same thread, so a flush waits for it
+        instead of writing newer messages ahead of it; when it returns, every
+        append made before it is stored.
+        """
+        with self._flush_lock:
+            self._flush_batch(selected)
+
+    def _flush_batch(self, selected) -> None:
+        """
+        Takes the selected buffered appends and writes them. The caller holds self._flush_lock.
+        """
+        with self._pending_lock:
+            batch = {key: pending for key, pending in self._pending.items() if selected(key, pending)}
+            for key in batch:
+                del self._pending[key]
+            self._pending_count -= sum(len(pending[2]) for pending in batch.values())
+            error, self._flush_error = self._flush_error, None
+
+        if batch:
+            from pymongo import UpdateOne
+            try:
+                self._verify_indexes()
+                if self.storage_layout == "bucketed":
+                    requests = []
+                    for key, (user_id, thread_name, messages, timestamp) in batch.items():
+                        first_position, _ = self._reserve_positions(user_id, thread_name, messages, timestamp)
+                        requests.extend(self._bucket_pushes(user_id, thread_name, first_position, messages))
+                    self._collection("message_buckets").bulk_write(requests, ordered=False)
+                else:
+                    requests = [
+                        UpdateOne({"_id": key}, self._append_update(user_id, thread_name, messages, timestamp),
+                                  upsert=True)
+                        for key, (user_id, thread_name, messages, timestamp) in batch.items()
+                    ]
+                    self._collection("conversations").bulk_write(requests, ordered=False)
+            except Exception:
+                self._requeue(batch)
+                raise
+            finally:
+                if self.cache is not None:
+                    # bulk_write does not report versions, so drop the stale entries
+                    for key in batch:
+                        self.cache.invalidate(key)
+        if error is not None:
+            raise error
+
+    def _requeue(self, batch: Dict) -> None:
+        """
+        Puts a batch that failed to flush back in front of any newer appends.
+        """
+        with self._pending_lock:
+            for key, (user_id, thread_name, messages, timestamp) in batch.items():
+                newer = self._pending.get(key)
+                if newer is not None:
+                    messages = messages + newer[2]
+                    timestamp = newer[3]
+                self._pending[key] = (user_id, thread_name, messages, timestamp)
+            self._pending_count = sum(len(pending[2]) for pending in self._pending.values())
+
+    def _flush_loop(self) -> None:
+        """
+        Flushes the write-behind buffer every flush_interval seconds until close().
+        """
+        while not self._stop_flushing.wait(self.flush_interval):
+            if not self._pending:
+                continue
+            try:
+                self.flush()
+            except Exception as e:
+                with self._pending_lock:
+                    self._flush_error = e
+
+    def _flush_pending(self, user_id: str, thread_name: str) -> None:
+        """
+        Flushes buffered appends for one conversation so reads and rewrites see
+        them, waiting for a flush in progress, which may hold some of them.
+        """
+        if self._pending or self._flush_lock.locked():
+            self.flush(f"{user_id}_{thread_name}")
+
+    def _flush_user_pending(self, user_id: str) -> None:
+        """
+        Flushes buffered appends for all of a user's conversations, so listings
+        see them, waiting for a flush in progress like _flush_pending().
+        """
+        if self._pending or self._flush_lock.locked():
+            self._flush_where(lambda key, pending: pending[0] == user_id)
+
+    @timed("search_messages")
+    def search_messages(self, user_id: str, query: str, limit: int = 20) -> List[Dict]:
+        """
+        Finds a user's messages that mention any word of query, across all of
+        their threads, without transferring the conversations.
+
+        The text index (user_id, messages.content) selects the user's matching
+        conversations (or buckets, in the bucketed layout). The same aggregation
+        then unwinds their messages on the server and keeps only the ones that
+        contain a query word, so only matching messages cross the network. Hits
+        are ranked by their conversation's text score, newest message first
+        within a conversation. The text index stems words while the message
+        filter matches word prefixes, so "cat" finds "cats" but "cats" does not
+        find a message that only says "cat".
+
+        Needs a manager created with full_text_search=True.
+
+        Args:
+            user_id (str): The user's ID
+            query (str): Words to look for; case and punctuation are ignored
+            limit (int): Maximum number of messages to return
+
+        Returns:
+            List[Dict]: Hits with "thread_name", "position" (the message's index
+            in its thread), "message" and "score" keys
+        """
+        if not self.full_text_search:
+            raise RuntimeError("Full-text search is disabled; create the manager with full_text_search=True")
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or limit <= 0:
+            return []
+        self._flush_user_pending(user_id)
+        self._verify_indexes()
+        bucketed = self.storage_layout == "bucketed"
+        collection = self.message_buckets if bucketed else self.conversations
+        hits = list(collection.aggregate(self._search_pipeline(user_id, terms, limit, bucketed)))
+        for hit in hits:
+            hit["message"] = self._strip_position(hit["message"])
+        return hits
+
+    @staticmethod
+    def _search_pipeline(user_id: str, terms: List[str], limit: int, bucketed: bool) -> List[Dict]:
+        """
+        Builds the aggregation behind search_messages(). In the embedded layout a
+        message's position is its array index; buckets store it on the message.
+        """
+        pattern = r"\b(?:" + "|".join(re.escape(term) for term in terms) + ")"
+        position = f"$messages.{POSITION_FIELD}" if bucketed else "$position"
+        unwind = {"path": "$messages"} if bucketed else {"path": "$messages", "includeArrayIndex": "position"}
+        return [
+            {"$match": {"user_id": user_id, "$text": {"$search": " ".join(terms)}}},
+            {"$project": {"_id": False, "thread_name": True, "messages": True, "score": {"$meta": "textScore"}}},
+            {"$unwind": unwind},
+            {"$match": {"messages.content": {"$regex": pattern, "$options": "i"}}},
+            {"$project": {"thread_name": True, "position": position, "message": "$messages", "score": True}},
+            {"$sort": {"score": -1, "position": -1}},
+            {"$limit": limit},
+        ]
+
+    @timed("list_user_threads")
     def list_user_threads(self, user_id: str) -> List[str]:
         """
         --- TODO 5: List all conversation threads for a user ---
@@ -158,35 +1152,108 @@ class MongoDBManager:
         2. Use projection to only return the thread_name field: {"thread_name": True, "_id": False}
 
         Hint: list(self.conversations.find({"user_id": user_id}, {"thread_name": True, "_id": False}))
+
+        Threads are returned most recently updated first. Use list_threads() to
+        page through them with their message counts and previews.
         """
-        matches = list(self.conversations.find({"user_id": user_id}, {"thread_name": True, "_id": False}))
+        self._flush_user_pending(user_id)
+        self._verify_indexes()
+        matches = self.conversations.find(
+            {"user_id": user_id}, {"thread_name": True, "_id": False}
+        ).sort([("updated_at", -1), ("thread_name", 1)]).hint("thread_listing")
         thread_names = []
         for record in matches:
             thread_names.append(record["thread_name"])
-            pass
         return thread_names
 
-    def delete_conversation(self, user_id: str, thread_name: str) -> bool:
+    @timed("list_threads")
+    def list_threads(self, user_id: str, limit: int = 20, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Lists a page of a user's threads, most recently updated first, with each
+        thread's message count, last update time and a preview of its last message.
+        The listing is answered from the thread_listing index alone.
+
+        Args:
+            user_id (str): The user's ID
+            limit (int): Maximum number of threads to return
+            cursor (Optional[str]): The cursor returned with the previous page
+
+        Returns:
+            Tuple[List[Dict], Optional[str]]: The threads, and a cursor for the next
+            page (None when there are no more threads)
+        """
+        self._flush_user_pending(user_id)
+        self._verify_indexes()
+        query = {"user_id": user_id}
+        if cursor is not None:
+            updated_at, thread_name = cursor.split("|", 1)
+            query["$or"] = [
+                {"updated_at": {"$lt": updated_at}},
+                {"updated_at": updated_at, "thread_name": {"$gt": thread_name}},
+            ]
+
+        projection = {field: True for field in THREAD_LISTING_FIELDS}
+        projection["_id"] = False
+        records = list(
+            self.conversations.find(query, projection)
+            .sort([("updated_at", -1), ("thread_name", 1)])
+            .hint("thread_listing")
+            .limit(limit + 1)
+        )
+
+        threads = [{
+            "thread_name": record["thread_name"],
+            "message_count": record.get("message_count", 0),
+            "updated_at": record.get("updated_at"),
+            "last_role": record.get("last_role"),
+            "last_preview": record.get("last_preview"),
+        } for record in records[:limit]]
+
+        next_cursor = None
+        if len(records) > limit:
+            last = threads[-1]
+            next_cursor = f"{last['updated_at']}|{last['thread_name']}"
+        return threads, next_cursor
+
+    @timed("delete_conversation")
+    def delete_conversation(self, user_id: str, thread_name: str, durability: Optional[str] = None) -> bool:
         """
         Deletes a conversation. Already implemented for you.
 
         Args:
             user_id (str): The user's ID
             thread_name (str): The name of the conversation thread
+            durability (Optional[str]): Overrides the manager's durability for this write
 
         Returns:
-            bool: True if a conversation was deleted, False otherwise
+            bool: True if a conversation was deleted, False otherwise. A
+            fire-and-forget delete is not acknowledged, so it returns True.
         """
+        if durability is not None:
+            check_durability(durability)
+        self._flush_pending(user_id, thread_name)
         conversation_id = f"{user_id}_{thread_name}"
-        result = self.conversations.delete_one({"_id": conversation_id})
-        return result.deleted_count > 0
+        result = self._collection("conversations", durability).delete_one({"_id": conversation_id})
+        if self.cache is not None:
+            self.cache.invalidate(conversation_id)
+        if self.storage_layout == "bucketed":
+            self._collection("message_buckets", durability).delete_many({"conversation_id": conversation_id})
+        self._collection(STATS_COLLECTION, durability).delete_one({"_id": conversation_id})
+        return result.deleted_count > 0 if result.acknowledged else True
 
     def close(self) -> None:
         """
         Closes the MongoDB connection. Already implemented for you.
+        Any buffered write-behind appends are flushed first.
         """
-        if self.client:
-            self.client.close()
+        self._stop_flushing.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+            self._flush_thread = None
+        self.flush()
+        if self._client:
+            self._client.close()
+            self._client = None
 
     def _wipe_database(self) -> None:
         """
@@ -194,6 +1261,9 @@ class MongoDBManager:
         Already implemented for you.
         """
         self.conversations.delete_many({})
+        self.message_buckets.delete_many({})
+        if self.cache is not None:
+            self.cache.clear()
 
 
 # Test code
@@ -207,7 +1277,8 @@ if __name__ == "__main__":
     manager = MongoDBManager(connection_string=connection_string, database_name="chai_test_db")
 
     print("Testing MongoDBManager._ensure_indexes()")
-    # Indexes are created automatically in __init__
+    # Indexes are verified automatically before the first write
+    manager._verify_indexes()
     indexes = list(manager.conversations.list_indexes())
     print(f"Created {len(indexes)} indexes")
 
@@ -234,6 +1305,130 @@ if __name__ == "__main__":
     else:
         print(f"Failed! Expected 3 messages, got {len(retrieved)}")
 
+    print("\nTesting MongoDBManager.get_conversation() pagination")
+    last_two = manager.get_conversation("test_user", "test_thread", limit=2)
+    first_one = manager.get_conversation("test_user", "test_thread", limit=1, before=1)
+    if [m["content"] for m in last_two] == ["Hi there!", "another message"] and first_one[0]["content"] == "hello world":
+        print("Successfully paginated conversation!")
+    else:
+        print(f"Failed! Got {last_two} and {first_one}")
+
+    print("\nTesting MongoDBManager.iter_messages()")
+    streamed = list(manager.iter_messages("test_user", "test_thread", batch_size=2))
+    if streamed == manager.get_conversation("test_user", "test_thread"):
+        print("Successfully streamed conversation!")
+    else:
+        print(f"Failed! Got {streamed}")
+
+    print("\nTesting MongoDBManager.append_messages()")
+    manager.append_messages("test_user", "test_thread", [
+        {"role": "user", "content": "batched question"},
+        {"role": "assistant", "content": "batched answer"},
+    ])
+    retrieved = manager.get_conversation("test_user", "test_thread")
+    if len(retrieved) == 5:
+        print("Successfully appended messages!")
+    else:
+        print(f"Failed! Expected 5 messages, got {len(retrieved)}")
+
+    print("\nTesting MongoDBManager.get_conversations()")
+    conversations = manager.get_conversations("test_user", ["test_thread", "missing_thread"], limit=2)
+    if [m["content"] for m in conversations["test_thread"]] == ["batched question", "batched answer"] \
+            and conversations["missing_thread"] == []:
+        print("Successfully retrieved multiple conversations!")
+    else:
+        print(f"Failed! Got {conversations}")
+
+    print("\nTesting MongoDBManager.get_messages_since()")
+    newer = manager.get_messages_since("test_user", "test_thread", 3)
+    if [(m["seq"], m["content"]) for m in newer] == [(4, "batched question"), (5, "batched answer")] \
+            and manager.get_messages_since("test_user", "test_thread", 5) == []:
+        print("Successfully fetched only the newer messages!")
+    else:
+        print(f"Failed! Got {newer}")
+
+    print("\nTesting MongoDBManager versioned cache")
+    cached = MongoDBManager(connection_string=connection_string, database_name="chai_test_db", cache_entries=8)
+    cached.get_conversation("test_user", "test_thread")
+    cached.get_conversation("test_user", "test_thread")
+    cached.append_message("test_user", "test_thread", {"role": "user", "content": "cached append"})
+    retrieved = cached.get_conversation("test_user", "test_thread")
+    manager.append_message("test_user", "test_thread", {"role": "assistant", "content": "written elsewhere"})
+    refreshed = cached.get_conversation("test_user", "test_thread")
+    if len(retrieved) == 6 and len(refreshed) == 7 and cached.cache_stats()["hits"] == 2:
+        print("Successfully revalidated cached conversation!")
+    else:
+        print(f"Failed! Got {len(retrieved)} and {len(refreshed)} messages, {cached.cache_stats()}")
+    cached.save_conversation("test_user", "test_thread", manager.get_conversation("test_user", "test_thread")[:5])
+    cached.close()
+
+    print("\nTesting MongoDBManager write-behind buffering")
+    buffered = MongoDBManager(connection_string=connection_string, database_name="chai_test_db", write_behind=True)
+    buffered.append_message("test_user", "buffered_thread", {"role": "user", "content": "one"})
+    buffered.append_message("test_user", "buffered_thread", {"role": "assistant", "content": "two"})
+    buffered.close()
+    retrieved = manager.get_conversation("test_user", "buffered_thread")
+    if len(retrieved) == 2:
+        print("Successfully flushed buffered appends!")
+    else:
+        print(f"Failed! Expected 2 messages, got {len(retrieved)}")
+    manager.delete_conversation("test_user", "buffered_thread")
+
+    print("\nTesting MongoDBManager write-behind flush ordering")
+    racing = MongoDBManager(connection_string=connection_string, database_name="chai_test_db",
+                            write_behind=True, flush_interval=3600)
+    in_flight, release = threading.Event(), threading.Event()
+
+    class _HeldBulkWrite:
+        """Holds a background flush's bulk_write until release is set."""
+        def __init__(self, collection):
+            self.collection = collection
+
+        def bulk_write(self, requests, **kwargs):
+            in_flight.set()
+            release.wait(10)
+            return self.collection.bulk_write(requests, **kwargs)
+
+    racing._collection = lambda name, durability=None: _HeldBulkWrite(MongoDBManager._collection(racing, name))
+    racing.append_message("test_user", "racing_thread", {"role": "user", "content": "A"})
+    background = threading.Thread(target=racing.flush)
+    background.start()
+    in_flight.wait(10)
+    del racing._collection
+    racing.append_message("test_user", "racing_thread", {"role": "user", "content": "B"})
+    reads = []
+    reader = threading.Thread(target=lambda: reads.append(racing.get_conversation("test_user", "racing_thread")))
+    reader.start()
+    time.sleep(0.1)
+    release.set()
+    background.join()
+    reader.join()
+    racing.close()
+    stored = manager.get_conversation("test_user", "racing_thread")
+    if [[m["content"] for m in read] for read in reads] == [["A", "B"]] and [m["content"] for m in stored] == ["A", "B"]:
+        print("Successfully read own appends in order during a background flush!")
+    else:
+        print(f"Failed! Read {reads}, stored {stored}")
+    manager.delete_conversation("test_user", "racing_thread")
+
+    print("\nTesting MongoDBManager bucketed layout")
+    bucketed = MongoDBManager(connection_string=connection_string, database_name="chai_test_db",
+                              storage_layout="bucketed", bucket_size=2)
+    bucketed.save_conversation("test_user", "bucketed_thread", messages)
+    bucketed.append_messages("test_user", "bucketed_thread", [
+        {"role": "user", "content": "third"},
+        {"role": "assistant", "content": "fourth"},
+        {"role": "user", "content": "fifth"},
+    ])
+    retrieved = bucketed.get_conversation("test_user", "bucketed_thread")
+    last_two = bucketed.get_conversation("test_user", "bucketed_thread", limit=2)
+    if len(retrieved) == 5 and [m["content"] for m in last_two] == ["fourth", "fifth"]:
+        print("Successfully stored messages in buckets!")
+    else:
+        print(f"Failed! Got {retrieved}")
+    bucketed.delete_conversation("test_user", "bucketed_thread")
+    bucketed.close()
+
     print("\nTesting MongoDBManager.list_user_threads()")
     manager.save_conversation("test_user", "thread2", [{"role": "user", "content": "test"}])
     threads = manager.list_user_threads("test_user")
@@ -242,7 +1437,27 @@ if __name__ == "__main__":
     else:
         print(f"Failed! Expected 2 threads, got {len(threads)}: {threads}")
 
+    print("\nTesting MongoDBManager.list_threads()")
+    page, cursor = manager.list_threads("test_user", limit=1)
+    rest, end_cursor = manager.list_threads("test_user", limit=1, cursor=cursor)
+    if page[0]["thread_name"] == "thread2" and rest[0]["thread_name"] == "test_thread" and end_cursor is None \
+            and rest[0]["message_count"] == 5 and rest[0]["last_preview"] == "batched answer":
+        print(f"Successfully listed threads with metadata: {page + rest}")
+    else:
+        print(f"Failed! Got {page} and {rest}")
+
+    print("\nTesting MongoDBManager.search_messages()")
+    searchable = MongoDBManager(connection_string=connection_string, database_name="chai_test_db",
+                                full_text_search=True)
+    hits = searchable.search_messages("test_user", "batched answer")
+    if hits and hits[0]["thread_name"] == "test_thread" and hits[0]["message"]["content"] == "batched answer" \
+            and not searchable.search_messages("other_user", "batched"):
+        print(f"Successfully searched messages: {[(hit['thread_name'], hit['position']) for hit in hits]}")
+    else:
+        print(f"Failed! Got {hits}")
+
     print("\nCleaning up test data...")
+    searchable.close()
     manager._wipe_database()
     manager.close()
     print("All tests passed!")
\ No newline at end of file
@@ -0,0 +1,114 @@
+import time
+import threading
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+
+# Phases the managers report: encoding messages, file reads and writes
+# (including fsync), decoding messages, and MongoDB command round trips
+SERIALIZE = "serialize"
+IO = "io"
+DESERIALIZE = "deserialize"
+ROUND_TRIP = "round_trip"
+
+_NOT_RECORDING = nullcontext()
+
+# The PhaseRecorder collecting phase timings, if any. Instrumentation points
+# only look this up, so they cost next to nothing when nobody is recording.
+_recorder: Optional["PhaseRecorder"] = None
+
+
+class PhaseRecorder:
+    """
+    Accumulates the time the storage managers spend in each phase of their
+    operations, for profiling. Only one recorder is installed at a time, with
+    install(), and it only counts while recording is True.
+
+    Phases do not nest: time spent in a phase entered while another is open
+    on the same thread counts towards the outer one only.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.recording = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def add(self, name: str, seconds: float) -> None:
+        """
+        Records seconds spent in phase name.
+        """
+        if not self.recording:
+            return
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def install(self) -> None:
+        global _recorder
+        _recorder = self
+
+    def uninstall(self) -> None:
+        global _recorder
+        if _recorder is self:
+            _recorder = None
+
+
+class _PhaseTimer:
+    """
+    Times one phase into a recorder, unless another phase is already open on this thread.
+    """
+    __slots__ = ("recorder", "name", "start", "outermost")
+
+    def __init__(self, recorder: PhaseRecorder, name: str):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        local = self.recorder._local
+        self.outermost = not getattr(local, "open", False)
+        if self.outermost:
+            local.open = True
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.outermost:
+            self.recorder.add(self.name, time.perf_counter() - self.start)
+            self.recorder._local.open = False
+
+
+def phase(name: str):
+    """
+    Returns a context manager timing its block as phase name, if a recorder is installed.
+    """
+    recorder = _recorder
+    return _NOT_RECORDING if recorder is None else _PhaseTimer(recorder, name)
+
+
+def event_listeners() -> List:
+    """
+    Returns the pymongo event listeners a new MongoClient should register: a
+    command listener reporting each command's round trip if a recorder is
+    installed, otherwise none (command monitoring slows every command down).
+
+    pymongo measures a round trip from sending the encoded command to having
+    decoded the reply, so ROUND_TRIP includes decoding; encoding the command
+    and the manager's own work happen outside it.
+    """
+    if _recorder is None:
+        return []
+    from pymongo import monitoring
+
+    class RoundTripListener(monitoring.CommandListener):
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            recorder = _recorder
+            if recorder is not None:
+                recorder.add(ROUND_TRIP, event.duration_micros / 1_000_000)
+
+        def failed(self, event):
+            self.succeeded(event)
+
+    return [RoundTripListener()]
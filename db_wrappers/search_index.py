@@ -0,0 +1,296 @@
+import os
+import re
+import json
+import math
+import heapq
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+SEARCH_INDEX_FILENAME = "search.idx"
+SEARCH_JOURNAL_FILENAME = "search.journal"
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lowercase word terms.
+    """
+    return _TOKEN.findall(text.lower())
+
+
+def message_text(message: any) -> str:
+    """
+    Returns the searchable text of a message: its "content" if that is a string.
+    """
+    if isinstance(message, dict) and isinstance(message.get("content"), str):
+        return message["content"]
+    return ""
+
+
+class SearchIndex:
+    """
+    An inverted index from terms to the messages that contain them, kept next
+    to a FlatFileManager's conversations index so searches never open
+    conversation files.
+
+    Postings map term -> conversation ID -> {sequence number: term frequency}.
+    Changes are appended to search.journal as they happen and folded into a
+    checkpoint, search.idx, every checkpoint_interval changes. The checkpoint
+    stores each posting list as delta-encoded sequence numbers and is
+    zlib-compressed. Each checkpoint bumps a generation number that is also the
+    header of the journal started after it, so a journal left over by a crash
+    between the two renames is known to be folded in already and is not
+    replayed twice. Everything here can be rebuilt from the conversation files.
+    """
+
+    def __init__(self, directory: str, checkpoint_interval: int = 1000):
+        """
+        Loads the checkpoint and replays the journal, if they exist.
+
+        Args:
+            directory (str): Directory holding search.idx and search.journal
+            checkpoint_interval (int): Number of journaled changes after which the
+                index is checkpointed
+        """
+        self.directory = directory
+        self.checkpoint_interval = checkpoint_interval
+        self._postings: Dict[str, Dict[str, Dict[int, int]]] = {}
+        self._document_frequency: Dict[str, int] = {}  # Term => number of messages containing it
+        self._terms: Dict[str, Set[str]] = {}  # Conversation ID => terms it contains
+        self._documents: Dict[str, int] = {}  # Conversation ID => number of messages indexed
+        self._total_documents = 0
+        self._journal_entries = 0
+        self._generation = 0  # Bumped by each checkpoint; a journal from an older one is skipped
+        self._load()
+
+    def exists(self) -> bool:
+        """
+        Returns True if the index has been written to disk before.
+        """
+        return (os.path.exists(os.path.join(self.directory, SEARCH_INDEX_FILENAME))
+                or os.path.exists(os.path.join(self.directory, SEARCH_JOURNAL_FILENAME)))
+
+    def _load(self) -> None:
+        """
+        Reads the checkpoint, then applies the journal on top of it if the
+        journal belongs to that checkpoint. A journal without a generation
+        header predates the first checkpoint. A torn final journal line is ignored.
+        """
+        index_file = os.path.join(self.directory, SEARCH_INDEX_FILENAME)
+        if os.path.exists(index_file):
+            with open(index_file, 'rb') as f:
+                checkpoint = json.loads(zlib.decompress(f.read()))
+            self._generation = checkpoint.get("generation", 0)
+            for conversation_id, count in checkpoint["documents"].items():
+                self._documents[conversation_id] = count
+                self._total_documents += count
+            for term, conversations in checkpoint["postings"].items():
+                for conversation_id, encoded in conversations.items():
+                    seq = 0
+                    for position in range(0, len(encoded), 2):
+                        seq += encoded[position]
+                        self._add_posting(term, conversation_id, seq, encoded[position + 1])
+
+        journal_file = os.path.join(self.directory, SEARCH_JOURNAL_FILENAME)
+        try:
+            with open(journal_file, 'r') as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    entry = json.loads(line)
+                    if "generation" in entry:
+                        if entry["generation"] != self._generation:
+                            # Stale journal, already in the checkpoint
+                            break
+                        continue
+                    if "add" in entry:
+                        self._apply_add(entry["id"], entry["add"])
+                    else:
+                        self._apply_drop(entry["id"])
+                    self._journal_entries += 1
+        except FileNotFoundError:
+            pass
+
+    def add(self, conversation_id: str, messages: Iterable[Tuple[int, any]]) -> None:
+        """
+        Indexes messages of a conversation.
+
+        Args:
+            conversation_id (str): The conversation the messages belong to
+            messages (Iterable[Tuple[int, any]]): (sequence number, message) pairs
+        """
+        documents = [[seq, dict(Counter(tokenize(message_text(message))))] for seq, message in messages]
+        if not documents:
+            return
+        self._apply_add(conversation_id, documents)
+        self._journal({"id": conversation_id, "add": documents})
+
+    def drop(self, conversation_id: str) -> None:
+        """
+        Removes every message of a conversation from the index.
+        """
+        if conversation_id not in self._documents:
+            return
+        self._apply_drop(conversation_id)
+        self._journal({"id": conversation_id, "drop": True})
+
+    def rebuild(self, conversations: Iterable[Tuple[str, Iterable[Tuple[int, any]]]]) -> None:
+        """
+        Replaces the whole index with one built from the given conversations
+        and checkpoints it.
+
+        Args:
+            conversations (Iterable[Tuple[str, Iterable[Tuple[int, any]]]]):
+                (conversation ID, (sequence number, message) pairs) for every conversation
+        """
+        self._postings = {}
+        self._document_frequency = {}
+        self._terms = {}
+        self._documents = {}
+        self._total_documents = 0
+        for conversation_id, messages in conversations:
+            documents = [[seq, Counter(tokenize(message_text(message)))] for seq, message in messages]
+            if documents:
+                self._apply_add(conversation_id, documents)
+        self.checkpoint()
+
+    def _apply_add(self, conversation_id: str, documents: List) -> None:
+        """
+        Adds [sequence number, {term: frequency}] documents to the in-memory index.
+        """
+        for seq, frequencies in documents:
+            for term, frequency in frequencies.items():
+                self._add_posting(term, conversation_id, seq, frequency)
+        self._documents[conversation_id] = self._documents.get(conversation_id, 0) + len(documents)
+        self._total_documents += len(documents)
+
+    def _add_posting(self, term: str, conversation_id: str, seq: int, frequency: int) -> None:
+        """
+        Records that message seq of a conversation contains term frequency times.
+        """
+        postings = self._postings.setdefault(term, {}).setdefault(conversation_id, {})
+        if seq not in postings:
+            self._document_frequency[term] = self._document_frequency.get(term, 0) + 1
+        postings[seq] = frequency
+        self._terms.setdefault(conversation_id, set()).add(term)
+
+    def _apply_drop(self, conversation_id: str) -> None:
+        """
+        Removes a conversation's postings from the in-memory index.
+        """
+        for term in self._terms.pop(conversation_id, ()):
+            conversations = self._postings[term]
+            self._document_frequency[term] -= len(conversations.pop(conversation_id))
+            if not conversations:
+                del self._postings[term]
+                del self._document_frequency[term]
+        self._total_documents -= self._documents.pop(conversation_id, 0)
+
+    def _journal(self, entry: Dict) -> None:
+        """
+        Appends a change to the journal, checkpointing once enough have accumulated.
+        """
+        with open(os.path.join(self.directory, SEARCH_JOURNAL_FILENAME), 'a') as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._journal_entries += 1
+        if self._journal_entries >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """
+        Writes the compressed index via write-temp-then-rename, then replaces
+        the journal the same way with an empty one for the new generation.
+        """
+        postings = {}
+        for term, conversations in self._postings.items():
+            encoded_conversations = postings[term] = {}
+            for conversation_id, frequencies in conversations.items():
+                encoded = []
+                previous = 0
+                for seq in sorted(frequencies):
+                    encoded += (seq - previous, frequencies[seq])
+                    previous = seq
+                encoded_conversations[conversation_id] = encoded
+        generation = self._generation + 1
+        data = json.dumps({"generation": generation, "documents": self._documents, "postings": postings},
+                          separators=(",", ":"))
+
+        index_file = os.path.join(self.directory, SEARCH_INDEX_FILENAME)
+        tmp_file = index_file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(zlib.compress(data.encode("utf-8")))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, index_file)
+
+        journal_file = os.path.join(self.directory, SEARCH_JOURNAL_FILENAME)
+        tmp_file = journal_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            f.write(json.dumps({"generation": generation}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, journal_file)
+        self._generation = generation
+        self._journal_entries = 0
+
+    def search(self, query: str, conversation_ids: Optional[Iterable[str]] = None, limit: int = 10) -> List[Dict]:
+        """
+        Finds the messages containing every term of query, best matches first.
+        Each matching term adds (1 + log(term frequency)) * log(1 + N / document
+        frequency), so rare terms weigh more than common ones. Ties go to the
+        message later in its conversation.
+
+        Args:
+            query (str): Words to look for; case and punctuation are ignored
+            conversation_ids (Optional[Iterable[str]]): If set, only search these conversations
+            limit (int): Maximum number of hits to return
+
+        Returns:
+            List[Dict]: Hits with "conversation_id", "seq" and "score" keys
+        """
+        terms = set(tokenize(query))
+        if not terms or limit <= 0:
+            return []
+        postings = []
+        for term in terms:
+            if term not in self._postings:
+                return []
+            postings.append((term, self._postings[term]))
+        # Walk the rarest term's postings and probe the others
+        postings.sort(key=lambda item: self._document_frequency[item[0]])
+        weights = {term: math.log(1 + self._total_documents / self._document_frequency[term]) for term in terms}
+
+        hits = []
+        rarest_term, rarest = postings[0]
+        if conversation_ids is None:
+            candidates = rarest.items()
+        else:
+            candidates = [(conversation_id, rarest[conversation_id])
+                          for conversation_id in set(conversation_ids) if conversation_id in rarest]
+        for conversation_id, frequencies in candidates:
+            others = []
+            for term, conversations in postings[1:]:
+                other = conversations.get(conversation_id)
+                if other is None:
+                    break
+                others.append((term, other))
+            else:
+                for seq, frequency in frequencies.items():
+                    score = (1 + math.log(frequency)) * weights[rarest_term]
+                    for term, other in others:
+                        if seq not in other:
+                            break
+                        score += (1 + math.log(other[seq])) * weights[term]
+                    else:
+                        hits.append((score, seq, conversation_id))
+
+        return [{"conversation_id": conversation_id, "seq": seq, "score": score}
+                for score, seq, conversation_id in heapq.nlargest(limit, hits)]
+
+    def __len__(self) -> int:
+        """
+        Returns the number of indexed messages.
+        """
+        return self._total_documents
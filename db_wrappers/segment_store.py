@@ -0,0 +1,228 @@
+import os
+import re
+import mmap
+import threading
+from typing import Dict, List, Optional, Tuple
+from db_wrappers.profiling import IO, phase
+
+SEGMENT_DIRNAME = "segments"
+SEGMENT_EXTENSION = ".seg"
+
+# Index values in segment mode look like "segments/00000003.seg#1048576+2048". A
+# conversation appended to after its record was sealed is a chain of such
+# extents, oldest first, separated by LOCATOR_SEPARATOR.
+_LOCATOR_PATTERN = re.compile(r"^segments/(\d{8})\.seg#(\d+)\+(\d+)$")
+LOCATOR_SEPARATOR = ","
+
+# Appending to a chain this long rewrites it as a single record instead
+MAX_RECORD_EXTENTS = 8
+
+
+def format_locator(segment: int, offset: int, length: int) -> str:
+    """
+    Formats a (segment, offset, length) record location as an index value.
+    """
+    return f"{SEGMENT_DIRNAME}/{segment:08d}{SEGMENT_EXTENSION}#{offset}+{length}"
+
+
+def format_locators(locations: List[Tuple[int, int, int]]) -> str:
+    """
+    Formats the (segment, offset, length) extents of a record, oldest first, as an index value.
+    """
+    return LOCATOR_SEPARATOR.join(format_locator(*location) for location in locations)
+
+
+def parse_locators(value: str) -> Optional[List[Tuple[int, int, int]]]:
+    """
+    Parses an index value into the (segment, offset, length) extents of a
+    record, oldest first, or None if the value is a plain conversation filepath.
+    """
+    locations = []
+    for part in value.split(LOCATOR_SEPARATOR):
+        match = _LOCATOR_PATTERN.match(part)
+        if match is None:
+            return None
+        locations.append((int(match.group(1)), int(match.group(2)), int(match.group(3))))
+    return locations
+
+
+class SegmentStore:
+    """
+    Packs many conversation records into large append-only segment files.
+    Records are never modified in place except by extending the most recently
+    written record of the active segment; everything else is a new append, and
+    the space taken by superseded records is reclaimed by compaction. A record
+    may span several extents (see parse_locators()); read_extents() joins them.
+    """
+
+    def __init__(self, directory: str, max_segment_size: int = 64 * 1024 * 1024):
+        """
+        Opens the segment directory, creating it if needed.
+
+        Args:
+            directory (str): Directory holding the segment files
+            max_segment_size (int): Size in bytes after which a new segment is started
+        """
+        self.directory = directory
+        self.max_segment_size = max_segment_size
+        self._lock = threading.RLock()
+        self._readers: Dict[int, object] = {}
+        os.makedirs(directory, exist_ok=True)
+
+        existing = self.segments()
+        self._active = existing[-1] if existing else 1
+        self._writer = open(self._segment_path(self._active), 'ab')
+        self._active_size = self._writer.tell()
+        self._created = True  # The directory entry of the active segment may not be durable yet
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:08d}{SEGMENT_EXTENSION}")
+
+    def map_segment(self, segment: int) -> Optional[mmap.mmap]:
+        """
+        Memory-maps a segment file read-only. The mapping stays valid even if the
+        segment is later removed by compaction. Returns None for an empty segment.
+        """
+        with self._lock:
+            if segment == self._active:
+                self._writer.flush()
+            with open(self._segment_path(segment), 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return None
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def active_segment(self) -> int:
+        """
+        The segment that new records are appended to.
+        """
+        return self._active
+
+    def segments(self) -> List[int]:
+        """
+        Returns the ids of all segment files on disk, in ascending order.
+        """
+        segments = []
+        for filename in os.listdir(self.directory):
+            name, extension = os.path.splitext(filename)
+            if extension == SEGMENT_EXTENSION and name.isdigit():
+                segments.append(int(name))
+        return sorted(segments)
+
+    def segment_size(self, segment: int) -> int:
+        """
+        Returns the size in bytes of a segment file.
+        """
+        if segment == self._active:
+            return self._active_size
+        return os.path.getsize(self._segment_path(segment))
+
+    def _roll_over(self) -> None:
+        """
+        Seals the active segment and starts a new one. The sealed segment is
+        synced first, so sync() only ever has the active segment to flush.
+        """
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._writer.close()
+        self._active += 1
+        self._writer = open(self._segment_path(self._active), 'ab')
+        self._active_size = 0
+        self._created = True
+
+    def append(self, data: bytes) -> Tuple[int, int, int]:
+        """
+        Appends a record to the active segment.
+
+        Args:
+            data (bytes): The record contents
+
+        Returns:
+            Tuple[int, int, int]: The record's (segment, offset, length)
+        """
+        with self._lock:
+            if self._active_size > 0 and self._active_size + len(data) > self.max_segment_size:
+                self._roll_over()
+            offset = self._active_size
+            with phase(IO):
+                self._writer.write(data)
+                self._writer.flush()
+            self._active_size += len(data)
+            return self._active, offset, len(data)
+
+    def extend(self, segment: int, offset: int, length: int, data: bytes) -> Optional[Tuple[int, int, int]]:
+        """
+        Extends a record in place if it is the last record of the active segment
+        and the segment has room for the extra bytes.
+
+        Returns:
+            Optional[Tuple[int, int, int]]: The record's new location, or None if
+            the record cannot be extended and must be rewritten instead
+        """
+        with self._lock:
+            if segment != self._active or offset + length != self._active_size:
+                return None
+            if self._active_size + len(data) > self.max_segment_size:
+                return None
+            with phase(IO):
+                self._writer.write(data)
+                self._writer.flush()
+            self._active_size += len(data)
+            return segment, offset, length + len(data)
+
+    def read(self, segment: int, offset: int, length: int) -> bytes:
+        """
+        Reads a record. Segment files are kept open between reads.
+        """
+        with self._lock:
+            reader = self._readers.get(segment)
+            if reader is None:
+                reader = open(self._segment_path(segment), 'rb')
+                self._readers[segment] = reader
+            with phase(IO):
+                reader.seek(offset)
+                return reader.read(length)
+
+    def read_extents(self, locations: List[Tuple[int, int, int]]) -> bytes:
+        """
+        Reads a record made of one or more extents and joins them.
+        """
+        return b"".join(self.read(*location) for location in locations)
+
+    def sync(self) -> None:
+        """
+        Flushes the active segment, and the directory entry of a newly started
+        one, to stable storage. Sealed segments were synced when they were sealed.
+        """
+        with self._lock:
+            self._writer.flush()
+            os.fsync(self._writer.fileno())
+            if self._created:
+                fd = os.open(self.directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                self._created = False
+
+    def remove(self, segment: int) -> None:
+        """
+        Deletes a sealed segment. The active segment cannot be removed.
+        """
+        with self._lock:
+            if segment == self._active:
+                raise ValueError("Cannot remove the active segment")
+            reader = self._readers.pop(segment, None)
+            if reader is not None:
+                reader.close()
+            os.remove(self._segment_path(segment))
+
+    def close(self) -> None:
+        """
+        Closes all open segment files.
+        """
+        with self._lock:
+            for reader in self._readers.values():
+                reader.close()
+            self._readers = {}
+            self._writer.close()
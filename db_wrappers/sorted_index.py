@@ -0,0 +1,205 @@
+import os
+import sys
+import mmap
+import struct
+from collections.abc import MutableMapping
+from array import array
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+SORTED_INDEX_MAGIC = b"CHAIIDX1"
+
+# File layout (all integers little-endian):
+#   header:  magic (8 bytes), record count (u64), offset table position (u64)
+#   records: key length (u32), value length (u32), key bytes, value bytes
+#   table:   one u64 file offset per record, ordered by key
+_HEADER = struct.Struct("<8sQQ")
+_RECORD = struct.Struct("<II")
+_OFFSET = struct.Struct("<Q")
+
+
+class SortedIndex(MutableMapping):
+    """
+    A conversation_id => relative filepath index stored as a sorted, memory-mapped
+    offset table. Opening the index only maps the file, and each lookup is a
+    binary search that touches a handful of pages, so startup cost and resident
+    memory do not grow with the number of conversations.
+
+    Changes are kept in a small in-memory overlay until checkpoint() merges them
+    into a new index file.
+    """
+
+    def __init__(self, path: str):
+        """
+        Opens (or creates) the sorted index file at path.
+
+        Args:
+            path (str): Location of the index file
+        """
+        self.path = path
+        self._overlay: Dict[str, Optional[str]] = {}  # None marks a deleted entry
+        self._file = None
+        self._mm = None
+        self._count = 0
+        self._table = 0
+        if not os.path.exists(path):
+            self.write(path, [])
+        self._open()
+
+    def _open(self) -> None:
+        """
+        Memory-maps the index file and reads its header.
+        """
+        self._file = open(self.path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._table = _HEADER.unpack_from(self._mm, 0)
+        if magic != SORTED_INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a sorted conversation index")
+
+    def close(self) -> None:
+        """
+        Unmaps and closes the index file.
+        """
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _record(self, position: int) -> Tuple[bytes, int, int]:
+        """
+        Returns (key, value offset, value length) for the record at a table position.
+        """
+        offset = _OFFSET.unpack_from(self._mm, self._table + position * _OFFSET.size)[0]
+        key_length, value_length = _RECORD.unpack_from(self._mm, offset)
+        key_start = offset + _RECORD.size
+        return self._mm[key_start:key_start + key_length], key_start + key_length, value_length
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        """
+        Binary searches the on-disk records for key.
+        """
+        target = key.encode("utf-8")
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            record_key, value_start, value_length = self._record(middle)
+            if record_key < target:
+                low = middle + 1
+            elif record_key > target:
+                high = middle
+            else:
+                return self._mm[value_start:value_start + value_length].decode("utf-8")
+        return None
+
+    def _disk_items(self) -> Iterator[Tuple[bytes, bytes]]:
+        """
+        Yields the on-disk (key, value) records in sorted order.
+        """
+        for position in range(self._count):
+            record_key, value_start, value_length = self._record(position)
+            yield record_key, self._mm[value_start:value_start + value_length]
+
+    def __getitem__(self, key: str) -> str:
+        if key in self._overlay:
+            value = self._overlay[key]
+        else:
+            value = self._disk_get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: str) -> None:
+        self._overlay[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._overlay[key] = None
+
+    def __iter__(self) -> Iterator[str]:
+        for record_key, _ in self._disk_items():
+            key = record_key.decode("utf-8")
+            if key not in self._overlay:
+                yield key
+        for key, value in list(self._overlay.items()):
+            if value is not None:
+                yield key
+
+    def __len__(self) -> int:
+        length = self._count
+        for key, value in self._overlay.items():
+            on_disk = self._disk_get(key) is not None
+            if value is None and on_disk:
+                length -= 1
+            elif value is not None and not on_disk:
+                length += 1
+        return length
+
+    def _merged_items(self) -> Iterator[Tuple[bytes, bytes]]:
+        """
+        Merges the sorted on-disk records with the overlay, in key order.
+        """
+        overlay = sorted((key.encode("utf-8"), value) for key, value in self._overlay.items())
+        position = 0
+        for record_key, record_value in self._disk_items():
+            while position < len(overlay) and overlay[position][0] < record_key:
+                key, value = overlay[position]
+                position += 1
+                if value is not None:
+                    yield key, value.encode("utf-8")
+            if position < len(overlay) and overlay[position][0] == record_key:
+                key, value = overlay[position]
+                position += 1
+                if value is not None:
+                    yield key, value.encode("utf-8")
+                continue
+            yield record_key, record_value
+        for key, value in overlay[position:]:
+            if value is not None:
+                yield key, value.encode("utf-8")
+
+    def checkpoint(self) -> None:
+        """
+        Writes the merged index to a new file, atomically renames it over the
+        current one, and clears the overlay.
+        """
+        self.write(self.path, self._merged_items())
+        self.close()
+        self._overlay = {}
+        self._open()
+
+    @staticmethod
+    def write(path: str, items: Iterable[Tuple]) -> None:
+        """
+        Writes a sorted index file via write-temp-then-rename.
+
+        Args:
+            path (str): Location of the index file
+            items (Iterable[Tuple]): (key, value) pairs as str or bytes, sorted by
+                their UTF-8 encoded key
+        """
+        tmp_path = path + ".tmp"
+        offsets = array("Q")
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(SORTED_INDEX_MAGIC, 0, 0))
+            position = _HEADER.size
+            for key, value in items:
+                if isinstance(key, str):
+                    key = key.encode("utf-8")
+                if isinstance(value, str):
+                    value = value.encode("utf-8")
+                offsets.append(position)
+                f.write(_RECORD.pack(len(key), len(value)))
+                f.write(key)
+                f.write(value)
+                position += _RECORD.size + len(key) + len(value)
+            if sys.byteorder != "little":
+                offsets.byteswap()
+            offsets.tofile(f)
+            f.seek(0)
+            f.write(_HEADER.pack(SORTED_INDEX_MAGIC, len(offsets), position))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
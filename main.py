@@ -1,7 +1,17 @@
 import time
 import os
+from db_wrappers.metrics import MetricsRegistry, serve_metrics
 from db_wrappers.mongodb_manager import MongoDBManager
 
+# Number of most recent messages shown when a thread is opened
+HISTORY_LIMIT = 20
+
+# Number of threads shown per page in the thread picker
+THREAD_PAGE_SIZE = 10
+
+# If set, the storage metrics are served on this port at /metrics
+METRICS_PORT_VARIABLE = "CHAI_METRICS_PORT"
+
 
 def main():
     """
@@ -12,14 +22,25 @@ def main():
     #Local mongodb
     connection_string = "mongodb://localhost:27017/"
 
-    db_manager = MongoDBManager(connection_string=connection_string, database_name="chai_db")
+    metrics = MetricsRegistry()
+    if os.environ.get(METRICS_PORT_VARIABLE):
+        serve_metrics(metrics, int(os.environ[METRICS_PORT_VARIABLE]))
 
-    user_id = input("Please enter your user ID to begin: ")
+    db_manager = MongoDBManager(connection_string=connection_string, database_name="chai_db", metrics=metrics)
 
-    threads = db_manager.list_user_threads(user_id)
+    user_id = input("Please enter your user ID to begin: ")
 
-    for i, thread_name in enumerate(threads):
-        print(f"{i}. {thread_name}")
+    # Most recently updated threads first, one page at a time
+    threads = []
+    cursor = None
+    while True:
+        page, cursor = db_manager.list_threads(user_id, limit=THREAD_PAGE_SIZE, cursor=cursor)
+        for thread in page:
+            preview = f" - {thread['last_role']}: {thread['last_preview']}" if thread['last_preview'] else ""
+            print(f"{len(threads)}. {thread['thread_name']} ({thread['message_count']} messages){preview}")
+            threads.append(thread['thread_name'])
+        if cursor is None or input("Enter 'm' for more threads, or press Enter to choose:") != "m":
+            break
     print(f"{len(threads)}. Create new thread")
     user_selection = input("Enter a thread number:")
 
@@ -49,16 +70,16 @@ def main():
 
 def run_chat(db_manager: MongoDBManager, user_id: str, thread_name: str) -> None:
     """
-    Runs the chat loop for a specific conversation thread.
+    Runs the chat loop for a specific conversation thread. Operations are
+    also recorded in the manager's metrics registry.
     """
 
     start_time = time.perf_counter()
-    messages = db_manager.get_conversation(user_id,thread_name)
-    end_time = time.perf_counter()
-    duration = end_time - start_time
+    messages = db_manager.get_conversation(user_id,thread_name,limit=HISTORY_LIMIT)
+    duration = time.perf_counter() - start_time
 
     if messages:
-        print(f"\n--- Conversation History ({len(messages)} messages) ---")
+        print(f"\n--- Conversation History (last {len(messages)} messages) ---")
         for message in messages:
             role = message['role'].capitalize()
             print(f"{role}: {message['content']}")
@@ -80,23 +101,21 @@ def run_chat(db_manager: MongoDBManager, user_id: str, thread_name: str) -> None
         # 4. Append AI response using append_message()
         # 5. Stop timer and calculate duration
         #
-        # Note: We're calling append_message() TWICE (once for user, once for AI)
-        # This is different from Lab 1 where we did one big write!
-
-        start_time = time.perf_counter()  
+        # Note: Both messages of the turn now go out in a single append_messages()
+        # call ($push with $each), so each turn is one round trip instead of two.
 
-        # Append user message
         user_message = {"role": "user", "content": user_input}
-        db_manager.append_message(user_id,thread_name,user_message)
 
-        # Create and append AI response
+        # Create AI response
         ai_response = "This is a mock response from the AI."
         ai_message = {"role": "assistant", "content": ai_response}
-       
-        db_manager.append_message(user_id,thread_name,ai_message)
 
-        end_time = time.perf_counter()
-        duration = end_time - start_time
+        start_time = time.perf_counter()
+
+        # Append both messages of the turn
+        db_manager.append_messages(user_id,thread_name,[user_message,ai_message])
+
+        duration = time.perf_counter() - start_time
 
         print(f"AI: {ai_response}")
         print(f"(Operation took {duration:.4f} seconds)")
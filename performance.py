@@ -1,8 +1,16 @@
+import os
 import time
+import asyncio
 import random
 import string
-from db_wrappers.flat_file_manager import FlatFileManager
+import threading
+import multiprocessing
+from db_wrappers.flat_file_manager import FlatFileManager, INDEX_FILENAME, SORTED_INDEX_FILENAME
+from db_wrappers.sorted_index import SortedIndex
 from db_wrappers.mongodb_manager import MongoDBManager
+from db_wrappers.async_mongodb_manager import AsyncMongoDBManager
+from db_wrappers.analytics import ConversationAnalytics
+from db_wrappers.durability import DURABILITY_LEVELS, DURABLE
 
 PASSWORD = ""
 CONNECTION_STRING = "mongodb://localhost:27017/"
@@ -44,10 +52,39 @@ def test_flat_file_append_performance(num_messages=100):
     return append_times, read_time, len(final_messages)
 
 
-def test_mongodb_append_performance(num_messages=100):
+def test_flat_file_jsonl_append_performance(num_messages=100):
+    """Test FlatFileManager append performance using the append-only JSONL format."""
+    manager = FlatFileManager(storage_dir="data_perf_test")
+    conversation_id = "perf_test"
+
+    # Test append performance
+    append_times = []
+    for i in range(num_messages):
+        start = time.perf_counter()
+
+        manager.append_message(conversation_id, {"role": "user", "content": random_string()})
+        manager.append_message(conversation_id, {"role": "assistant", "content": random_string()})
+
+        end = time.perf_counter()
+        append_times.append(end - start)
+
+    # Test read performance
+    start = time.perf_counter()
+    final_messages = manager.get_conversation(conversation_id)
+    read_time = time.perf_counter() - start
+
+    # Cleanup
+    import shutil
+    shutil.rmtree("data_perf_test")
+
+    return append_times, read_time, len(final_messages)
+
+
+def test_mongodb_append_performance(num_messages=100, storage_layout="embedded"):
     """Test MongoDBManager append performance."""
     connection_string = CONNECTION_STRING
-    manager = MongoDBManager(connection_string=connection_string, database_name="chai_perf_test")
+    manager = MongoDBManager(connection_string=connection_string, database_name="chai_perf_test",
+                             storage_layout=storage_layout)
 
     user_id = "perf_test_user"
     thread_name = "perf_test_thread"
@@ -78,6 +115,43 @@ def test_mongodb_append_performance(num_messages=100):
     return append_times, read_time, len(final_messages)
 
 
+def test_mongodb_batched_append_performance(num_messages=100, write_behind=False):
+    """Test MongoDBManager append performance with one append_messages() call per chat turn."""
+    connection_string = CONNECTION_STRING
+    manager = MongoDBManager(connection_string=connection_string, database_name="chai_perf_test",
+                             write_behind=write_behind)
+
+    user_id = "perf_test_user"
+    thread_name = "perf_test_batched_thread"
+
+    # Clean slate
+    manager.delete_conversation(user_id, thread_name)
+
+    # Test append performance
+    append_times = []
+    for i in range(num_messages):
+        start = time.perf_counter()
+
+        manager.append_messages(user_id, thread_name, [
+            {"role": "user", "content": random_string()},
+            {"role": "assistant", "content": random_string()},
+        ])
+
+        end = time.perf_counter()
+        append_times.append(end - start)
+
+    # Test read performance (flushes any buffered appends first)
+    start = time.perf_counter()
+    final_messages = manager.get_conversation(user_id, thread_name)
+    read_time = time.perf_counter() - start
+
+    # Cleanup
+    manager.delete_conversation(user_id, thread_name)
+    manager.close()
+
+    return append_times, read_time, len(final_messages)
+
+
 def test_flat_file_bulk_write(num_messages=1000):
     """Test FlatFileManager bulk write performance (write once scenario)."""
     manager = FlatFileManager(storage_dir="data_perf_test")
@@ -106,10 +180,11 @@ def test_flat_file_bulk_write(num_messages=1000):
     return write_time, read_time, len(read_messages)
 
 
-def test_mongodb_bulk_write(num_messages=1000):
+def test_mongodb_bulk_write(num_messages=1000, storage_layout="embedded"):
     """Test MongoDBManager bulk write performance (write once scenario)."""
     connection_string = CONNECTION_STRING
-    manager = MongoDBManager(connection_string=connection_string, database_name="chai_perf_test")
+    manager = MongoDBManager(connection_string=connection_string, database_name="chai_perf_test",
+                             storage_layout=storage_layout)
 
     user_id = "bulk_test_user"
     thread_name = "bulk_test_thread"
@@ -140,9 +215,9 @@ def test_mongodb_bulk_write(num_messages=1000):
     return write_time, read_time, len(read_messages)
 
 
-def test_flat_file_multiple_threads(num_threads=10, messages_per_thread=50):
+def test_flat_file_multiple_threads(num_threads=10, messages_per_thread=50, cache_entries=0):
     """Test FlatFileManager with multiple conversation threads."""
-    manager = FlatFileManager(storage_dir="data_perf_test")
+    manager = FlatFileManager(storage_dir="data_perf_test", cache_entries=cache_entries)
 
     create_times = []
 
@@ -168,17 +243,30 @@ def test_flat_file_multiple_threads(num_threads=10, messages_per_thread=50):
         messages = manager.get_conversation(conversation_id)
         random_access_times.append(time.perf_counter() - start)
 
+    # Test loading every thread, one at a time and with one multi-get
+    conversation_ids = [f"thread_{i}" for i in range(num_threads)]
+    start = time.perf_counter()
+    for conversation_id in conversation_ids:
+        manager.get_conversation(conversation_id)
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    manager.get_conversations(conversation_ids)
+    multi_get_time = time.perf_counter() - start
+
     # Cleanup
+    manager.close()
     import shutil
     shutil.rmtree("data_perf_test")
 
-    return create_times, random_access_times
+    return create_times, random_access_times, sequential_time, multi_get_time
 
 
-def test_mongodb_multiple_threads(num_threads=10, messages_per_thread=50):
+def test_mongodb_multiple_threads(num_threads=10, messages_per_thread=50, cache_entries=0):
     """Test MongoDBManager with multiple conversation threads."""
     connection_string = CONNECTION_STRING
-    manager = MongoDBManager(connection_string=connection_string, database_name="chai_perf_test")
+    manager = MongoDBManager(connection_string=connection_string, database_name="chai_perf_test",
+                             cache_entries=cache_entries)
 
     user_id = "multi_thread_user"
 
@@ -209,6 +297,17 @@ def test_mongodb_multiple_threads(num_threads=10, messages_per_thread=50):
         messages = manager.get_conversation(user_id, thread_name)
         random_access_times.append(time.perf_counter() - start)
 
+    # Test loading every thread, one at a time and with one multi-get
+    thread_names = [f"thread_{i}" for i in range(num_threads)]
+    start = time.perf_counter()
+    for thread_name in thread_names:
+        manager.get_conversation(user_id, thread_name)
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    manager.get_conversations(user_id, thread_names)
+    multi_get_time = time.perf_counter() - start
+
     # Test listing all threads
     start = time.perf_counter()
     threads = manager.list_user_threads(user_id)
@@ -218,7 +317,7 @@ def test_mongodb_multiple_threads(num_threads=10, messages_per_thread=50):
     manager._wipe_database()
     manager.close()
 
-    return create_times, random_access_times, list_time
+    return create_times, random_access_times, list_time, sequential_time, multi_get_time
 
 
 def test_cold_start_performance():
@@ -246,8 +345,12 @@ def test_cold_start_performance():
     manager_mongo._wipe_database()
     manager_mongo.close()
 
+    startup_timings = test_mongodb_startup_to_first_read()
+
     print(f"Flat File cold start: {flat_file_cold:.4f} seconds")
     print(f"MongoDB cold start:   {mongo_cold:.4f} seconds")
+    print(f"MongoDB process startup to first read: {min(startup_timings):.4f}s best, "
+          f"{sum(startup_timings) / len(startup_timings):.4f}s avg")
 
     if flat_file_cold < mongo_cold:
         print(f"✓ Flat File is {mongo_cold / flat_file_cold:.2f}x faster for cold starts")
@@ -257,6 +360,420 @@ def test_cold_start_performance():
     return flat_file_cold, mongo_cold
 
 
+def test_mongodb_startup_to_first_read(runs=5):
+    """Test process start to first MongoDBManager read, including the pymongo import,
+    in fresh interpreters so nothing is already imported or connected."""
+    import subprocess
+    import sys
+    script = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        "from db_wrappers.mongodb_manager import MongoDBManager\n"
+        f"manager = MongoDBManager(connection_string={CONNECTION_STRING!r}, database_name='chai_cold_test')\n"
+        "manager.get_conversation('cold_user', 'cold_thread')\n"
+        "print(time.perf_counter() - start)\n"
+        "manager.close()\n"
+    )
+    timings = []
+    for i in range(runs):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        timings.append(float(output.stdout.strip()))
+    return timings
+
+
+def test_flat_file_index_cold_start(num_conversations=1000, index_format="json"):
+    """Test FlatFileManager startup-to-first-read time against an index of num_conversations."""
+    import json
+    import shutil
+    storage_dir = "data_index_cold_test"
+    os.makedirs(storage_dir, exist_ok=True)
+
+    # Build the index directly; only the conversation we read needs a data file
+    keys = (f"conversation_{i:09d}" for i in range(num_conversations))
+    if index_format == "sorted":
+        SortedIndex.write(os.path.join(storage_dir, SORTED_INDEX_FILENAME), ((key, f"{key}.jsonl") for key in keys))
+    else:
+        with open(os.path.join(storage_dir, INDEX_FILENAME), 'w') as f:
+            json.dump({key: f"{key}.jsonl" for key in keys}, f)
+    target = f"conversation_{num_conversations // 2:09d}"
+    with open(os.path.join(storage_dir, f"{target}.jsonl"), 'w') as f:
+        f.write(json.dumps({"role": "user", "content": "first"}) + "\n")
+
+    start = time.perf_counter()
+    manager = FlatFileManager(storage_dir=storage_dir, index_format=index_format)
+    messages = manager.get_conversation(target)
+    cold_start = time.perf_counter() - start
+
+    assert len(messages) == 1
+    shutil.rmtree(storage_dir)
+    return cold_start
+
+
+def test_index_cold_start_scaling(sizes=(1_000, 10_000, 100_000, 1_000_000)):
+    """Compare FlatFileManager cold start with the JSON and sorted index formats as the index grows."""
+    print("\n" + "=" * 80)
+    print("TEST 5b: Flat File Cold Start vs Index Size")
+    print("=" * 80)
+
+    results = {}
+    for size in sizes:
+        json_cold = test_flat_file_index_cold_start(size, "json")
+        sorted_cold = test_flat_file_index_cold_start(size, "sorted")
+        results[size] = (json_cold, sorted_cold)
+        print(f"{size:>10,} conversations: json index {json_cold * 1000:8.2f}ms, sorted index {sorted_cold * 1000:8.2f}ms")
+
+    return results
+
+
+def test_async_mongodb_concurrency(num_coroutines=200, turns_per_coroutine=10):
+    """Test AsyncMongoDBManager throughput with many concurrent coroutines, each
+    appending a chat turn and reading back recent history."""
+    async def run():
+        manager = AsyncMongoDBManager(connection_string=CONNECTION_STRING, database_name="chai_perf_test")
+        await manager._wipe_database()
+        turn_times = []
+
+        async def chat(client_num):
+            user_id = f"async_user_{client_num % 20}"
+            thread_name = f"async_thread_{client_num}"
+            for i in range(turns_per_coroutine):
+                start = time.perf_counter()
+                await manager.append_messages(user_id, thread_name, [
+                    {"role": "user", "content": random_string()},
+                    {"role": "assistant", "content": random_string()},
+                ])
+                await manager.get_conversation(user_id, thread_name, limit=10)
+                turn_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(chat(client_num) for client_num in range(num_coroutines)))
+        elapsed = time.perf_counter() - start
+
+        await manager._wipe_database()
+        await manager.close()
+        return elapsed, turn_times
+
+    return asyncio.run(run())
+
+
+def test_sync_mongodb_sequential(num_clients=200, turns_per_client=10):
+    """Baseline for test_async_mongodb_concurrency: the same work through the synchronous manager."""
+    manager = MongoDBManager(connection_string=CONNECTION_STRING, database_name="chai_perf_test")
+    manager._wipe_database()
+    turn_times = []
+
+    start = time.perf_counter()
+    for client_num in range(num_clients):
+        user_id = f"sync_user_{client_num % 20}"
+        thread_name = f"sync_thread_{client_num}"
+        for i in range(turns_per_client):
+            turn_start = time.perf_counter()
+            manager.append_messages(user_id, thread_name, [
+                {"role": "user", "content": random_string()},
+                {"role": "assistant", "content": random_string()},
+            ])
+            manager.get_conversation(user_id, thread_name, limit=10)
+            turn_times.append(time.perf_counter() - turn_start)
+    elapsed = time.perf_counter() - start
+
+    manager._wipe_database()
+    manager.close()
+    return elapsed, turn_times
+
+
+def test_async_concurrency_performance(client_counts=(10, 100, 300), turns=10):
+    """Compare async throughput against the synchronous manager as concurrency grows."""
+    print("\n" + "=" * 80)
+    print("TEST 6: Concurrent Clients (AsyncMongoDBManager vs MongoDBManager)")
+    print("=" * 80)
+
+    results = {}
+    for clients in client_counts:
+        async_elapsed, async_turns = test_async_mongodb_concurrency(clients, turns)
+        sync_elapsed, sync_turns = test_sync_mongodb_sequential(clients, turns)
+        total_turns = clients * turns
+        results[clients] = (total_turns / async_elapsed, total_turns / sync_elapsed)
+        print(f"{clients:>4} clients: async {total_turns / async_elapsed:8.1f} turns/s "
+              f"(avg turn {sum(async_turns) / len(async_turns) * 1000:.2f}ms), "
+              f"sync {total_turns / sync_elapsed:8.1f} turns/s "
+              f"(avg turn {sum(sync_turns) / len(sync_turns) * 1000:.2f}ms)")
+
+    return results
+
+
+def run_concurrent_writers(write, num_writers, writes_per_writer):
+    """Run write(writer_num, i) from num_writers threads; return (elapsed, per-write latencies)."""
+    latencies = []
+    lock = threading.Lock()
+
+    def writer(writer_num):
+        local = []
+        for i in range(writes_per_writer):
+            start = time.perf_counter()
+            write(writer_num, i)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=writer, args=(writer_num,)) for writer_num in range(num_writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies
+
+
+def test_flat_file_durability(durability, group_commit=False, num_writers=8, writes_per_writer=50):
+    """Test FlatFileManager append latency and throughput at a durability level."""
+    import shutil
+    storage_dir = "data_perf_durability"
+    shutil.rmtree(storage_dir, ignore_errors=True)
+    manager = FlatFileManager(storage_dir=storage_dir, durability=durability, group_commit=group_commit)
+
+    def write(writer_num, i):
+        manager.append_message(f"durability_{writer_num}", {"role": "user", "content": random_string()})
+
+    elapsed, latencies = run_concurrent_writers(write, num_writers, writes_per_writer)
+    manager.close()
+    shutil.rmtree(storage_dir)
+    return elapsed, latencies
+
+
+def test_mongodb_durability(durability, num_writers=8, writes_per_writer=50):
+    """Test MongoDBManager append latency and throughput at a durability level."""
+    manager = MongoDBManager(connection_string=CONNECTION_STRING, database_name="chai_perf_test",
+                             durability=durability)
+    manager._wipe_database()
+
+    def write(writer_num, i):
+        manager.append_message("durability_user", f"durability_{writer_num}",
+                               {"role": "user", "content": random_string()})
+
+    elapsed, latencies = run_concurrent_writers(write, num_writers, writes_per_writer)
+    manager._wipe_database()
+    manager.close()
+    return elapsed, latencies
+
+
+def test_durability_performance(num_writers=8, writes_per_writer=50):
+    """Compare append latency and throughput across durability levels."""
+    print("\n" + "=" * 80)
+    print("TEST 7: Durability Levels (Latency vs Throughput)")
+    print("=" * 80)
+    print(f"{num_writers} concurrent writers, {writes_per_writer} appends each.\n")
+
+    runs = [(f"Flat File {level}", lambda level=level: test_flat_file_durability(
+        level, False, num_writers, writes_per_writer)) for level in DURABILITY_LEVELS]
+    runs.append((f"Flat File {DURABLE} + group commit", lambda: test_flat_file_durability(
+        DURABLE, True, num_writers, writes_per_writer)))
+    runs += [(f"MongoDB {level}", lambda level=level: test_mongodb_durability(
+        level, num_writers, writes_per_writer)) for level in DURABILITY_LEVELS]
+
+    results = {}
+    for name, run in runs:
+        elapsed, latencies = run()
+        latencies.sort()
+        results[name] = (len(latencies) / elapsed, latencies[len(latencies) // 2])
+        print(f"{name:<36} {len(latencies) / elapsed:9.1f} writes/s, "
+              f"p50 {latencies[len(latencies) // 2] * 1000:7.3f}ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:7.3f}ms")
+
+    return results
+
+
+def _multiprocess_append_worker(storage_dir, worker_num, appends, shared_conversations):
+    """Append from one process; every fourth message goes to a conversation shared by all workers."""
+    manager = FlatFileManager(storage_dir=storage_dir, multiprocess=True)
+    for i in range(appends):
+        if i % 4 == 0:
+            conversation_id = f"shared_{(i // 4) % shared_conversations}"
+        else:
+            conversation_id = f"worker_{worker_num}"
+        manager.append_message(conversation_id, {"role": "user", "content": random_string(), "worker": worker_num})
+    manager.close()
+
+
+def test_flat_file_multiprocess(num_workers, appends_per_worker=500, shared_conversations=2):
+    """Test FlatFileManager append throughput from several processes; return (elapsed, messages lost)."""
+    import shutil
+    storage_dir = "data_perf_multiprocess"
+    shutil.rmtree(storage_dir, ignore_errors=True)
+    FlatFileManager(storage_dir=storage_dir, multiprocess=True).close()
+
+    workers = [multiprocessing.Process(target=_multiprocess_append_worker,
+                                       args=(storage_dir, worker_num, appends_per_worker, shared_conversations))
+               for worker_num in range(num_workers)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    manager = FlatFileManager(storage_dir=storage_dir)
+    stored = sum(len(manager.get_conversation(conversation_id)) for conversation_id in list(manager.conversations_index))
+    manager.close()
+    shutil.rmtree(storage_dir)
+    return elapsed, num_workers * appends_per_worker - stored
+
+
+def test_multiprocess_performance(worker_counts=(1, 2, 4, 8), appends_per_worker=500):
+    """Show append throughput scaling with the number of writer processes."""
+    print("\n" + "=" * 80)
+    print("TEST 8: Multi-Process Writers (Flat File Locking)")
+    print("=" * 80)
+    print(f"Each process appends {appends_per_worker} messages, 1 in 4 to a conversation shared by all.\n")
+
+    results = {}
+    for num_workers in worker_counts:
+        elapsed, lost = test_flat_file_multiprocess(num_workers, appends_per_worker)
+        throughput = num_workers * appends_per_worker / elapsed
+        results[num_workers] = (throughput, lost)
+        print(f"{num_workers:>2} processes: {throughput:9.1f} appends/s, {lost} messages lost")
+
+    return results
+
+
+def test_flat_file_search(num_conversations=200, messages_per_conversation=50, queries=50):
+    """Compare full-text search through the inverted index with scanning every conversation."""
+    import shutil
+    from db_wrappers.search_index import tokenize
+    storage_dir = "data_perf_search"
+    shutil.rmtree(storage_dir, ignore_errors=True)
+    manager = FlatFileManager(storage_dir=storage_dir, full_text_search=True)
+    vocabulary = [random_string(6).lower() for _ in range(2000)]
+    for i in range(num_conversations):
+        manager.save_conversation(f"search_user_{i}", f"search_user_{i}.jsonl", [
+            {"role": "user", "content": " ".join(random.choices(vocabulary, k=12))}
+            for _ in range(messages_per_conversation)])
+    words = random.choices(vocabulary, k=queries)
+
+    start = time.perf_counter()
+    index_hits = sum(len(manager.search(word, limit=1000)) for word in words)
+    index_time = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    scan_hits = 0
+    for word in words:
+        for conversation_id in list(manager.conversations_index):
+            scan_hits += sum(1 for message in manager.get_conversation(conversation_id)
+                             if word in tokenize(message["content"]))
+    scan_time = (time.perf_counter() - start) / queries
+
+    index_size = sum(os.path.getsize(os.path.join(storage_dir, name))
+                     for name in ("search.idx", "search.journal") if os.path.exists(os.path.join(storage_dir, name)))
+    manager.close()
+    shutil.rmtree(storage_dir)
+    assert index_hits == scan_hits
+    return index_time, scan_time, index_size
+
+
+def test_mongodb_search(num_conversations=200, messages_per_conversation=50, queries=50):
+    """Compare server-side search_messages() with fetching a user's threads and filtering locally."""
+    from db_wrappers.search_index import tokenize
+    manager = MongoDBManager(connection_string=CONNECTION_STRING, database_name="chai_perf_test",
+                             full_text_search=True)
+    manager._wipe_database()
+    vocabulary = [random_string(6).lower() for _ in range(2000)]
+    for i in range(num_conversations):
+        manager.save_conversation("search_user", f"thread_{i}", [
+            {"role": "user", "content": " ".join(random.choices(vocabulary, k=12))}
+            for _ in range(messages_per_conversation)])
+    words = random.choices(vocabulary, k=queries)
+
+    start = time.perf_counter()
+    for word in words:
+        manager.search_messages("search_user", word, limit=1000)
+    server_time = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    for word in words:
+        for thread_name in manager.list_user_threads("search_user"):
+            [message for message in manager.get_conversation("search_user", thread_name)
+             if word in tokenize(message["content"])]
+    client_time = (time.perf_counter() - start) / queries
+
+    manager._wipe_database()
+    manager.close()
+    return server_time, client_time
+
+
+def test_search_performance():
+    """Show what full-text search saves over scanning every conversation, for both backends."""
+    print("\n" + "=" * 80)
+    print("TEST 9: Full-Text Search (Indexed vs Scanning Every Conversation)")
+    print("=" * 80)
+    index_time, scan_time, index_size = test_flat_file_search()
+    print(f"Inverted index: {index_time * 1000:8.3f}ms per query ({index_size / 1024:.1f} KB on disk)")
+    print(f"Full scan:      {scan_time * 1000:8.3f}ms per query")
+    print(f"\n✓ The index answers {scan_time / index_time:.0f}x faster")
+
+    server_time, client_time = test_mongodb_search()
+    print(f"\nMongoDB search_messages(): {server_time * 1000:8.3f}ms per query")
+    print(f"MongoDB fetch and filter:  {client_time * 1000:8.3f}ms per query")
+    return index_time, scan_time, server_time, client_time
+
+
+def test_mongodb_analytics(num_users=20, threads_per_user=10, messages_per_thread=50, runs=5):
+    """Compare aggregation-pipeline stats, live and materialized, with fetching every conversation."""
+    manager = MongoDBManager(connection_string=CONNECTION_STRING, database_name="chai_perf_test")
+    manager._wipe_database()
+    analytics = ConversationAnalytics(manager)
+    users = [f"stats_user_{i}" for i in range(num_users)]
+    for user_id in users:
+        for t in range(threads_per_user):
+            manager.save_conversation(user_id, f"thread_{t}", [
+                {"role": random.choice(["user", "assistant"]), "content": random_string(200)}
+                for _ in range(messages_per_thread)])
+    analytics.refresh(full=True)
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        analytics.global_stats()
+    live_time = (time.perf_counter() - start) / runs
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        analytics.global_stats(materialized=True)
+    materialized_time = (time.perf_counter() - start) / runs
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        roles, characters = {}, 0
+        for user_id in users:
+            for thread_name in manager.list_user_threads(user_id):
+                for message in manager.get_conversation(user_id, thread_name):
+                    roles[message["role"]] = roles.get(message["role"], 0) + 1
+                    characters += len(message["content"])
+    client_time = (time.perf_counter() - start) / runs
+
+    manager.append_message(users[0], "thread_0", {"role": "user", "content": random_string(200)})
+    start = time.perf_counter()
+    analytics.refresh()
+    refresh_time = time.perf_counter() - start
+
+    manager._wipe_database()
+    analytics.stats.delete_many({})
+    manager.close()
+    return live_time, materialized_time, client_time, refresh_time
+
+
+def test_analytics_performance():
+    """Show what server-side aggregation saves over computing usage stats on the client."""
+    print("\n" + "=" * 80)
+    print("TEST 10: Usage Analytics (Aggregation Pipelines vs Client-Side Scan)")
+    print("=" * 80)
+    live_time, materialized_time, client_time, refresh_time = test_mongodb_analytics()
+    print(f"Live aggregation:         {live_time * 1000:8.3f}ms")
+    print(f"Materialized stats:       {materialized_time * 1000:8.3f}ms")
+    print(f"Fetch every conversation: {client_time * 1000:8.3f}ms")
+    print(f"Incremental refresh after one append: {refresh_time * 1000:8.3f}ms")
+    print(f"\n✓ Materialized stats answer {client_time / materialized_time:.0f}x faster than the client-side scan")
+    return live_time, materialized_time, client_time, refresh_time
+
+
 if __name__ == "__main__":
     print("=" * 80)
     print("PERFORMANCE COMPARISON: Flat Files vs MongoDB")
@@ -277,9 +794,14 @@ if __name__ == "__main__":
         print(f"\n--- Testing with {count} message pairs ---")
 
         flat_append, flat_read, flat_msg_count = test_flat_file_append_performance(count)
+        jsonl_append, jsonl_read, jsonl_msg_count = test_flat_file_jsonl_append_performance(count)
         mongo_append, mongo_read, mongo_msg_count = test_mongodb_append_performance(count)
+        batched_append, _, batched_msg_count = test_mongodb_batched_append_performance(count)
+        buffered_append, _, buffered_msg_count = test_mongodb_batched_append_performance(count, write_behind=True)
+        bucketed_append, bucketed_read, bucketed_msg_count = test_mongodb_append_performance(count, "bucketed")
 
         flat_avg = sum(flat_append) / len(flat_append)
+        jsonl_avg = sum(jsonl_append) / len(jsonl_append)
         mongo_avg = sum(mongo_append) / len(mongo_append)
 
         print(f"Flat File:")
@@ -289,6 +811,13 @@ if __name__ == "__main__":
         print(f"  - Full read:  {flat_read:.4f}s")
         print(f"  - Final msgs: {flat_msg_count}")
 
+        print(f"Flat File (JSONL append_message):")
+        print(f"  - Avg append: {jsonl_avg:.4f}s")
+        print(f"  - Min append: {min(jsonl_append):.4f}s")
+        print(f"  - Max append: {max(jsonl_append):.4f}s")
+        print(f"  - Full read:  {jsonl_read:.4f}s")
+        print(f"  - Final msgs: {jsonl_msg_count}")
+
         print(f"MongoDB:")
         print(f"  - Avg append: {mongo_avg:.4f}s")
         print(f"  - Min append: {min(mongo_append):.4f}s")
@@ -296,6 +825,20 @@ if __name__ == "__main__":
         print(f"  - Full read:  {mongo_read:.4f}s")
         print(f"  - Final msgs: {mongo_msg_count}")
 
+        print(f"MongoDB (append_messages, one round trip per turn):")
+        print(f"  - Avg append: {sum(batched_append) / len(batched_append):.4f}s")
+        print(f"  - Final msgs: {batched_msg_count}")
+
+        print(f"MongoDB (write-behind buffer):")
+        print(f"  - Avg append: {sum(buffered_append) / len(buffered_append):.4f}s")
+        print(f"  - Final msgs: {buffered_msg_count}")
+
+        print(f"MongoDB (bucketed layout):")
+        print(f"  - Avg append: {sum(bucketed_append) / len(bucketed_append):.4f}s")
+        print(f"  - Max append: {max(bucketed_append):.4f}s")
+        print(f"  - Full read:  {bucketed_read:.4f}s")
+        print(f"  - Final msgs: {bucketed_msg_count}")
+
         if flat_avg < mongo_avg:
             speedup = mongo_avg / flat_avg
             print(f"\n✓ Flat File is {speedup:.2f}x faster for incremental appends at {count} messages")
@@ -304,6 +847,7 @@ if __name__ == "__main__":
             print(f"\n✓ MongoDB is {speedup:.2f}x faster for incremental appends at {count} messages")
 
         results['flat_file'][f'append_{count}'] = flat_avg
+        results['flat_file'][f'jsonl_append_{count}'] = jsonl_avg
         results['mongodb'][f'append_{count}'] = mongo_avg
         results['flat_file'][f'read_{count}'] = flat_read
         results['mongodb'][f'read_{count}'] = mongo_read
@@ -319,6 +863,7 @@ if __name__ == "__main__":
 
         flat_write, flat_read, flat_count = test_flat_file_bulk_write(count)
         mongo_write, mongo_read, mongo_count = test_mongodb_bulk_write(count)
+        bucketed_write, bucketed_read, bucketed_count = test_mongodb_bulk_write(count, "bucketed")
 
         print(f"Flat File:")
         print(f"  - Bulk write: {flat_write:.4f}s")
@@ -330,6 +875,11 @@ if __name__ == "__main__":
         print(f"  - Full read:  {mongo_read:.4f}s")
         print(f"  - Messages:   {mongo_count}")
 
+        print(f"MongoDB (bucketed layout):")
+        print(f"  - Bulk write: {bucketed_write:.4f}s")
+        print(f"  - Full read:  {bucketed_read:.4f}s")
+        print(f"  - Messages:   {bucketed_count}")
+
         if flat_write < mongo_write:
             speedup = mongo_write / flat_write
             print(f"\n✓ Flat File is {speedup:.2f}x faster for bulk writes")
@@ -349,22 +899,33 @@ if __name__ == "__main__":
     for num_threads in [5, 10, 20]:
         print(f"\n--- Testing with {num_threads} threads, 50 messages each ---")
 
-        flat_create, flat_access = test_flat_file_multiple_threads(num_threads, 50)
-        mongo_create, mongo_access, mongo_list = test_mongodb_multiple_threads(num_threads, 50)
+        flat_create, flat_access, flat_sequential, flat_multi_get = test_flat_file_multiple_threads(num_threads, 50)
+        _, cached_access, _, _ = test_flat_file_multiple_threads(num_threads, 50, cache_entries=num_threads)
+        mongo_create, mongo_access, mongo_list, mongo_sequential, mongo_multi_get = \
+            test_mongodb_multiple_threads(num_threads, 50)
+        _, mongo_cached_access, _, _, _ = test_mongodb_multiple_threads(num_threads, 50, cache_entries=num_threads)
 
         flat_create_avg = sum(flat_create) / len(flat_create)
         mongo_create_avg = sum(mongo_create) / len(mongo_create)
         flat_access_avg = sum(flat_access) / len(flat_access)
+        cached_access_avg = sum(cached_access) / len(cached_access)
         mongo_access_avg = sum(mongo_access) / len(mongo_access)
+        mongo_cached_access_avg = sum(mongo_cached_access) / len(mongo_cached_access)
 
         print(f"Flat File:")
         print(f"  - Avg thread creation: {flat_create_avg:.4f}s")
         print(f"  - Avg random access:   {flat_access_avg:.4f}s")
+        print(f"  - With LRU cache:      {cached_access_avg:.4f}s")
+        print(f"  - Load all, one by one: {flat_sequential:.4f}s")
+        print(f"  - Load all, multi-get:  {flat_multi_get:.4f}s")
 
         print(f"MongoDB:")
         print(f"  - Avg thread creation: {mongo_create_avg:.4f}s")
         print(f"  - Avg random access:   {mongo_access_avg:.4f}s")
+        print(f"  - With version cache:  {mongo_cached_access_avg:.4f}s")
         print(f"  - List all threads:    {mongo_list:.4f}s")
+        print(f"  - Load all, one by one: {mongo_sequential:.4f}s")
+        print(f"  - Load all, multi-get:  {mongo_multi_get:.4f}s")
 
         if flat_access_avg < mongo_access_avg:
             speedup = mongo_access_avg / flat_access_avg
@@ -377,6 +938,22 @@ if __name__ == "__main__":
     flat_cold, mongo_cold = test_cold_start_performance()
     results['flat_file']['cold_start'] = flat_cold
     results['mongodb']['cold_start'] = mongo_cold
+    test_index_cold_start_scaling()
+
+    # TEST 6: Concurrency
+    test_async_concurrency_performance()
+
+    # TEST 7: Durability
+    test_durability_performance()
+
+    # TEST 8: Multi-process writers
+    test_multiprocess_performance()
+
+    # TEST 9: Full-text search
+    test_search_performance()
+
+    # TEST 10: Usage analytics
+    test_analytics_performance()
 
     # COMPREHENSIVE SUMMARY
     print("\n\n")
@@ -501,13 +1078,20 @@ if __name__ == "__main__":
     print("✓ No Network: Pure disk I/O avoids TCP/connection overhead")
     print()
     print("❌ Disadvantages:")
-    print("  • Incremental updates require full file rewrite (O(n) operation)")
-    print(f"  • Performance degrades as conversations grow ({flat_scaling:.2f}x slower at 100 msgs)")
-    print("  • No atomic operations (risk of corruption on crashes)")
-    print("  • No indexing or query capabilities")
+    jsonl_10 = results['flat_file']['jsonl_append_10']
+    jsonl_100 = results['flat_file']['jsonl_append_100']
+    print("  • Legacy .json conversations are rewritten in full on every update (O(n)),")
+    print(f"    so their appends degrade as conversations grow ({flat_scaling:.2f}x slower at 100 msgs);")
+    print(f"    JSONL appends only write the new line ({jsonl_10 * 1000:.2f}ms @ 10 msgs, "
+          f"{jsonl_100 * 1000:.2f}ms @ 100 msgs)")
+    print("  • Atomicity is per file: rewrites replace the file by rename and torn JSONL lines")
+    print("    are skipped, but there are no multi-conversation transactions, and fsync-backed")
+    print("    durable writes cost far more than acknowledged ones (TEST 7)")
+    print("  • No secondary indexes; full-text search needs the optional inverted index")
     print("  • File system limits (~10,000 files per directory)")
-    print("  • Concurrent access is problematic")
-    print("  • Will become significantly slower at 500+ messages")
+    print("  • Concurrent writers need multiprocess=True: fcntl locks per conversation, which")
+    print("    only work between processes on one host (TEST 8)")
+    print("  • Full reads still parse the whole file; long threads need limit= or get_messages_since()")
     print()
 
     print("=" * 80)